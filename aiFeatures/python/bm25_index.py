@@ -0,0 +1,236 @@
+"""
+BM25 lexical index for hybrid retrieval in the RAG pipeline.
+Postings are kept in compressed-sparse-row numpy arrays (one contiguous
+block of document rows and term frequencies per term) instead of Python
+dicts, so large corpora stay compact and scoring is vectorized.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+(?:[\^'.]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases text and splits it into word tokens, keeping forms like mc^2 or 3.14 intact."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk texts, addressed by docstore id.
+
+    Layout: ``offsets[t]:offsets[t + 1]`` slices ``post_rows`` (int32 row
+    numbers) and ``post_tf`` (float32 term frequencies) for term id ``t``;
+    ``doc_len`` holds the token count of each row. Adds and removals
+    replace the arrays instead of writing into them, so loaded arrays can
+    be read-only memory maps.
+    """
+
+    # Stores saved before the arrays were split into .npy files (which can be memory-mapped)
+    FILE_NAME = "bm25.npz"
+    ARRAY_FILE_NAME = "bm25_{}.npy"
+    ARRAY_NAMES = ("doc_len", "offsets", "post_rows", "post_tf")
+    VOCAB_FILE_NAME = "bm25_vocab.json"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.post_rows = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.float32)
+        # Bumped on every add or remove so callers can cache per-row data
+        self.version = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def _triplets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Expands the CSR postings into parallel (term, row, tf) arrays."""
+        term_of_posting = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets))
+        return term_of_posting, self.post_rows.astype(np.int64), self.post_tf
+
+    def _rebuild(self, terms: np.ndarray, rows: np.ndarray, tfs: np.ndarray) -> None:
+        """Rebuilds the CSR arrays from (term, row, tf) triplets (caller holds the lock)."""
+        order = np.lexsort((rows, terms))
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        counts = np.bincount(terms, minlength=len(self.terms)) if len(terms) else np.zeros(len(self.terms), dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.post_rows = rows.astype(np.int32)
+        self.post_tf = tfs.astype(np.float32)
+
+    def add(self, doc_ids: List[str], texts: List[str]) -> None:
+        """
+        Indexes new chunks.
+
+        Args:
+            doc_ids: Docstore ids of the chunks
+            texts: Chunk texts aligned with doc_ids
+        """
+        if not doc_ids:
+            return
+        with self._lock:
+            new_terms, new_rows, new_tfs, new_lengths = [], [], [], []
+            for offset, text in enumerate(texts):
+                row = len(self.doc_ids) + offset
+                tokens = tokenize(text)
+                new_lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    term_id = self.terms.setdefault(term, len(self.terms))
+                    new_terms.append(term_id)
+                    new_rows.append(row)
+                    new_tfs.append(tf)
+
+            old_terms, old_rows, old_tfs = self._triplets()
+            self.version += 1
+            self.doc_ids.extend(doc_ids)
+            self.doc_len = np.concatenate((self.doc_len, np.asarray(new_lengths, dtype=np.int32)))
+            self._rebuild(
+                np.concatenate((old_terms, np.asarray(new_terms, dtype=np.int64))),
+                np.concatenate((old_rows, np.asarray(new_rows, dtype=np.int64))),
+                np.concatenate((old_tfs, np.asarray(new_tfs, dtype=np.float32)))
+            )
+
+    def remove(self, doc_ids: List[str]) -> None:
+        """Removes chunks by docstore id and compacts the postings."""
+        doomed = set(doc_ids)
+        with self._lock:
+            keep = np.array([doc_id not in doomed for doc_id in self.doc_ids], dtype=bool)
+            if keep.all():
+                return
+            new_row_of = np.cumsum(keep) - 1
+            terms, rows, tfs = self._triplets()
+            self.version += 1
+            alive = keep[rows]
+            self.doc_ids = [doc_id for doc_id, kept in zip(self.doc_ids, keep) if kept]
+            self.doc_len = self.doc_len[keep]
+            self._rebuild(terms[alive], new_row_of[rows[alive]], tfs[alive])
+
+    def search(self, query: str, k: int = 10, row_mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Scores chunks against the query with BM25.
+
+        Args:
+            query: Search query
+            k: Number of results to return
+            row_mask: Optional boolean mask over rows (in doc_ids order); only
+                rows set in it can be returned
+
+        Returns:
+            List of (docstore id, BM25 score) pairs, best first
+        """
+        with self._lock:
+            num_docs = len(self.doc_ids)
+            term_ids = {self.terms[t] for t in tokenize(query) if t in self.terms}
+            if not num_docs or not term_ids:
+                return []
+
+            avg_len = float(self.doc_len.mean()) or 1.0
+            scores = np.zeros(num_docs, dtype=np.float32)
+            for term_id in term_ids:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                if start == end:
+                    continue
+                rows = self.post_rows[start:end]
+                tf = self.post_tf[start:end]
+                df = end - start
+                idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[rows] / avg_len)
+                # Each row appears once per term, so fancy-index addition is safe
+                scores[rows] += idf * tf * (self.k1 + 1) / norm
+
+            if row_mask is not None:
+                scores[~row_mask] = 0
+            k = min(k, num_docs)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.doc_ids[row], float(scores[row])) for row in top if scores[row] > 0]
+
+    def max_score(self, query: str) -> float:
+        """
+        Upper bound of the BM25 score of any chunk for the query.
+
+        Each query term contributes at most idf * (k1 + 1), reached as its
+        term frequency grows; terms the index lacks count with the IDF of a
+        term in no chunk. Scores divided by this bound are comparable
+        between indexes whose IDF and average length statistics differ.
+
+        Returns:
+            The bound, or 0.0 for a query without tokens
+        """
+        with self._lock:
+            num_docs = len(self.doc_ids)
+            df = np.asarray([self.offsets[self.terms[t] + 1] - self.offsets[self.terms[t]] if t in self.terms else 0
+                             for t in set(tokenize(query))], dtype=np.float64)
+            return float((np.log1p((num_docs - df + 0.5) / (df + 0.5)) * (self.k1 + 1)).sum())
+
+    def save(self, index_dir: str) -> None:
+        """Writes the index arrays and vocabulary into index_dir."""
+        with self._lock:
+            for name in self.ARRAY_NAMES:
+                np.save(os.path.join(index_dir, self.ARRAY_FILE_NAME.format(name)), getattr(self, name))
+            vocabulary = [None] * len(self.terms)
+            for term, term_id in self.terms.items():
+                vocabulary[term_id] = term
+            with open(os.path.join(index_dir, self.VOCAB_FILE_NAME), "w", encoding="utf-8") as f:
+                json.dump({"k1": self.k1, "b": self.b, "terms": vocabulary, "doc_ids": self.doc_ids}, f)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = False) -> Optional["BM25Index"]:
+        """
+        Loads an index saved in index_dir, or returns None if there is none.
+
+        Args:
+            index_dir: Directory of the saved store
+            mmap: Whether to memory-map the postings instead of reading them
+        """
+        vocab_path = os.path.join(index_dir, cls.VOCAB_FILE_NAME)
+        if not os.path.isfile(vocab_path):
+            return None
+        with open(vocab_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        index = cls(k1=saved["k1"], b=saved["b"])
+        index.terms = {term: term_id for term_id, term in enumerate(saved["terms"])}
+        index.doc_ids = saved["doc_ids"]
+        legacy_path = os.path.join(index_dir, cls.FILE_NAME)
+        if os.path.isfile(legacy_path):
+            with np.load(legacy_path) as arrays:
+                for name in cls.ARRAY_NAMES:
+                    setattr(index, name, arrays[name])
+            return index
+        for name in cls.ARRAY_NAMES:
+            setattr(index, name, np.load(os.path.join(index_dir, cls.ARRAY_FILE_NAME.format(name)),
+                                         mmap_mode="r" if mmap else None))
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Merges several ranked lists of ids with reciprocal rank fusion.
+
+    Args:
+        rankings: Ranked id lists, best first
+        k: RRF damping constant
+
+    Returns:
+        List of (id, fused score) pairs, best first
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
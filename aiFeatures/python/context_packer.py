@@ -0,0 +1,161 @@
+"""
+Token-budgeted context packing for the RAG pipeline.
+Retrieved hits are merged where they overlap on the same page, passages the
+context already covers are dropped, and the rest are added best-first until
+the prompt's token budget is full, so prompt size no longer grows with k.
+"""
+
+import os
+import re
+import math
+import logging
+from typing import Dict, List, Set, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Tokens of retrieved and web context sent to the LLM with each question
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))
+# Hits retrieved per question before packing
+RAG_CONTEXT_CANDIDATES = int(os.getenv("RAG_CONTEXT_CANDIDATES", "8"))
+# Share of a passage's word shingles already in the context above which it is dropped
+RAG_CONTEXT_REDUNDANCY = float(os.getenv("RAG_CONTEXT_REDUNDANCY", "0.8"))
+
+# Rough size of the text Gemini and similar tokenizers encode as one token
+CHARS_PER_TOKEN = 4
+# Tokens taken by a hit's "Result n" and location lines
+HIT_OVERHEAD_TOKENS = 24
+# Smallest leftover budget worth filling with a truncated passage
+MIN_PARTIAL_TOKENS = 64
+# Appended to passages cut short by truncate_to_tokens
+TRUNCATION_MARKER = " ..."
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximates the LLM token count of a text without a tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts text to about max_tokens, ending at a sentence or word boundary.
+
+    Args:
+        text: Text to shorten
+        max_tokens: Token budget
+
+    Returns:
+        The text itself if it fits, otherwise a prefix ending in TRUNCATION_MARKER
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    cut = text[:(max_tokens - 1) * CHARS_PER_TOKEN]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary < len(cut) // 2:
+        boundary = cut.rfind(" ")
+    if boundary > 0:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+def merge_adjacent(hits: List[Dict]) -> List[Dict]:
+    """
+    Merges hits whose character ranges overlap or touch on the same page
+    (of the same index, for federated hits).
+
+    Consecutive chunks share chunk_overlap characters, so merging them sends
+    that text once. Hits without offsets are kept as they are.
+
+    Args:
+        hits: Hit dicts from retrieve_hits
+
+    Returns:
+        Merged hits, best score first; a merged hit keeps the best score of its parts
+    """
+    merged = [hit for hit in hits if hit.get("start") is None]
+    pages: Dict[Tuple, List[Dict]] = {}
+    for hit in hits:
+        if hit.get("start") is not None:
+            pages.setdefault((hit.get("index"), hit["file_name"], hit["page"]), []).append(hit)
+
+    for page_hits in pages.values():
+        page_hits.sort(key=lambda hit: hit["start"])
+        current = dict(page_hits[0])
+        for hit in page_hits[1:]:
+            # One character of slack covers the separator the splitter drops between chunks
+            if hit["start"] > current["end"] + 1:
+                merged.append(current)
+                current = dict(hit)
+                continue
+            if hit["end"] > current["end"]:
+                overlap = current["end"] - hit["start"]
+                joiner = " " if overlap < 0 else ""
+                current["content"] += joiner + hit["content"][max(0, overlap):]
+                current["end"] = hit["end"]
+            current["score"] = max(current["score"], hit["score"])
+            current["also_in"] = current["also_in"] + [ref for ref in hit["also_in"]
+                                                       if ref not in current["also_in"]]
+        merged.append(current)
+
+    merged.sort(key=lambda hit: hit["score"], reverse=True)
+    return merged
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = _WORD_PATTERN.findall(text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def pack_context(hits: List[Dict], max_tokens: int = RAG_CONTEXT_TOKENS,
+                 redundancy: float = RAG_CONTEXT_REDUNDANCY) -> Tuple[List[Dict], int]:
+    """
+    Selects hits for the prompt within a token budget.
+
+    Hits are merged with merge_adjacent, then taken best score first. A hit
+    whose word shingles are mostly in the context already is skipped, and a
+    hit too large for the remaining budget is skipped in favour of smaller
+    ones, or truncated if it would be the last to fit.
+
+    Args:
+        hits: Hit dicts from retrieve_hits
+        max_tokens: Token budget for the packed hits
+        redundancy: Shingle overlap share at which a hit counts as redundant
+
+    Returns:
+        (packed hits best first, estimated tokens used)
+    """
+    packed: List[Dict] = []
+    seen: Set[Tuple[str, ...]] = set()
+    used = 0
+    redundant = 0
+
+    for hit in merge_adjacent(hits):
+        shingles = _shingles(hit["content"])
+        if packed and len(shingles & seen) >= redundancy * len(shingles):
+            redundant += 1
+            continue
+
+        remaining = max_tokens - used - HIT_OVERHEAD_TOKENS
+        tokens = estimate_tokens(hit["content"])
+        if tokens > remaining:
+            if remaining < MIN_PARTIAL_TOKENS:
+                continue
+            content = truncate_to_tokens(hit["content"], remaining)
+            hit = dict(hit, content=content, truncated=True)
+            if hit["start"] is not None:
+                # The range covers the kept prefix of the page text, not the marker
+                kept = len(content) - len(TRUNCATION_MARKER) if content.endswith(TRUNCATION_MARKER) else len(content)
+                hit["end"] = hit["start"] + kept
+            tokens = estimate_tokens(content)
+
+        packed.append(hit)
+        seen |= shingles
+        used += tokens + HIT_OVERHEAD_TOKENS
+
+    logger.info(f"Packed {len(packed)} of {len(hits)} hits into {used}/{max_tokens} tokens "
+                f"({redundant} redundant)")
+    return packed, used
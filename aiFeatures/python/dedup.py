@@ -0,0 +1,196 @@
+"""
+Duplicate chunk detection for the RAG pipeline.
+Exact duplicates are caught by a hash of the whitespace-normalized text and
+near-duplicates by MinHash signatures with locality-sensitive hashing, so
+repeated slides, headers and reused sections are embedded only once.
+"""
+
+import os
+import re
+import zlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_cache import text_key
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# "near" drops exact and near-duplicate chunks, "exact" only identical ones, "off" keeps all
+RAG_DEDUP = os.getenv("RAG_DEDUP", "near")
+# Estimated Jaccard similarity of word shingles above which a chunk counts as a near-duplicate
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.9"))
+
+# Metadata key listing the (file, page) metadata of the duplicates a chunk stands for
+DUPLICATE_REFS_KEY = "duplicate_refs"
+
+# References are page locations, so a chunk's own offsets are not copied into them
+_NON_LOCATION_KEYS = (DUPLICATE_REFS_KEY, "start_index", "end_page_index")
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class ChunkDeduplicator:
+    """
+    Streaming duplicate detector over chunk texts.
+
+    Chunks are fed in order with ``check``; the first copy of a text becomes
+    a survivor and later copies are reported as duplicates of it. MinHash
+    signatures are split into bands and each band is bucketed, so a new
+    chunk is only compared against survivors sharing at least one band.
+    """
+
+    def __init__(self, mode: str = RAG_DEDUP, threshold: float = RAG_DEDUP_THRESHOLD,
+                 num_perm: int = 64, bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.mode = mode
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.duplicates = 0
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._exact: Dict[str, int] = {}
+        self._buckets: Dict[Tuple[int, bytes], int] = {}
+        self._signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self._count = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("exact", "near")
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of the text's word shingles."""
+        words = _WORD_PATTERN.findall(text.lower())
+        size = self.shingle_size
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        # Universal hashing (a * x + b) mod p; a, b, x < 2^32 so the product fits in 64 bits
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _register(self, signature: Optional[np.ndarray]) -> int:
+        """Records a new survivor and returns its sequence number."""
+        survivor = self._count
+        self._count += 1
+        if signature is not None:
+            if survivor >= len(self._signatures):
+                grown = np.zeros((max(1024, 2 * len(self._signatures)), self.num_perm), dtype=np.uint32)
+                grown[:len(self._signatures)] = self._signatures
+                self._signatures = grown
+            self._signatures[survivor] = signature
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets.setdefault((band, key), survivor)
+        return survivor
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        rows = self.num_perm // self.bands
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def check(self, text: str) -> Optional[int]:
+        """
+        Looks a chunk up against the survivors seen so far.
+
+        Args:
+            text: Chunk text
+
+        Returns:
+            Sequence number of the survivor it duplicates, or None if the
+            chunk is new (it is then registered as the next survivor)
+        """
+        if not self.enabled:
+            self._count += 1
+            return None
+
+        key = text_key(text)
+        survivor = self._exact.get(key)
+        if survivor is not None:
+            self.duplicates += 1
+            return survivor
+
+        signature = None
+        if self.mode == "near":
+            signature = self.signature(text)
+            candidates = {self._buckets[(band, band_key)]
+                          for band, band_key in enumerate(self._band_keys(signature))
+                          if (band, band_key) in self._buckets}
+            for candidate in sorted(candidates):
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold:
+                    self.duplicates += 1
+                    return candidate
+
+        survivor = self._register(signature)
+        self._exact[key] = survivor
+        return None
+
+    def register(self, text: str) -> int:
+        """
+        Records an already indexed chunk as the next survivor without looking it up.
+
+        Used to carry on deduplicating into a store that was partly built
+        earlier: its chunks are registered in row order, so their sequence
+        numbers line up with the store's rows.
+
+        Returns:
+            Sequence number of the chunk
+        """
+        if not self.enabled:
+            self._count += 1
+            return self._count - 1
+        signature = self.signature(text) if self.mode == "near" else None
+        survivor = self._register(signature)
+        self._exact.setdefault(text_key(text), survivor)
+        return survivor
+
+
+def add_duplicate_ref(metadata: Dict, duplicate_metadata: Dict) -> Dict:
+    """Returns a copy of a survivor's metadata with one more duplicate (file, page) reference."""
+    ref = {key: value for key, value in duplicate_metadata.items() if key not in _NON_LOCATION_KEYS}
+    own = {key: value for key, value in metadata.items() if key not in _NON_LOCATION_KEYS}
+    refs = list(metadata.get(DUPLICATE_REFS_KEY, []))
+    if ref == own or ref in refs:
+        return metadata
+    updated = dict(metadata)
+    updated[DUPLICATE_REFS_KEY] = refs + [ref]
+    return updated
+
+
+def deduplicate_chunks(documents: List[str], metadata_list: List[Dict],
+                       mode: str = RAG_DEDUP) -> Tuple[List[str], List[Dict]]:
+    """
+    Drops duplicate chunks, recording each one on the chunk that survives.
+
+    Args:
+        documents: Chunk texts
+        metadata_list: Metadata aligned with documents
+        mode: "near", "exact" or "off"
+
+    Returns:
+        Surviving chunk texts and their metadata, in input order
+    """
+    deduplicator = ChunkDeduplicator(mode=mode)
+    if not deduplicator.enabled:
+        return documents, metadata_list
+
+    kept_documents: List[str] = []
+    kept_metadata: List[Dict] = []
+    for text, metadata in zip(documents, metadata_list):
+        survivor = deduplicator.check(text)
+        if survivor is None:
+            kept_documents.append(text)
+            kept_metadata.append(metadata)
+        else:
+            kept_metadata[survivor] = add_duplicate_ref(kept_metadata[survivor], metadata)
+
+    if len(kept_documents) < len(documents):
+        logger.info(f"Dropped {len(documents) - len(kept_documents)} duplicate chunks of {len(documents)}")
+    return kept_documents, kept_metadata
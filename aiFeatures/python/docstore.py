@@ -0,0 +1,581 @@
+"""
+Memory-mapped chunk docstore for the RAG pipeline.
+Chunk texts are stored back to back in one file addressed by an offset
+table, and metadata is kept as interned, columnar integer codes, so a large
+corpus costs a few bytes of RAM per chunk instead of a Python dict each.
+Texts can be compressed in blocks of adjacent chunks; a block is only
+decompressed when one of its chunks is read, and recent blocks are cached.
+"""
+
+import os
+import json
+import uuid
+import zlib
+import bisect
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# "mmap" stores chunks in MmapDocstore; "memory" keeps LangChain's InMemoryDocstore
+RAG_DOCSTORE = os.getenv("RAG_DOCSTORE", "mmap")
+# Codec for chunk text blocks: "zstd" (needs the zstandard package), "zlib" or "none"
+RAG_DOCSTORE_COMPRESSION = os.getenv("RAG_DOCSTORE_COMPRESSION", "zstd" if ZSTD_AVAILABLE else "zlib")
+# Adjacent chunk texts are compressed together in blocks of about this many bytes
+RAG_DOCSTORE_BLOCK_BYTES = int(os.getenv("RAG_DOCSTORE_BLOCK_BYTES", "16384"))
+# Decompressed blocks kept in memory per docstore
+RAG_DOCSTORE_BLOCK_CACHE = int(os.getenv("RAG_DOCSTORE_BLOCK_CACHE", "32"))
+
+_MISSING = -1
+
+
+def _value_key(value: Any):
+    """Hashable identity of a metadata value, so 1, 1.0 and True are interned separately."""
+    try:
+        hash(value)
+        return type(value).__name__, value
+    except TypeError:
+        return "json", json.dumps(value, sort_keys=True)
+
+
+def _codec(name: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """Returns the (compress, decompress) functions of a text block codec."""
+    if name == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    if name == "zlib":
+        return lambda data: zlib.compress(data, 6), zlib.decompress
+    raise ValueError(f"Unknown docstore compression {name!r}")
+
+
+class _BlockWriter:
+    """
+    Appends chunk texts to a file as compressed blocks of adjacent rows.
+
+    Texts collect in an uncompressed pending block until it reaches
+    block_bytes; it is then compressed and appended to the file. Block i
+    holds rows block_rows[i]:block_rows[i + 1] and its compressed bytes
+    are file[block_offsets[i]:block_offsets[i + 1]].
+    """
+
+    def __init__(self, path: str, codec: str, block_bytes: int = RAG_DOCSTORE_BLOCK_BYTES):
+        self.path = path
+        self.compress, _ = _codec(codec)
+        self.block_bytes = max(1, block_bytes)
+        self.pending = bytearray()
+        self.first_pending_row = 0
+        self.rows = 0
+        self.block_rows = array("q")
+        self.block_offsets = array("q", [0])
+
+    @property
+    def size(self) -> int:
+        """Bytes written to the file so far."""
+        return self.block_offsets[-1]
+
+    def add(self, text: bytes) -> None:
+        self.pending += text
+        self.rows += 1
+        if len(self.pending) >= self.block_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        """Compresses and writes the pending block, if any."""
+        if not self.pending:
+            return
+        compressed = self.compress(bytes(self.pending))
+        with open(self.path, "ab") as f:
+            f.write(compressed)
+        self.block_rows.append(self.first_pending_row)
+        self.block_offsets.append(self.size + len(compressed))
+        self.first_pending_row = self.rows
+        self.pending = bytearray()
+
+
+class MmapDocstore(Docstore, AddableMixin):
+    """
+    Docstore whose chunk texts live in memory-mapped files.
+
+    Rows come from two segments. The base segment is a saved store opened
+    read-only: its text, offsets, ids and metadata codes are memory-mapped,
+    so opening it reads nothing up front. Rows added afterwards form the
+    tail segment, appended to a private file in work_dir. Deletions are
+    tombstones until the store is saved, which compacts the live rows.
+
+    With compression, each segment's text file is a run of compressed
+    blocks of adjacent rows (see _BlockWriter) and the offset table still
+    holds uncompressed offsets. Reading a chunk decompresses only its
+    block, and the last block_cache blocks read are kept decompressed, so
+    a search touches a handful of blocks however large the corpus is.
+
+    Metadata values must be JSON-serializable. Every distinct value is stored
+    once and rows refer to it by an int32 code per metadata key.
+    """
+
+    TEXT_FILE_NAME = "docstore_text.bin"
+    OFFSETS_FILE_NAME = "docstore_offsets.npy"
+    IDS_FILE_NAME = "docstore_ids.npy"
+    SORTED_IDS_FILE_NAME = "docstore_sorted_ids.npy"
+    SORTED_ROWS_FILE_NAME = "docstore_sorted_rows.npy"
+    CODES_FILE_NAME = "docstore_meta_codes.npy"
+    BLOCK_ROWS_FILE_NAME = "docstore_block_rows.npy"
+    BLOCK_OFFSETS_FILE_NAME = "docstore_block_offsets.npy"
+    META_FILE_NAME = "docstore_meta.json"
+
+    def __init__(self, work_dir: str, compression: str = RAG_DOCSTORE_COMPRESSION,
+                 block_cache: int = RAG_DOCSTORE_BLOCK_CACHE):
+        self.work_dir = work_dir
+        self.compression = compression
+        # Decompress function per codec; codec objects are only used under the lock
+        self._decompressors: Dict[str, Callable[[bytes], bytes]] = {}
+        if compression != "none":
+            self._decompressors[compression] = _codec(compression)[1]
+        self._lock = threading.RLock()
+
+        # Base segment (read-only memory maps of a saved store)
+        self._base_rows = 0
+        self._base_text: Optional[np.ndarray] = None
+        self._base_offsets: Optional[np.ndarray] = None
+        self._base_ids: Optional[np.ndarray] = None
+        self._sorted_ids: Optional[np.ndarray] = None
+        self._sorted_rows: Optional[np.ndarray] = None
+        self._base_codes: Optional[np.ndarray] = None
+        # Blocks of the base text, if it was saved compressed
+        self._base_compression = "none"
+        self._base_block_rows: Optional[np.ndarray] = None
+        self._base_block_offsets: Optional[np.ndarray] = None
+
+        # Tail segment (rows added since, appended to a private file)
+        self._tail_path: Optional[str] = None
+        self._tail_size = 0
+        self._tail_mmap: Optional[np.ndarray] = None
+        self._tail_writer: Optional[_BlockWriter] = None
+        self._tail_offsets = array("q", [0])
+        self._tail_ids: List[str] = []
+        self._tail_row_of: Dict[str, int] = {}
+        self._tail_codes: List[array] = []
+
+        self._deleted = set()
+        # Full code lists of base rows whose metadata changed since load
+        self._overrides: Dict[int, List[int]] = {}
+
+        # Interned metadata
+        self._keys: List[str] = []
+        self._key_pos: Dict[str, int] = {}
+        self._values: List[Any] = []
+        self._value_code: Dict[Any, int] = {}
+
+        # Decompressed text blocks, keyed by (segment, block), least recently used first
+        self._blocks: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.block_cache = max(1, block_cache)
+        self.blocks_decompressed = 0
+
+    @classmethod
+    def load(cls, index_dir: str, work_dir: str) -> Optional["MmapDocstore"]:
+        """Opens a docstore saved in index_dir, or returns None if there is none."""
+        meta_path = os.path.join(index_dir, cls.META_FILE_NAME)
+        if not os.path.isfile(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+
+        store = cls(work_dir)
+        store._base_rows = saved["rows"]
+        store._keys = saved["keys"]
+        store._key_pos = {key: pos for pos, key in enumerate(store._keys)}
+        store._values = saved["values"]
+        store._value_code = {_value_key(value): code for code, value in enumerate(store._values)}
+        store._tail_codes = [array("i") for _ in store._keys]
+
+        def open_array(name: str) -> np.ndarray:
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        store._base_offsets = open_array(cls.OFFSETS_FILE_NAME)
+        store._base_ids = open_array(cls.IDS_FILE_NAME)
+        store._sorted_ids = open_array(cls.SORTED_IDS_FILE_NAME)
+        store._sorted_rows = open_array(cls.SORTED_ROWS_FILE_NAME)
+        store._base_codes = open_array(cls.CODES_FILE_NAME)
+        # Stores saved before compression was added have no "compression" entry
+        store._base_compression = saved.get("compression", "none")
+        if store._base_compression != "none":
+            store._decompressors.setdefault(store._base_compression, _codec(store._base_compression)[1])
+            store._base_block_rows = open_array(cls.BLOCK_ROWS_FILE_NAME)
+            store._base_block_offsets = open_array(cls.BLOCK_OFFSETS_FILE_NAME)
+        text_path = os.path.join(index_dir, cls.TEXT_FILE_NAME)
+        if os.path.getsize(text_path):
+            store._base_text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        return store
+
+    def __len__(self) -> int:
+        return self._base_rows + len(self._tail_ids) - len(self._deleted)
+
+    def __del__(self):
+        try:
+            if self._tail_path and os.path.isfile(self._tail_path):
+                self._tail_mmap = None
+                os.remove(self._tail_path)
+        except Exception:
+            pass
+
+    @property
+    def num_rows(self) -> int:
+        """Rows written so far, including deleted ones."""
+        return self._base_rows + len(self._tail_ids)
+
+    def _intern(self, metadata: Dict) -> List[int]:
+        """Returns one code per known key for a metadata dict, registering new keys and values."""
+        for key in metadata:
+            if key not in self._key_pos:
+                self._key_pos[key] = len(self._keys)
+                self._keys.append(key)
+                self._tail_codes.append(array("i", [_MISSING]) * len(self._tail_ids))
+        codes = [_MISSING] * len(self._keys)
+        for key, value in metadata.items():
+            value_key = _value_key(value)
+            code = self._value_code.get(value_key)
+            if code is None:
+                code = self._value_code[value_key] = len(self._values)
+                self._values.append(value)
+            codes[self._key_pos[key]] = code
+        return codes
+
+    def _row_of(self, doc_id: str) -> Optional[int]:
+        """Looks up the row of a live document id (caller holds the lock)."""
+        row = self._tail_row_of.get(doc_id)
+        if row is None and self._base_rows:
+            encoded = doc_id.encode("utf-8")
+            pos = int(np.searchsorted(self._sorted_ids, encoded))
+            if pos < self._base_rows and self._sorted_ids[pos] == encoded:
+                row = int(self._sorted_rows[pos])
+        if row is None or row in self._deleted:
+            return None
+        return row
+
+    def _tail_text(self) -> np.ndarray:
+        """Memory map over the tail text written so far (caller holds the lock)."""
+        if self._tail_mmap is None or self._tail_mmap.shape[0] != self._tail_size:
+            self._tail_mmap = np.memmap(self._tail_path, dtype=np.uint8, mode="r", shape=(self._tail_size,))
+        return self._tail_mmap
+
+    def _block(self, segment: str, block: int) -> bytes:
+        """Decompressed text of one block, through the block cache (caller holds the lock)."""
+        key = (segment, block)
+        data = self._blocks.get(key)
+        if data is not None:
+            self._blocks.move_to_end(key)
+            return data
+        if segment == "base":
+            compression, text = self._base_compression, self._base_text
+            start, end = int(self._base_block_offsets[block]), int(self._base_block_offsets[block + 1])
+        else:
+            compression, text = self.compression, self._tail_text()
+            start, end = self._tail_writer.block_offsets[block], self._tail_writer.block_offsets[block + 1]
+        data = self._decompressors[compression](text[start:end].tobytes())
+        self.blocks_decompressed += 1
+        self._blocks[key] = data
+        if len(self._blocks) > self.block_cache:
+            self._blocks.popitem(last=False)
+        return data
+
+    def _text_bytes(self, row: int) -> memoryview:
+        """View of a row's UTF-8 text, zero-copy unless its block is compressed (caller holds the lock)."""
+        if row < self._base_rows:
+            start, end = int(self._base_offsets[row]), int(self._base_offsets[row + 1])
+            if start == end:
+                return memoryview(b"")
+            if self._base_compression == "none":
+                return memoryview(self._base_text)[start:end]
+            block = int(np.searchsorted(self._base_block_rows, row, side="right")) - 1
+            block_start = int(self._base_offsets[self._base_block_rows[block]])
+            return memoryview(self._block("base", block))[start - block_start:end - block_start]
+
+        tail_row = row - self._base_rows
+        start, end = self._tail_offsets[tail_row], self._tail_offsets[tail_row + 1]
+        if start == end:
+            return memoryview(b"")
+        writer = self._tail_writer
+        if writer is None:
+            return memoryview(self._tail_text())[start:end]
+        if tail_row >= writer.first_pending_row:
+            # Rows of the block still being filled are read straight from its buffer
+            block_start = self._tail_offsets[writer.first_pending_row]
+            return memoryview(bytes(writer.pending[start - block_start:end - block_start]))
+        block = bisect.bisect_right(writer.block_rows, tail_row) - 1
+        block_start = self._tail_offsets[writer.block_rows[block]]
+        return memoryview(self._block("tail", block))[start - block_start:end - block_start]
+
+    def _metadata(self, row: int) -> Dict:
+        """Rebuilds a row's metadata dict from its codes (caller holds the lock)."""
+        metadata = {}
+        if row in self._overrides:
+            for key, code in zip(self._keys, self._overrides[row]):
+                if code != _MISSING:
+                    metadata[key] = self._values[code]
+        elif row < self._base_rows:
+            codes = self._base_codes[row] if self._base_codes.shape[1] else ()
+            for key, code in zip(self._keys, codes):
+                if code != _MISSING:
+                    metadata[key] = self._values[code]
+        else:
+            tail_row = row - self._base_rows
+            for key, column in zip(self._keys, self._tail_codes):
+                code = column[tail_row]
+                if code != _MISSING:
+                    metadata[key] = self._values[code]
+        return metadata
+
+    def _doc_id(self, row: int) -> str:
+        if row < self._base_rows:
+            return self._base_ids[row].decode("utf-8")
+        return self._tail_ids[row - self._base_rows]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """
+        Appends documents to the tail segment.
+
+        Args:
+            texts: Mapping of document id to Document
+        """
+        with self._lock:
+            overlapping = {doc_id for doc_id in texts if self._row_of(doc_id) is not None}
+            if overlapping:
+                raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+            if self._tail_path is None:
+                os.makedirs(self.work_dir, exist_ok=True)
+                self._tail_path = os.path.join(self.work_dir, f"{uuid.uuid4().hex}.docstore")
+                open(self._tail_path, "wb").close()
+                if self.compression != "none":
+                    self._tail_writer = _BlockWriter(self._tail_path, self.compression)
+
+            encoded_texts = [doc.page_content.encode("utf-8") for doc in texts.values()]
+            if self._tail_writer is not None:
+                for encoded in encoded_texts:
+                    self._tail_writer.add(encoded)
+                self._tail_size = self._tail_writer.size
+            else:
+                with open(self._tail_path, "ab") as f:
+                    f.writelines(encoded_texts)
+                self._tail_size += sum(len(encoded) for encoded in encoded_texts)
+
+            for (doc_id, doc), encoded in zip(texts.items(), encoded_texts):
+                self._tail_offsets.append(self._tail_offsets[-1] + len(encoded))
+                codes = self._intern(doc.metadata or {})
+                for column, code in zip(self._tail_codes, codes):
+                    column.append(code)
+                self._tail_row_of[doc_id] = self.num_rows
+                self._tail_ids.append(doc_id)
+
+    def update_metadata(self, doc_id: str, metadata: Dict) -> bool:
+        """
+        Replaces the metadata of a document; its text and row are unchanged.
+
+        Args:
+            doc_id: Id of the document
+            metadata: New metadata dict
+
+        Returns:
+            True if the document exists
+        """
+        with self._lock:
+            row = self._row_of(doc_id)
+            if row is None:
+                return False
+            codes = self._intern(metadata)
+            if row < self._base_rows:
+                self._overrides[row] = codes
+            else:
+                tail_row = row - self._base_rows
+                for column, code in zip(self._tail_codes, codes):
+                    column[tail_row] = code
+            return True
+
+    def delete(self, ids: List) -> None:
+        """Marks documents as deleted; their rows are dropped when the store is saved."""
+        with self._lock:
+            rows = [self._row_of(doc_id) for doc_id in ids]
+            if all(row is None for row in rows):
+                raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+            for doc_id, row in zip(ids, rows):
+                if row is not None:
+                    self._deleted.add(row)
+                    self._tail_row_of.pop(doc_id, None)
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Looks a document up by id.
+
+        Args:
+            search: Id of the document
+
+        Returns:
+            Document if found, else an error message (as InMemoryDocstore does)
+        """
+        with self._lock:
+            row = self._row_of(search)
+            if row is None:
+                return f"ID {search} not found."
+            return Document(
+                page_content=str(self._text_bytes(row), "utf-8"),
+                metadata=self._metadata(row),
+                id=search
+            )
+
+    def ids_where(self, key: str, value: Any) -> List[str]:
+        """
+        Returns the ids of live documents whose metadata has key == value.
+
+        Scans the int32 code column only; no text or metadata dicts are built.
+        """
+        with self._lock:
+            pos = self._key_pos.get(key)
+            code = self._value_code.get(_value_key(value))
+            if pos is None or code is None:
+                return []
+            return self._ids_matching(pos, lambda column: column == code)
+
+    def ids_with_key(self, key: str) -> List[str]:
+        """Returns the ids of live documents whose metadata has the given key."""
+        with self._lock:
+            pos = self._key_pos.get(key)
+            if pos is None:
+                return []
+            return self._ids_matching(pos, lambda column: column != _MISSING)
+
+    def _ids_matching(self, pos: int, predicate) -> List[str]:
+        """Ids of live rows whose code in column pos satisfies predicate (caller holds the lock)."""
+        rows = []
+        if self._base_rows and pos < self._base_codes.shape[1]:
+            rows.extend(row for row in np.flatnonzero(predicate(self._base_codes[:, pos])).tolist()
+                        if row not in self._overrides)
+        if self._tail_ids:
+            tail = np.frombuffer(self._tail_codes[pos], dtype=np.int32)
+            rows.extend((np.flatnonzero(predicate(tail)) + self._base_rows).tolist())
+        for row, codes in self._overrides.items():
+            code = codes[pos] if pos < len(codes) else _MISSING
+            if predicate(np.asarray([code], dtype=np.int32))[0]:
+                rows.append(row)
+        return [self._doc_id(row) for row in sorted(rows) if row not in self._deleted]
+
+    def rows_of(self, ids: List[str]) -> np.ndarray:
+        """Returns the row of each id (-1 for unknown or deleted ids)."""
+        with self._lock:
+            rows = np.full(len(ids), -1, dtype=np.int64)
+            for i, doc_id in enumerate(ids):
+                row = self._row_of(doc_id)
+                if row is not None:
+                    rows[i] = row
+            return rows
+
+    def match_rows(self, key: str, predicate: Callable[[Any], bool]) -> np.ndarray:
+        """
+        Evaluates a metadata condition for every row at once.
+
+        The predicate runs once per distinct interned value rather than once
+        per row; rows are then matched by their int32 codes.
+
+        Args:
+            key: Metadata key to test
+            predicate: Called with a metadata value, returns whether it matches
+
+        Returns:
+            Boolean mask over all rows (deleted rows included, rows without the key False)
+        """
+        with self._lock:
+            mask = np.zeros(self.num_rows, dtype=bool)
+            pos = self._key_pos.get(key)
+            if pos is None:
+                return mask
+            allowed = np.asarray([code for code, value in enumerate(self._values) if predicate(value)],
+                                 dtype=np.int32)
+            if not len(allowed):
+                return mask
+            if self._base_rows and pos < self._base_codes.shape[1]:
+                mask[:self._base_rows] = np.isin(self._base_codes[:, pos], allowed)
+            if self._tail_ids:
+                mask[self._base_rows:] = np.isin(np.frombuffer(self._tail_codes[pos], dtype=np.int32), allowed)
+            for row, codes in self._overrides.items():
+                mask[row] = pos < len(codes) and codes[pos] in allowed
+            return mask
+
+    def ids(self) -> List[str]:
+        """Returns the ids of all live documents in row order."""
+        with self._lock:
+            return [self._doc_id(row) for row in range(self.num_rows) if row not in self._deleted]
+
+    def memory_bytes(self) -> int:
+        """Approximate heap held by the store; memory-mapped files are not counted."""
+        tail_rows = len(self._tail_ids)
+        # Offset and codes per tail row, plus the id string and its dict entry
+        per_tail_row = 8 + 4 * len(self._keys) + 150
+        blocks = sum(len(data) for data in self._blocks.values())
+        if self._tail_writer is not None:
+            blocks += len(self._tail_writer.pending)
+        return int(tail_rows * per_tail_row + 64 * len(self._values) + 64 * len(self._deleted) + blocks)
+
+    def save(self, index_dir: str) -> None:
+        """Writes the live rows, compacted, into index_dir."""
+        with self._lock:
+            live = [row for row in range(self.num_rows) if row not in self._deleted]
+            offsets = np.zeros(len(live) + 1, dtype=np.int64)
+            text_path = os.path.join(index_dir, self.TEXT_FILE_NAME)
+            if self.compression == "none":
+                with open(text_path, "wb") as f:
+                    for i, row in enumerate(live):
+                        text = self._text_bytes(row)
+                        f.write(text)
+                        offsets[i + 1] = offsets[i] + len(text)
+            else:
+                open(text_path, "wb").close()
+                writer = _BlockWriter(text_path, self.compression)
+                for i, row in enumerate(live):
+                    text = self._text_bytes(row)
+                    writer.add(text)
+                    offsets[i + 1] = offsets[i] + len(text)
+                writer.flush()
+                np.save(os.path.join(index_dir, self.BLOCK_ROWS_FILE_NAME),
+                        np.asarray(writer.block_rows.tolist() + [len(live)], dtype=np.int64))
+                np.save(os.path.join(index_dir, self.BLOCK_OFFSETS_FILE_NAME),
+                        np.asarray(writer.block_offsets, dtype=np.int64))
+
+            codes = np.full((len(live), len(self._keys)), _MISSING, dtype=np.int32)
+            base_live = [row for row in live if row < self._base_rows]
+            if base_live and self._base_codes.shape[1]:
+                codes[:len(base_live), :self._base_codes.shape[1]] = self._base_codes[base_live]
+            for i, row in enumerate(base_live):
+                if row in self._overrides:
+                    override = self._overrides[row]
+                    codes[i, :] = _MISSING
+                    codes[i, :len(override)] = override
+            tail_live = np.asarray([row - self._base_rows for row in live[len(base_live):]], dtype=np.int64)
+            for pos, column in enumerate(self._tail_codes):
+                if len(tail_live):
+                    codes[len(base_live):, pos] = np.frombuffer(column, dtype=np.int32)[tail_live]
+
+            encoded_ids = [self._doc_id(row).encode("utf-8") for row in live]
+            width = max((len(doc_id) for doc_id in encoded_ids), default=1)
+            ids = np.asarray(encoded_ids, dtype=f"S{width}")
+            order = np.argsort(ids, kind="stable")
+
+            np.save(os.path.join(index_dir, self.OFFSETS_FILE_NAME), offsets)
+            np.save(os.path.join(index_dir, self.IDS_FILE_NAME), ids)
+            np.save(os.path.join(index_dir, self.SORTED_IDS_FILE_NAME), ids[order])
+            np.save(os.path.join(index_dir, self.SORTED_ROWS_FILE_NAME), order.astype(np.int64))
+            np.save(os.path.join(index_dir, self.CODES_FILE_NAME), codes)
+            with open(os.path.join(index_dir, self.META_FILE_NAME), "w", encoding="utf-8") as f:
+                json.dump({"rows": len(live), "keys": self._keys, "values": self._values,
+                           "compression": self.compression}, f)
@@ -0,0 +1,309 @@
+"""
+Persistent embedding cache for the RAG pipeline.
+Stores float32 vectors in a flat row file with a SQLite index keyed by
+normalized chunk text hash, so identical text is only embedded once.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, List, Dict, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so formatting-only differences share a cache entry."""
+    return " ".join(text.split())
+
+
+def text_key(text: str) -> str:
+    """Returns the cache key for a chunk of text."""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings for a single embedding model.
+
+    Vectors live in ``vectors.f32`` as fixed-size float32 rows; ``index.sqlite``
+    maps text keys to row numbers and tracks last use. When the byte budget is
+    reached the least recently used rows are overwritten by new entries, so
+    the vector file never grows past the budget.
+
+    Several processes (e.g. web server workers) may share a cache directory.
+    Writers take an exclusive ``fcntl`` lock on ``cache.lock`` while they
+    allocate rows and write vectors, and readers a shared one while they
+    look rows up and read them, so a row is never handed out twice or
+    overwritten mid-read. Without fcntl (Windows) only threads are locked.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._lock_file = open(os.path.join(cache_dir, "cache.lock"), "a+b")
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER UNIQUE, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.commit()
+
+        self.dim: Optional[int] = None
+        self._load_dim()
+        if not os.path.exists(self._vectors_path):
+            open(self._vectors_path, "ab").close()
+
+    def _load_dim(self) -> None:
+        """Reads the vector dimension, which another process may have set since this one opened the cache."""
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """Holds the cross-process cache lock (caller holds the thread lock)."""
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    @property
+    def capacity(self) -> Optional[int]:
+        """Maximum number of vectors that fit in the byte budget."""
+        if not self.dim:
+            return None
+        return max(1, self.max_bytes // (self.dim * 4))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _lookup_rows(self, keys: List[str]) -> Dict[str, int]:
+        """Maps the given keys to their vector rows (caller holds the lock)."""
+        found: Dict[str, int] = {}
+        unique_keys = list(set(keys))
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, row in self._conn.execute(
+                f"SELECT key, row FROM entries WHERE key IN ({placeholders})", batch
+            ):
+                found[key] = row
+        return found
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up cached embeddings.
+
+        Args:
+            texts: Chunk texts to look up
+
+        Returns:
+            List aligned with texts holding a float32 vector or None for a miss
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        keys = [text_key(t) for t in texts]
+        with self._lock, self._file_lock(exclusive=False):
+            if texts and self.dim is None:
+                self._load_dim()
+            if not texts or not self.dim:
+                self.misses += len(texts)
+                return results
+
+            row_size = self.dim * 4
+            found = self._lookup_rows(keys)
+            if found:
+                with open(self._vectors_path, "rb") as f:
+                    vectors = {}
+                    for key, row in found.items():
+                        f.seek(row * row_size)
+                        vectors[key] = np.frombuffer(f.read(row_size), dtype=np.float32)
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+                for i, key in enumerate(keys):
+                    results[i] = vectors.get(key)
+
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(texts) - hit_count
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> None:
+        """
+        Stores embeddings, evicting least recently used entries beyond the budget.
+
+        Args:
+            texts: Chunk texts that were embedded
+            vectors: Embeddings aligned with texts
+        """
+        if not texts:
+            return
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # Rows are allocated from the table, so allocation and writes run under the exclusive lock
+        with self._lock, self._file_lock(exclusive=True):
+            if self.dim is None:
+                self._load_dim()
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+                self._conn.commit()
+            elif matrix.shape[1] != self.dim:
+                logger.warning(f"Embedding dimension changed ({self.dim} -> {matrix.shape[1]}); not caching")
+                return
+
+            pending: Dict[str, np.ndarray] = {}
+            for text, vector in zip(texts, matrix):
+                pending[text_key(text)] = vector
+
+            existing = self._lookup_rows(list(pending))
+            new_items = [(key, vec) for key, vec in pending.items() if key not in existing]
+            new_items = new_items[-self.capacity:]
+            if not new_items:
+                return
+
+            size, max_row = self._conn.execute("SELECT COUNT(*), MAX(row) FROM entries").fetchone()
+            next_row = (max_row + 1) if max_row is not None else 0
+            free_slots = max(0, self.capacity - size)
+
+            rows = list(range(next_row, next_row + min(free_slots, len(new_items))))
+            evict_count = len(new_items) - len(rows)
+            if evict_count > 0:
+                evicted = self._conn.execute(
+                    "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (evict_count,)
+                ).fetchall()
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                rows.extend(row for _, row in evicted)
+                logger.info(f"Evicted {len(evicted)} cached embeddings")
+
+            row_size = self.dim * 4
+            now = time.time()
+            with open(self._vectors_path, "r+b") as f:
+                for (key, vector), row in zip(new_items, rows):
+                    f.seek(row * row_size)
+                    f.write(vector.tobytes())
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                [(key, row, now) for (key, _), row in zip(new_items, rows)]
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        """Returns entry count, capacity and hit/miss counters."""
+        return {
+            "entries": len(self),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe in-memory LRU cache of query embeddings with a TTL.
+
+    Keys are (model, whitespace-normalized query), so repeated questions skip
+    the embedding round-trip entirely.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        """Returns the cached embedding for a query, or None on a miss or expiry."""
+        key = (model, normalize_text(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model: str, query: str, vector: List[float]) -> None:
+        """Stores a query embedding, evicting the least recently used entry when full."""
+        if self.max_entries <= 0:
+            return
+        key = (model, normalize_text(query))
+        with self._lock:
+            self._entries[key] = (time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns entry count and hit/miss counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves documents from an EmbeddingCache when possible."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds documents, sending only cache misses to the wrapped model."""
+        cached = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+
+        if missing:
+            fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                cached[i] = vector
+
+        return [v.tolist() if isinstance(v, np.ndarray) else v for v in cached]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Queries are not cached here; they go straight to the wrapped model."""
+        return self.embeddings.embed_query(text)
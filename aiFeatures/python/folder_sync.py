@@ -0,0 +1,203 @@
+"""
+Incremental folder sync for the RAG pipeline.
+A manifest of each synced folder (file size, mtime and content hash) is kept
+with the vector store, so a sync only extracts and embeds new or edited
+PDFs and drops the chunks of deleted ones. A watcher can re-run the sync
+whenever the folder changes, using inotify when available and polling
+otherwise.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from .rag_pipeline import _file_is_indexed, _file_sha256, add_pdfs_to_store, remove_file_from_store
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    INOTIFY_AVAILABLE = True
+except ImportError:
+    INOTIFY_AVAILABLE = False
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds a watched folder must be quiet before a sync starts (lets copies finish)
+RAG_SYNC_DEBOUNCE = float(os.getenv("RAG_SYNC_DEBOUNCE", "2.0"))
+# Seconds between folder scans when inotify is not available
+RAG_SYNC_POLL_INTERVAL = float(os.getenv("RAG_SYNC_POLL_INTERVAL", "10.0"))
+
+
+def _scan_folder(folder: str) -> Dict[str, os.stat_result]:
+    """Returns the stat of every PDF directly inside folder, keyed by path."""
+    scanned = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".pdf"):
+                scanned[entry.path] = entry.stat()
+    return scanned
+
+
+def sync_folder(vector_store: Optional[FAISS], folder: str, chunk_size: int = 1000,
+                chunk_overlap: int = 200,
+                model: str = "mxbai-embed-large:latest") -> Tuple[Optional[FAISS], Dict]:
+    """
+    Brings a vector store up to date with the PDFs in a folder.
+
+    Files whose size and mtime match the manifest are skipped without being
+    read; files whose stat changed are hashed, so a touched but identical
+    file is not re-embedded. Changed and new files are re-indexed and
+    files gone from the folder are removed from the store. Files are
+    matched by their path, so same-named PDFs from other folders or uploads
+    are left alone. Files that yield no text are left out of the manifest
+    and retried by the next sync.
+
+    Args:
+        vector_store: Store to update in place (a new one is built if None)
+        folder: Folder of PDFs
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        model: Embedding model to use
+
+    Returns:
+        (vector store, report with added, updated, removed and failed file
+        names, the unchanged file count and the elapsed seconds)
+
+    Raises:
+        ValueError: If folder is not a directory
+    """
+    if not os.path.isdir(folder):
+        raise ValueError(f"{folder} is not a folder")
+    started = time.time()
+    folder_key = os.path.abspath(folder)
+    manifests = getattr(vector_store, "sync_manifest", None) or {}
+    old_manifest = manifests.get(folder_key, {})
+    new_manifest = {}
+    added, updated = [], []
+
+    for path, stat in sorted(_scan_folder(folder).items()):
+        entry = old_manifest.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            new_manifest[path] = entry
+            continue
+        file_hash = _file_sha256(path)
+        new_manifest[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash}
+        if entry is None or vector_store is None:
+            added.append(path)
+        elif entry["sha256"] != file_hash:
+            updated.append(path)
+
+    removed = [path for path in old_manifest if path not in new_manifest]
+    if vector_store is not None:
+        for path in removed:
+            remove_file_from_store(vector_store, path, key="file_path")
+
+    changed = added + updated
+    unchanged = len(new_manifest) - len(changed)
+    failed = []
+    if changed:
+        # Re-indexing a path replaces its old chunks
+        vector_store = add_pdfs_to_store(vector_store, changed, chunk_size, chunk_overlap, model,
+                                         replace_by="file_path")
+        # Forget files nothing could be extracted from, so the next sync retries them
+        failed = [path for path in changed if not _file_is_indexed(vector_store, path, "file_path")]
+        for path in failed:
+            new_manifest.pop(path, None)
+
+    if vector_store is not None:
+        manifests[folder_key] = new_manifest
+        vector_store.sync_manifest = manifests
+
+    report = {
+        "added": [os.path.basename(path) for path in added],
+        "updated": [os.path.basename(path) for path in updated],
+        "removed": [os.path.basename(path) for path in removed],
+        "failed": [os.path.basename(path) for path in failed],
+        "unchanged": unchanged,
+        "seconds": round(time.time() - started, 3),
+    }
+    logger.info(f"Synced {folder}: {len(added)} added, {len(updated)} updated, {len(removed)} removed, "
+                f"{len(failed)} failed, {report['unchanged']} unchanged in {report['seconds']}s")
+    return vector_store, report
+
+
+class FolderWatcher:
+    """
+    Calls on_change after a folder's PDFs change and the folder has been quiet for debounce seconds.
+
+    Uses inotify (via the optional inotify_simple package) on Linux and
+    falls back to scanning the folder every poll_interval seconds.
+    """
+
+    def __init__(self, folder: str, on_change: Callable[[], None],
+                 debounce: float = RAG_SYNC_DEBOUNCE, poll_interval: float = RAG_SYNC_POLL_INTERVAL):
+        self.folder = folder
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"folder-watch:{folder}", daemon=True)
+
+    def start(self) -> "FolderWatcher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if INOTIFY_AVAILABLE else "polling"
+
+    def _fire(self) -> None:
+        try:
+            self.on_change()
+        except Exception as e:
+            logger.error(f"Sync of watched folder {self.folder} failed: {str(e)}")
+
+    def _run(self) -> None:
+        if INOTIFY_AVAILABLE:
+            self._run_inotify()
+        else:
+            self._run_polling()
+
+    def _run_inotify(self) -> None:
+        mask = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+                | inotify_flags.DELETE | inotify_flags.CREATE)
+        with INotify() as inotify:
+            inotify.add_watch(self.folder, mask)
+            pending_since = None
+            while not self._stop.is_set():
+                events = inotify.read(timeout=int(min(self.debounce, 1.0) * 1000))
+                if any(event.name.lower().endswith(".pdf") for event in events):
+                    pending_since = time.time()
+                elif pending_since is not None and time.time() - pending_since >= self.debounce:
+                    pending_since = None
+                    self._fire()
+
+    def _run_polling(self) -> None:
+        def snapshot():
+            try:
+                return {path: (stat.st_size, stat.st_mtime_ns) for path, stat in _scan_folder(self.folder).items()}
+            except OSError:
+                return None
+
+        last = snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = snapshot()
+            if current == last:
+                continue
+            # Wait until the folder stops changing, e.g. while a large file is copied in
+            while not self._stop.wait(self.debounce):
+                settled = snapshot()
+                if settled == current:
+                    break
+                current = settled
+            last = current
+            if not self._stop.is_set():
+                self._fire()
@@ -0,0 +1,201 @@
+"""
+Background indexing jobs for the RAG pipeline.
+Uploads are indexed in a bounded worker pool instead of inside the HTTP
+request. Each job reports pages, chunks, throughput and an ETA while it
+runs, can be cancelled between embedding batches, and hands its finished
+store to a callback, so the previous store stays searchable until the new
+one replaces it in a single swap.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+
+from langchain_community.vectorstores import FAISS
+from pypdf import PdfReader
+
+from .rag_pipeline import _resolve_pdf_paths, index_pdfs
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Indexing jobs run at the same time; later jobs wait in the queue
+RAG_JOB_WORKERS = int(os.getenv("RAG_JOB_WORKERS", "2"))
+# Finished jobs kept for status queries before the oldest are forgotten
+RAG_JOB_HISTORY = int(os.getenv("RAG_JOB_HISTORY", "100"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job to abandon it at the next batch."""
+
+
+def _count_pages(pdf_paths: List[str]) -> Optional[int]:
+    """Total page count of the PDFs (reads only their page trees), or None if any cannot be opened."""
+    total = 0
+    for path in pdf_paths:
+        try:
+            total += len(PdfReader(path).pages)
+        except Exception:
+            return None
+    return total
+
+
+class IndexingJob:
+    """State and progress of one background indexing job."""
+
+    def __init__(self, workspace_id: str, pdf_paths: List[str], cleanup_dir: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex
+        self.workspace_id = workspace_id
+        self.pdf_paths = pdf_paths
+        self.cleanup_dir = cleanup_dir
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.total_pages: Optional[int] = None
+        self.progress = {"pages": 0, "chunks": 0}
+        self.total_chunks: Optional[int] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    def to_dict(self) -> Dict:
+        """Job status for API responses, with throughput and ETA derived from the progress so far."""
+        pages, chunks = self.progress["pages"], self.progress["chunks"]
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        pages_per_second = pages / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.status == RUNNING and self.total_pages and pages_per_second > 0:
+            eta = round(max(self.total_pages - pages, 0) / pages_per_second, 1)
+        return {
+            "job_id": self.job_id,
+            "workspace_id": self.workspace_id,
+            "status": self.status,
+            "error": self.error,
+            "files": len(self.pdf_paths),
+            "pages": pages,
+            "total_pages": self.total_pages,
+            "chunks": chunks,
+            "total_chunks": self.total_chunks,
+            "elapsed_seconds": round(elapsed, 1),
+            "pages_per_second": round(pages_per_second, 1),
+            "embeddings_per_second": round(chunks / elapsed, 1) if elapsed > 0 else 0.0,
+            "eta_seconds": eta,
+        }
+
+
+class IndexingJobManager:
+    """
+    Runs indexing jobs in a fixed-size thread pool and keeps their status.
+
+    Extraction and embedding inside a job already use their own process and
+    thread pools; limiting concurrent jobs keeps several large uploads from
+    oversubscribing them.
+    """
+
+    def __init__(self, max_workers: int = RAG_JOB_WORKERS, max_history: int = RAG_JOB_HISTORY):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="index-job")
+        self._jobs: "OrderedDict[str, IndexingJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_history = max_history
+
+    def submit(self, workspace_id: str, pdf_inputs: Union[str, List[str]], on_done: Callable[[FAISS], None],
+               cleanup_dir: Optional[str] = None, **index_kwargs) -> IndexingJob:
+        """
+        Queues PDFs for indexing.
+
+        Args:
+            workspace_id: Workspace the job builds a store for
+            pdf_inputs: A PDF path, a list of PDF paths, or a folder path
+            on_done: Called with the finished store; this is where it is swapped in
+            cleanup_dir: Directory (e.g. of uploaded files) deleted once the job ends
+            **index_kwargs: Passed on to index_pdfs
+
+        Returns:
+            The queued job
+
+        Raises:
+            ValueError: If no PDF files are found in pdf_inputs
+        """
+        pdf_paths = _resolve_pdf_paths(pdf_inputs)
+        if not pdf_paths:
+            raise ValueError("No PDF files found")
+        job = IndexingJob(workspace_id, pdf_paths, cleanup_dir)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, on_done, index_kwargs)
+        logger.info(f"Queued indexing job {job.job_id} for {len(pdf_paths)} PDF files")
+        return job
+
+    def get(self, job_id: str) -> Optional[IndexingJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, workspace_id: Optional[str] = None) -> List[IndexingJob]:
+        with self._lock:
+            return [job for job in self._jobs.values() if workspace_id in (None, job.workspace_id)]
+
+    def cancel(self, job_id: str) -> Optional[IndexingJob]:
+        """
+        Asks a job to stop. A queued job never starts; a running one stops at its next embedded batch.
+
+        Returns:
+            The job, or None if the id is unknown
+        """
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES:
+            job.cancel_event.set()
+        return job
+
+    def _prune(self) -> None:
+        """Forgets the oldest finished jobs beyond max_history."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IndexingJob, on_done: Callable[[FAISS], None], index_kwargs: Dict) -> None:
+        try:
+            if job.cancel_event.is_set():
+                raise JobCancelled()
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.total_pages = _count_pages(job.pdf_paths)
+
+            def on_batch(vector_store: FAISS, progress: Dict) -> None:
+                job.progress = {"pages": progress["pages"], "chunks": progress["chunks"]}
+                if job.cancel_event.is_set():
+                    raise JobCancelled()
+
+            vector_store = index_pdfs(job.pdf_paths, on_batch=on_batch, **index_kwargs)
+            if job.cancel_event.is_set():
+                raise JobCancelled()
+            if vector_store is None:
+                raise ValueError("No text could be extracted from the uploaded PDFs")
+            job.total_chunks = vector_store.index.ntotal
+            on_done(vector_store)
+            job.status = COMPLETED
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.error(f"Indexing job {job.job_id} failed: {str(e)}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            if job.cleanup_dir:
+                shutil.rmtree(job.cleanup_dir, ignore_errors=True)
+            logger.info(f"Indexing job {job.job_id} {job.status} after {job.finished_at - job.created_at:.1f}s")
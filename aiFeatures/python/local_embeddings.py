@@ -0,0 +1,95 @@
+"""
+Offline embedding model for the RAG pipeline.
+Hashes word unigrams and bigrams into a fixed number of signed buckets
+(the "hashing trick"), so indexing and retrieval can run deterministically
+without an Ollama server, e.g. in benchmarks and on CI machines. Lexical
+overlap is all it captures; it is not a replacement for a trained model.
+"""
+
+import re
+import hashlib
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Model names starting with this select HashedNgramEmbeddings, e.g. "hashed-ngram:256"
+LOCAL_EMBEDDING_PREFIX = "hashed-ngram"
+DEFAULT_LOCAL_DIM = 384
+# Token hashes remembered between calls before the memo is reset
+MAX_CACHED_TOKENS = 1_000_000
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+# Odd 64-bit multiplier mixing the two word hashes of a bigram
+_BIGRAM_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def is_local_model(model: str) -> bool:
+    """Tells whether a model name refers to the offline hashed n-gram embedder."""
+    return model == LOCAL_EMBEDDING_PREFIX or model.startswith(LOCAL_EMBEDDING_PREFIX + ":")
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """
+    Deterministic bag of hashed word unigrams and bigrams, L2-normalised.
+
+    Each n-gram adds +1 or -1 (from its hash) to one of ``dim`` buckets.
+    Texts are embedded a batch at a time with numpy; only distinct words
+    are hashed in Python, and bigram hashes are derived from them.
+    """
+
+    def __init__(self, dim: int = DEFAULT_LOCAL_DIM):
+        if dim < 1:
+            raise ValueError("dim must be positive")
+        self.dim = dim
+        self.model = f"{LOCAL_EMBEDDING_PREFIX}:{dim}"
+        self._token_hashes: Dict[str, int] = {}
+
+    @classmethod
+    def from_model_name(cls, model: str) -> "HashedNgramEmbeddings":
+        """Parses "hashed-ngram" or "hashed-ngram:<dim>"."""
+        _, _, dim = model.partition(":")
+        return cls(int(dim) if dim else DEFAULT_LOCAL_DIM)
+
+    def _hash_token(self, token: str) -> int:
+        value = self._token_hashes.get(token)
+        if value is None:
+            if len(self._token_hashes) >= MAX_CACHED_TOKENS:
+                self._token_hashes.clear()
+            value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            self._token_hashes[token] = value
+        return value
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """Embeds texts into an (n, dim) float32 matrix."""
+        tokens: List[str] = []
+        owners: List[int] = []
+        for row, text in enumerate(texts):
+            words = _TOKEN_PATTERN.findall(text.lower())
+            tokens.extend(words)
+            owners.extend([row] * len(words))
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not tokens:
+            return matrix
+
+        hashes = np.fromiter((self._hash_token(token) for token in tokens), dtype=np.uint64, count=len(tokens))
+        owners = np.asarray(owners, dtype=np.int64)
+        # Bigrams only pair words of the same text
+        same_text = owners[:-1] == owners[1:]
+        bigrams = (hashes[:-1] * _BIGRAM_MIX) ^ hashes[1:]
+        all_hashes = np.concatenate([hashes, bigrams[same_text]])
+        all_owners = np.concatenate([owners, owners[:-1][same_text]])
+
+        buckets = (all_hashes % np.uint64(self.dim)).astype(np.int64)
+        signs = np.where(all_hashes >> np.uint64(63), -1.0, 1.0)
+        flat = np.bincount(all_owners * self.dim + buckets, weights=signs, minlength=len(texts) * self.dim)
+        matrix = flat.reshape(len(texts), self.dim).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
@@ -0,0 +1,197 @@
+"""
+Parallel PDF text extraction for the RAG pipeline.
+Kept free of LangChain imports so spawned worker processes start quickly.
+"""
+
+import os
+import signal
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from collections import deque
+from itertools import islice
+from typing import Iterator, List, Dict, Tuple
+
+from pypdf import PdfReader
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Pages handled by one worker task and the time limit for a single page
+RAG_EXTRACT_PAGES_PER_TASK = int(os.getenv("RAG_EXTRACT_PAGES_PER_TASK", "16"))
+RAG_EXTRACT_PAGE_TIMEOUT = float(os.getenv("RAG_EXTRACT_PAGE_TIMEOUT", "30"))
+# Seconds a task may run beyond its page time limits before its worker is considered stuck
+RAG_EXTRACT_TASK_GRACE = float(os.getenv("RAG_EXTRACT_TASK_GRACE", "60"))
+
+class _PageTimeout(BaseException):
+    """Raised inside an extraction worker when a single page takes too long.
+    
+    Derives from BaseException so pypdf's internal ``except Exception``
+    handlers cannot swallow it.
+    """
+
+def _raise_page_timeout(signum, frame):
+    raise _PageTimeout()
+
+def _extract_page_range(pdf_path: str, start: int, end: int,
+                        page_timeout: float) -> List[Tuple[int, str, int]]:
+    """
+    Extracts pages [start, end) of a PDF inside a worker process.
+    
+    Each page is bounded by page_timeout seconds where SIGALRM is available;
+    pages that time out or fail are skipped and logged.
+    
+    Returns:
+        List of (page_index, text, total_pages) for pages with text
+    """
+    reader = PdfReader(pdf_path)
+    total_pages = len(reader.pages)
+    # Signals can only be installed from the main thread of a process
+    use_alarm = (page_timeout > 0 and hasattr(signal, "setitimer")
+                 and threading.current_thread() is threading.main_thread())
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_page_timeout)
+    
+    pages = []
+    for page_idx in range(start, min(end, total_pages)):
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, page_timeout)
+            text = reader.pages[page_idx].extract_text()
+        except _PageTimeout:
+            logger.warning(f"Timed out extracting page {page_idx + 1} of {os.path.basename(pdf_path)}")
+            continue
+        except Exception as e:
+            logger.warning(f"Error extracting page {page_idx + 1} of {os.path.basename(pdf_path)}: {str(e)}")
+            continue
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        
+        if text and text.strip():
+            pages.append((page_idx, text, total_pages))
+    return pages
+
+def _count_pages(pdf_path: str) -> int:
+    """Page count of a PDF, read inside a worker process."""
+    return len(PdfReader(pdf_path).pages)
+
+def _start_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Starts a pool of extraction worker processes."""
+    # Spawned workers avoid forking a multi-threaded server process
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def _stop_pool(executor: ProcessPoolExecutor) -> None:
+    """Shuts a pool down without waiting, killing workers still stuck in a task."""
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+def iter_texts_parallel(pdf_paths: List[str], max_workers: int = os.cpu_count() or 1,
+                        pages_per_task: int = RAG_EXTRACT_PAGES_PER_TASK,
+                        page_timeout: float = RAG_EXTRACT_PAGE_TIMEOUT) -> Iterator[Tuple[str, Dict]]:
+    """
+    Extracts text from many PDFs across a pool of worker processes, lazily.
+    
+    Page counts are read a few files ahead by a separate worker process, so
+    the parent never opens the PDFs itself and counting never waits behind
+    extraction. Large files are split into page ranges so a single big PDF
+    also uses several cores. Only a bounded window of tasks is in flight at
+    once and pages are yielded in input file order and page order as soon
+    as their task finishes, so callers can consume a large folder with flat
+    memory. A task that outlives its time limit leaves its worker stuck, so
+    the pool is then replaced and the other pending tasks are submitted again.
+    
+    Args:
+        pdf_paths: Paths of the PDFs to extract
+        max_workers: Number of worker processes
+        pages_per_task: Maximum number of pages handled by one task
+        page_timeout: Seconds allowed per page before it is skipped
+        
+    Yields:
+        Tuples containing (text, metadata)
+    """
+    step = max(1, pages_per_task)
+    executor = _start_pool(max_workers)
+    count_executor = _start_pool(1)
+    paths = iter(pdf_paths)
+    counting = deque()
+    in_flight = deque()
+    
+    def submit_count() -> None:
+        pdf_path = next(paths, None)
+        if pdf_path is not None:
+            counting.append((pdf_path, count_executor.submit(_count_pages, pdf_path)))
+    
+    def recycle_count_pool() -> None:
+        nonlocal count_executor
+        _stop_pool(count_executor)
+        count_executor = _start_pool(1)
+        pending = [pdf_path for pdf_path, _ in counting]
+        counting.clear()
+        counting.extend((pdf_path, count_executor.submit(_count_pages, pdf_path)) for pdf_path in pending)
+    
+    def recycle_pool() -> None:
+        nonlocal executor
+        _stop_pool(executor)
+        executor = _start_pool(max_workers)
+        pending = [task for task, _ in in_flight]
+        in_flight.clear()
+        in_flight.extend((task, executor.submit(_extract_page_range, *task, page_timeout)) for task in pending)
+    
+    def iter_tasks():
+        while counting:
+            pdf_path, future = counting.popleft()
+            submit_count()
+            try:
+                page_count = future.result(timeout=RAG_EXTRACT_TASK_GRACE)
+            except FuturesTimeoutError:
+                logger.error(f"Timed out reading {os.path.basename(pdf_path)}")
+                recycle_count_pool()
+                continue
+            except Exception as e:
+                logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
+                continue
+            for start in range(0, page_count, step):
+                yield pdf_path, start, min(start + step, page_count)
+    
+    try:
+        for _ in range(max_workers):
+            submit_count()
+        tasks = iter_tasks()
+        for task in islice(tasks, max_workers * 2):
+            in_flight.append((task, executor.submit(_extract_page_range, *task, page_timeout)))
+        
+        while in_flight:
+            (pdf_path, start, end), future = in_flight.popleft()
+            next_task = next(tasks, None)
+            if next_task is not None:
+                in_flight.append((next_task, executor.submit(_extract_page_range, *next_task, page_timeout)))
+            
+            # Backstop for platforms without SIGALRM, where a page cannot be interrupted in the worker
+            task_timeout = page_timeout * (end - start) + RAG_EXTRACT_TASK_GRACE if page_timeout > 0 else None
+            try:
+                pages = future.result(timeout=task_timeout)
+            except FuturesTimeoutError:
+                logger.error(f"Timed out extracting pages {start + 1}-{end} of {os.path.basename(pdf_path)}")
+                recycle_pool()
+                continue
+            except Exception as e:
+                logger.error(f"Error extracting pages {start + 1}-{end} of {pdf_path}: {str(e)}")
+                continue
+            
+            for page_idx, text, total_pages in pages:
+                metadata = {
+                    "file_name": os.path.basename(pdf_path),
+                    "file_path": pdf_path,
+                    "page_index": page_idx,
+                    "total_pages": total_pages
+                }
+                yield text, metadata
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        count_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,477 @@
+"""
+Retrieval benchmark for the RAG pipeline.
+Indexes synthetic corpora with the offline hashed n-gram embedder (no
+Ollama needed) and reports ingest throughput, index memory, query latency
+percentiles and recall@k against exact search. Results are written as JSON
+so runs before and after a change can be compared.
+
+Usage (from the repository root):
+    python -m aiFeatures.python.rag_benchmark --sizes 10k 100k --output bench.json
+    python -m aiFeatures.python.rag_benchmark --sizes 1m --baseline bench.json --output bench-new.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import platform
+import resource
+import subprocess
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from .local_embeddings import LOCAL_EMBEDDING_PREFIX
+from .rag_pipeline import (
+    HYBRID_STORE_AVAILABLE, RAG_SPLITTER, _attach_bm25_index, _iter_pdf_texts, _search_vectors,
+    create_embeddings, query_embedding_cache, retrieve_batch, retrieve_hits, stream_index_pages
+)
+from .store_registry import estimate_store_bytes
+from .vector_index import RAG_INDEX_TYPE, RAG_VECTOR_COMPRESSION, index_resident_bytes
+from .docstore import RAG_DOCSTORE
+from .sharded_index import RAG_SHARDS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+BENCHMARK_FORMAT_VERSION = 1
+
+# Pages of a synthetic PDF file, and chunks each synthetic page splits into
+PAGES_PER_FILE = 30
+CHUNKS_PER_PAGE = 4
+WORDS_PER_SENTENCE = 12
+
+_SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "gu", "he", "ji", "qu",
+              "ba", "ce", "fi", "ho", "lu", "ma", "no", "pi", "ro", "su", "ta", "ve", "wo", "xi", "yo")
+
+
+class SyntheticCorpus:
+    """
+    Deterministic topical text that splits into about num_chunks chunks.
+
+    Every page is about one of num_topics topics: most of its words come
+    from that topic's small word list and the rest from a Zipf-distributed
+    background vocabulary. Queries are short bags of topic words, so they
+    have many relevant chunks and lexical and vector search both apply.
+    """
+
+    def __init__(self, num_chunks: int, chunk_size: int = 1000, chunk_overlap: int = 200, seed: int = 0,
+                 num_topics: int = 200, vocab_size: int = 20_000, topic_words: int = 40):
+        self.num_chunks = num_chunks
+        self.seed = seed
+        self.page_chars = CHUNKS_PER_PAGE * max(1, chunk_size - chunk_overlap)
+        self.num_pages = max(1, -(-num_chunks // CHUNKS_PER_PAGE))
+        rng = np.random.default_rng(seed)
+
+        words = set()
+        while len(words) < vocab_size:
+            words.add("".join(rng.choice(_SYLLABLES, size=rng.integers(2, 5))))
+        self.vocabulary = np.array(sorted(words))
+        self.topics = [rng.choice(vocab_size, size=topic_words, replace=False) for _ in range(num_topics)]
+        ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+        self.background = 1.0 / ranks / np.sum(1.0 / ranks)
+
+    def _words(self, rng: np.random.Generator, topic: int, count: int) -> List[str]:
+        from_topic = rng.random(count) < 0.7
+        ids = rng.choice(len(self.vocabulary), size=count, p=self.background)
+        ids[from_topic] = rng.choice(self.topics[topic], size=int(from_topic.sum()))
+        return self.vocabulary[ids].tolist()
+
+    def pages(self) -> Iterator[Tuple[str, Dict]]:
+        """Yields (text, metadata) pages shaped like PDF extraction output."""
+        rng = np.random.default_rng(self.seed + 1)
+        # Average word plus separator length, so pages come out near page_chars
+        avg_word = float(np.mean([len(word) for word in self.vocabulary[:1000]])) + 1
+        words_per_page = int(self.page_chars / avg_word)
+        for page in range(self.num_pages):
+            topic = int(rng.integers(len(self.topics)))
+            words = self._words(rng, topic, words_per_page)
+            sentences = [" ".join(words[i:i + WORDS_PER_SENTENCE]).capitalize() + "."
+                         for i in range(0, len(words), WORDS_PER_SENTENCE)]
+            file_number, page_index = divmod(page, PAGES_PER_FILE)
+            yield " ".join(sentences), {
+                "file_name": f"synthetic_{file_number:05d}.pdf",
+                "page_index": page_index,
+                "total_pages": PAGES_PER_FILE,
+                "topic": topic,
+            }
+
+    def queries(self, count: int) -> List[str]:
+        """Distinct short queries, each mostly made of one topic's words."""
+        rng = np.random.default_rng(self.seed + 2)
+        queries = []
+        while len(queries) < count:
+            topic = int(rng.integers(len(self.topics)))
+            query = " ".join(self._words(rng, topic, 8))
+            if query not in queries:
+                queries.append(query)
+        return queries
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[str], line_chars: int = 95) -> None:
+    """
+    Writes a minimal text-only PDF (Helvetica, one content stream per page) that pypdf can extract.
+
+    Args:
+        path: Output file
+        pages: Text of each page
+        line_chars: Characters per wrapped line
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines, line = [], ""
+        for word in text.split():
+            if line and len(line) + len(word) + 1 > line_chars:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+        body = "BT /F1 8 Tf 10 TL 36 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = body.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def write_synthetic_pdfs(corpus: SyntheticCorpus, folder: str, max_pages: Optional[int] = None) -> List[str]:
+    """
+    Writes a corpus's pages as PDF files of PAGES_PER_FILE pages.
+
+    Args:
+        corpus: Corpus to write
+        folder: Output folder
+        max_pages: Stop after this many pages
+
+    Returns:
+        Paths of the written PDFs
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths, current, current_name = [], [], None
+
+    def flush():
+        if current:
+            path = os.path.join(folder, current_name)
+            write_pdf(path, current)
+            paths.append(path)
+
+    for number, (text, metadata) in enumerate(corpus.pages()):
+        if max_pages is not None and number >= max_pages:
+            break
+        if metadata["file_name"] != current_name:
+            flush()
+            current, current_name = [], metadata["file_name"]
+        current.append(text)
+    flush()
+    return paths
+
+
+def _percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(samples, 50)), 3),
+        "p95": round(float(np.percentile(samples, 95)), 3),
+        "p99": round(float(np.percentile(samples, 99)), 3),
+        "mean": round(float(samples.mean()), 3),
+    }
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
+def _chunk_key(metadata: Dict) -> Tuple:
+    return metadata.get("file_name"), metadata.get("page_index"), metadata.get("start_index")
+
+
+def benchmark_size(num_chunks: int, model: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                   k: int = 10, num_queries: int = 500, modes: Tuple[str, ...] = ("vector", "hybrid"),
+                   seed: int = 0) -> Dict:
+    """
+    Indexes one synthetic corpus and measures it.
+
+    Args:
+        num_chunks: Target corpus size in chunks
+        model: Embedding model ("hashed-ngram:<dim>" runs offline)
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        k: Results per query for latency and recall
+        num_queries: Queries timed per retrieval mode
+        modes: Retrieval modes to time
+        seed: Corpus seed
+
+    Returns:
+        Result dict for the JSON report
+    """
+    corpus = SyntheticCorpus(num_chunks, chunk_size, chunk_overlap, seed)
+    exact_blocks: List[np.ndarray] = []
+
+    def record_vectors(vector_store, progress: Dict) -> None:
+        # A new store is streamed into a flat index, so its rows are the exact vectors in add order
+        index = vector_store.index
+        if isinstance(index, faiss.IndexFlat):
+            done = sum(len(block) for block in exact_blocks)
+            xb = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+            exact_blocks.append(np.array(xb[done:]))
+
+    logger.info(f"Indexing {corpus.num_pages} synthetic pages (~{num_chunks} chunks)")
+    started = time.perf_counter()
+    vector_store = stream_index_pages(corpus.pages(), chunk_size, chunk_overlap, model, on_batch=record_vectors)
+    if HYBRID_STORE_AVAILABLE:
+        _attach_bm25_index(vector_store)
+    ingest_seconds = time.perf_counter() - started
+    total_chunks = vector_store.index.ntotal
+
+    result = {
+        "target_chunks": num_chunks,
+        "chunks": total_chunks,
+        "pages": corpus.num_pages,
+        "index": type(faiss.downcast_index(vector_store.index)).__name__
+        if isinstance(vector_store.index, faiss.Index) else type(vector_store.index).__name__,
+        "ingest": {
+            "seconds": round(ingest_seconds, 3),
+            "pages_per_second": round(corpus.num_pages / ingest_seconds, 1),
+            "chunks_per_second": round(total_chunks / ingest_seconds, 1),
+        },
+        "memory": {
+            "index_bytes": int(index_resident_bytes(vector_store.index)),
+            "store_bytes": estimate_store_bytes(vector_store),
+            "peak_rss_bytes": _peak_rss_bytes(),
+        },
+    }
+
+    queries = corpus.queries(num_queries)
+    latency = {}
+    for mode in modes:
+        # Every mode embeds its queries afresh
+        query_embedding_cache.clear()
+        for query in queries[:10]:
+            retrieve_hits(query, vector_store, k=k, mode=mode)
+        query_embedding_cache.clear()
+        samples = []
+        for query in queries:
+            query_started = time.perf_counter()
+            retrieve_hits(query, vector_store, k=k, mode=mode)
+            samples.append((time.perf_counter() - query_started) * 1000)
+        latency[mode] = _percentiles(samples)
+    result["latency_ms"] = latency
+
+    query_embedding_cache.clear()
+    batch_started = time.perf_counter()
+    retrieve_batch(queries[:min(len(queries), 256)], vector_store, k=k, mode=modes[0])
+    result["batch_queries_per_second"] = round(min(len(queries), 256) / (time.perf_counter() - batch_started), 1)
+
+    result["recall_at_k"] = None
+    if exact_blocks and sum(len(block) for block in exact_blocks) == total_chunks:
+        exact_vectors = np.concatenate(exact_blocks)
+        query_vectors = np.asarray(create_embeddings(model).embed_documents(queries), dtype=np.float32)
+        _, truth_rows = faiss.knn(query_vectors, exact_vectors, min(k, total_chunks))
+        row_keys = {}
+        for rows in truth_rows:
+            for row in rows:
+                if row >= 0 and row not in row_keys:
+                    doc_id = vector_store.index_to_docstore_id[int(row)]
+                    row_keys[row] = _chunk_key(vector_store.docstore.search(doc_id).metadata)
+        found = _search_vectors(vector_store, query_vectors, k)
+        hits = 0
+        for rows, docs in zip(truth_rows, found):
+            expected = {row_keys[row] for row in rows if row >= 0}
+            hits += len(expected & {_chunk_key(doc.metadata) for doc, _ in docs})
+        result["recall_at_k"] = round(hits / max(1, truth_rows.size), 4)
+    return result
+
+
+def benchmark_pdf_ingest(num_pages: int, model: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                         seed: int = 0) -> Dict:
+    """
+    Measures PDF extraction alone and extraction plus indexing on written synthetic PDFs.
+
+    Returns:
+        Result dict for the JSON report
+    """
+    corpus = SyntheticCorpus(num_pages * CHUNKS_PER_PAGE, chunk_size, chunk_overlap, seed)
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as folder:
+        paths = write_synthetic_pdfs(corpus, folder, num_pages)
+        started = time.perf_counter()
+        extracted = sum(1 for _ in _iter_pdf_texts(paths))
+        extract_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vector_store = stream_index_pages(_iter_pdf_texts(paths), chunk_size, chunk_overlap, model,
+                                          num_files=len(paths))
+        ingest_seconds = time.perf_counter() - started
+    return {
+        "files": len(paths),
+        "pages": extracted,
+        "chunks": vector_store.index.ntotal if vector_store is not None else 0,
+        "extract_pages_per_second": round(extracted / extract_seconds, 1),
+        "ingest_pages_per_second": round(extracted / ingest_seconds, 1),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment_info() -> Dict:
+    """Machine and configuration details recorded with every report."""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "faiss": faiss.__version__,
+        "rag_index_type": RAG_INDEX_TYPE,
+        "rag_vector_compression": RAG_VECTOR_COMPRESSION,
+        "rag_docstore": RAG_DOCSTORE,
+        "rag_splitter": RAG_SPLITTER,
+        "rag_shards": RAG_SHARDS,
+    }
+
+
+# Metrics compared between reports, and whether a higher value is better
+COMPARED_METRICS = {
+    ("ingest", "chunks_per_second"): True,
+    ("memory", "store_bytes"): False,
+    ("latency_ms", "vector", "p50"): False,
+    ("latency_ms", "vector", "p99"): False,
+    ("latency_ms", "hybrid", "p50"): False,
+    ("latency_ms", "hybrid", "p99"): False,
+    ("batch_queries_per_second",): True,
+    ("recall_at_k",): True,
+}
+
+
+def _lookup(result: Dict, path: Tuple[str, ...]):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare_reports(baseline: Dict, current: Dict) -> List[Dict]:
+    """
+    Lines up the results of two reports by corpus size.
+
+    Returns:
+        One row per size and metric with both values, the relative change
+        and whether it is an improvement (None if unchanged)
+    """
+    baseline_results = {result["target_chunks"]: result for result in baseline.get("results", [])}
+    rows = []
+    for result in current.get("results", []):
+        old = baseline_results.get(result["target_chunks"])
+        if old is None:
+            continue
+        for path, higher_is_better in COMPARED_METRICS.items():
+            before, after = _lookup(old, path), _lookup(result, path)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            rows.append({
+                "target_chunks": result["target_chunks"],
+                "metric": ".".join(path),
+                "baseline": before,
+                "current": after,
+                "change": round(change, 4),
+                "improved": None if change == 0 else (change > 0) == higher_is_better,
+            })
+    return rows
+
+
+def _parse_size(text: str) -> int:
+    text = text.strip().lower().replace("_", "")
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark RAG ingestion and retrieval on synthetic corpora.")
+    parser.add_argument("--sizes", nargs="+", default=["10k", "100k"],
+                        help="Corpus sizes in chunks, e.g. 10k 100k 1m")
+    parser.add_argument("--model", default=f"{LOCAL_EMBEDDING_PREFIX}:256",
+                        help="Embedding model; hashed-ngram:<dim> needs no Ollama server")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500, help="Timed queries per retrieval mode")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"])
+    parser.add_argument("--pdf-pages", type=int, default=300,
+                        help="Pages of synthetic PDFs for the extraction benchmark (0 skips it)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="rag-benchmark.json")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    report = {
+        "format_version": BENCHMARK_FORMAT_VERSION,
+        "environment": environment_info(),
+        "config": {
+            "model": args.model,
+            "chunk_size": args.chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "k": args.k,
+            "queries": args.queries,
+            "modes": args.modes,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+    for size in sorted(_parse_size(size) for size in args.sizes):
+        result = benchmark_size(size, args.model, args.chunk_size, args.chunk_overlap, args.k,
+                                args.queries, tuple(args.modes), args.seed)
+        logger.info(f"{size} chunks: {json.dumps(result)}")
+        report["results"].append(result)
+    if args.pdf_pages > 0:
+        report["pdf_ingest"] = benchmark_pdf_ingest(args.pdf_pages, args.model, args.chunk_size,
+                                                    args.chunk_overlap, args.seed)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare_reports(json.load(f), report)
+        for row in report["comparison"]:
+            print(f"{row['target_chunks']:>9} {row['metric']:<28} {row['baseline']:>14} -> {row['current']:>14} "
+                  f"({row['change']:+.1%}{', worse' if row['improved'] is False else ''})")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,382 @@
 import os
+import json
+import pickle
+import time
+import shutil
+import bisect
+import hashlib
 import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_ollama import OllamaEmbeddings
+from langchain_core.documents import Document
 from pypdf import PdfReader
-from typing import List, Dict, Tuple, Union, Optional
+from typing import Callable, Iterable, Iterator, List, Dict, Tuple, Union, Optional
 import logging
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .local_embeddings import HashedNgramEmbeddings, is_local_model
+from .embedding_cache import EmbeddingCache, CachedEmbeddings, QueryEmbeddingCache
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .dedup import DUPLICATE_REFS_KEY, ChunkDeduplicator, add_duplicate_ref, deduplicate_chunks
+from .docstore import RAG_DOCSTORE, MmapDocstore
+from .search_filter import SearchFilter
+from .sharded_index import RAG_SHARDS, ShardedIndex
+from .pdf_extraction import iter_texts_parallel
+from .vector_index import (
+    RAG_INDEX_TYPE, RAG_VECTOR_COMPRESSION, RAG_RERANK_FACTOR, RAG_MMAP_INDEX, RerankVectors,
+    build_faiss_index, choose_index_type, codec_spec, is_compressed, measure_recall, read_index, remove_rows,
+    rerank_exact, search_parameters, writable_index
+)
 
-# Using FAISS vector store
-HYBRID_STORE_AVAILABLE = False
+# FAISS vectors fused with a BM25 lexical index over the same chunks
+HYBRID_STORE_AVAILABLE = True
 
 # Set up logging
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# On-disk cache for built vector stores (override with RAG_CACHE_DIR)
+RAG_CACHE_DIR = os.getenv(
+    "RAG_CACHE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".rag_cache"))
+)
+RAG_INDEX_DIR = os.path.join(RAG_CACHE_DIR, "indexes")
+RAG_EMBEDDING_CACHE_DIR = os.path.join(RAG_CACHE_DIR, "embeddings")
+# Scratch files for stores that are being built or modified
+RAG_WORK_DIR = os.path.join(RAG_CACHE_DIR, "work")
+# Size budget per embedding model; least recently used vectors are evicted beyond it
+RAG_EMBEDDING_CACHE_MB = int(os.getenv("RAG_EMBEDDING_CACHE_MB", "1024"))
+
+# Embedding stage tuning: chunks per request and concurrent requests to the backend
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+RAG_EMBED_WORKERS = int(os.getenv("RAG_EMBED_WORKERS", "4"))
+RAG_EMBED_MAX_RETRIES = int(os.getenv("RAG_EMBED_MAX_RETRIES", "3"))
+
+# Parallel PDF extraction: worker processes (0 or 1 disables) and the corpus
+# size below which serial extraction is used
+RAG_EXTRACT_WORKERS = int(os.getenv("RAG_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+RAG_PARALLEL_EXTRACT_MIN_PAGES = 64
+
+# Streaming ingestion: bounded hand-off queues between the extract, split and
+# embed stages, so memory stays flat however many PDFs are indexed
+RAG_STREAM_PAGE_QUEUE = int(os.getenv("RAG_STREAM_PAGE_QUEUE", "64"))
+RAG_STREAM_BATCH_QUEUE = int(os.getenv("RAG_STREAM_BATCH_QUEUE", "8"))
+# Seconds between throughput log lines while indexing
+RAG_PROGRESS_LOG_INTERVAL = 5.0
+# Seconds between checkpoints of a store index_pdfs is building (0 disables);
+# an interrupted run of the same corpus resumes from the last one
+RAG_CHECKPOINT_INTERVAL = float(os.getenv("RAG_CHECKPOINT_INTERVAL", "300"))
+# A corpus's checkpoint is kept next to its saved index, in a directory with this suffix
+CHECKPOINT_SUFFIX = ".partial"
+
+# "offset" splits on character offsets into the page text, "langchain" uses RecursiveCharacterTextSplitter
+RAG_SPLITTER = os.getenv("RAG_SPLITTER", "offset")
+# Set to 1 to let chunks run across page breaks of the same file (offset splitter only)
+RAG_SPLIT_ACROSS_PAGES = os.getenv("RAG_SPLIT_ACROSS_PAGES", "0") == "1"
+# Joins the pages of a file when chunks may span them; the splitter treats it like a paragraph break
+PAGE_BREAK = "\n\n"
+
+# Repeated questions reuse their query embedding instead of calling the model again
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=int(os.getenv("RAG_QUERY_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))
+)
+
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+_embedding_caches_lock = threading.Lock()
+
+# Bump when the on-disk layout of saved stores changes so stale entries are ignored
+INDEX_FORMAT_VERSION = 2
+
+HYBRID_STORE_TYPE = "hybrid_faiss_bm25"
+# Per-folder file manifests of stores kept up to date by folder_sync
+SYNC_MANIFEST_FILE = "sync_manifest.json"
+# Candidates taken from each retriever before reciprocal rank fusion
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+# Filtered searches matching at most this many chunks scan just those vectors exactly
+RAG_FILTER_EXACT_MAX = int(os.getenv("RAG_FILTER_EXACT_MAX", "4096"))
+# Most queries accepted by one retrieve_batch call
+RAG_BATCH_MAX_QUERIES = int(os.getenv("RAG_BATCH_MAX_QUERIES", "256"))
+# Most hits per query /ask-batch returns; larger requested k values are capped to it
+RAG_BATCH_MAX_K = int(os.getenv("RAG_BATCH_MAX_K", "50"))
+# Most indexes one federated query may search, and the threads searching them
+RAG_FEDERATED_MAX_INDEXES = int(os.getenv("RAG_FEDERATED_MAX_INDEXES", "16"))
+RAG_FEDERATED_WORKERS = int(os.getenv("RAG_FEDERATED_WORKERS", "4"))
+
+def _file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def compute_corpus_key(pdf_paths: List[str], chunk_size: int, chunk_overlap: int, model: str) -> str:
+    """
+    Derives a content-addressed key for a set of PDFs and indexing settings.
+    
+    The key depends only on file contents (not names or order), the chunking
+    parameters, the splitter settings and the embedding model, so resubmitting
+    the same corpus maps to the same saved index.
+    
+    Args:
+        pdf_paths: Paths of the PDFs in the corpus
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        model: Embedding model name
+        
+    Returns:
+        Hex string identifying the corpus
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{INDEX_FORMAT_VERSION}|{model}|{chunk_size}|{chunk_overlap}|"
+                  f"{RAG_SPLITTER}|{int(RAG_SPLIT_ACROSS_PAGES)}".encode("utf-8"))
+    for file_hash in sorted(_file_sha256(path) for path in pdf_paths):
+        digest.update(file_hash.encode("ascii"))
+    return digest.hexdigest()[:32]
+
+def save_vector_store(vector_store: FAISS, index_dir: str, manifest: Optional[Dict] = None) -> bool:
+    """
+    Saves a FAISS vector store to disk together with a small JSON manifest.
+    
+    The store is written to a temporary sibling directory first and then moved
+    into place, so concurrent readers never see a half-written index.
+    
+    Args:
+        vector_store: Vector store to save
+        index_dir: Target directory for the saved store
+        manifest: Extra information recorded alongside the index
+        
+    Returns:
+        True if the store was saved successfully
+    """
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(parent, exist_ok=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        docstore = vector_store.docstore
+        index = vector_store.index
+        # Chunk texts and sharded vectors are written as their own files, not through save_local
+        if isinstance(docstore, MmapDocstore):
+            vector_store.docstore = InMemoryDocstore()
+        if isinstance(index, ShardedIndex):
+            vector_store.index = faiss.IndexFlatL2(index.d)
+        try:
+            vector_store.save_local(tmp_dir)
+        finally:
+            vector_store.docstore = docstore
+            vector_store.index = index
+        if isinstance(docstore, MmapDocstore):
+            docstore.save(tmp_dir)
+        if isinstance(index, ShardedIndex):
+            index.save(tmp_dir)
+        rerank_vectors = getattr(vector_store, "rerank_vectors", None)
+        if rerank_vectors is not None:
+            rerank_vectors.save(tmp_dir)
+        bm25_index = getattr(vector_store, "bm25_index", None)
+        if bm25_index is not None:
+            bm25_index.save(tmp_dir)
+        sync_manifest = getattr(vector_store, "sync_manifest", None)
+        if sync_manifest:
+            with open(os.path.join(tmp_dir, SYNC_MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(sync_manifest, f)
+        
+        manifest_data = dict(manifest or {})
+        manifest_data.setdefault("format_version", INDEX_FORMAT_VERSION)
+        manifest_data.setdefault("created_at", time.time())
+        manifest_data["num_chunks"] = vector_store.index.ntotal
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest_data, f, indent=2)
+        
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir)
+        os.replace(tmp_dir, index_dir)
+        logger.info(f"Saved vector store with {manifest_data['num_chunks']} chunks to {index_dir}")
+        return True
+    
+    except Exception as e:
+        logger.error(f"Error saving vector store to {index_dir}: {str(e)}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+
+def load_vector_store(index_dir: str, model: str = "mxbai-embed-large:latest") -> Optional[FAISS]:
+    """
+    Loads a vector store previously written by save_vector_store.
+    
+    With RAG_MMAP_INDEX (the default) the FAISS codes, chunk texts, BM25
+    postings and re-rank vectors are memory-mapped rather than read, so
+    loading takes about as long as reading the id lists, pages are faulted
+    in by the queries that touch them, and workers opening the same saved
+    store share one copy in the page cache.
+    
+    Args:
+        index_dir: Directory containing the saved store
+        model: Embedding model used for queries against the loaded store
+        
+    Returns:
+        FAISS vector store, or None if nothing usable is saved there
+    """
+    manifest_path = os.path.join(index_dir, "manifest.json")
+    if not os.path.isfile(manifest_path):
+        return None
+    
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+            logger.info(f"Ignoring saved index with outdated format in {index_dir}")
+            return None
+        
+        # Same files as FAISS.load_local, but the index is opened through read_index so it can be mapped
+        index = read_index(os.path.join(index_dir, "index.faiss"))
+        # Only stores written by this process family are loaded, so the pickle is trusted
+        with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vector_store = FAISS(
+            embedding_function=create_embeddings(model),
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+        vector_store.index_mapped = RAG_MMAP_INDEX
+        docstore = MmapDocstore.load(index_dir, RAG_WORK_DIR)
+        if docstore is not None:
+            vector_store.docstore = docstore
+        sharded_index = ShardedIndex.load(index_dir, mmap=RAG_MMAP_INDEX)
+        if sharded_index is not None:
+            vector_store.index = sharded_index
+            vector_store.index_mapped = False
+        rerank_vectors = RerankVectors.load(index_dir, RAG_WORK_DIR)
+        if rerank_vectors is not None:
+            vector_store.rerank_vectors = rerank_vectors
+        bm25_index = BM25Index.load(index_dir, mmap=RAG_MMAP_INDEX)
+        if bm25_index is not None:
+            vector_store.bm25_index = bm25_index
+            vector_store.store_type = HYBRID_STORE_TYPE
+        sync_manifest_path = os.path.join(index_dir, SYNC_MANIFEST_FILE)
+        if os.path.isfile(sync_manifest_path):
+            with open(sync_manifest_path, "r", encoding="utf-8") as f:
+                vector_store.sync_manifest = json.load(f)
+        logger.info(f"Loaded vector store with {vector_store.index.ntotal} chunks from {index_dir}")
+        return vector_store
+    
+    except Exception as e:
+        logger.error(f"Error loading vector store from {index_dir}: {str(e)}")
+        return None
+
+class IngestCheckpoint:
+    """
+    Periodic snapshots of a store while index_pdfs streams a corpus into it.
+    
+    A snapshot is the partly built store, saved with save_vector_store,
+    plus the files whose chunks it holds in full and the one file it holds
+    only part of. resume reopens the snapshot without that partial file, so
+    an interrupted run carries on from the first file not yet done instead
+    of embedding the corpus again. Files are named by their path relative
+    to the corpus root, so same-named files in different folders are told
+    apart and a corpus uploaded again to a new directory still resumes.
+    """
+    
+    def __init__(self, checkpoint_dir: str, pdf_files: List[str], manifest: Optional[Dict] = None,
+                 interval: float = RAG_CHECKPOINT_INTERVAL):
+        self.checkpoint_dir = checkpoint_dir
+        self.pdf_files = pdf_files
+        self.manifest = dict(manifest or {})
+        self.interval = interval
+        self.completed_files: List[str] = []
+        self.resumed = False
+        folders = [os.path.dirname(os.path.abspath(pdf)) for pdf in pdf_files]
+        self._root = os.path.commonpath(folders) if folders else ""
+        self._remaining: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._position = 0
+        self._set_remaining()
+        self._gap = interval
+        self._last_save = time.time()
+    
+    def resume(self, model: str) -> Optional[FAISS]:
+        """
+        Loads the last snapshot, dropping the chunks of the file it was in the middle of.
+        
+        Args:
+            model: Embedding model of the store
+        
+        Returns:
+            The partly built store, or None if there is no usable snapshot
+        """
+        vector_store = load_vector_store(self.checkpoint_dir, model)
+        if vector_store is None:
+            return None
+        with open(os.path.join(self.checkpoint_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if "partial_paths" in saved:
+            for path in saved["partial_paths"]:
+                remove_file_from_store(vector_store, path, key="file_path")
+        else:
+            for file_name in saved.get("partial_files", []):
+                remove_file_from_store(vector_store, file_name)
+        self.completed_files = saved.get("completed_files", [])
+        self.resumed = True
+        self._set_remaining()
+        logger.info(f"Resuming from checkpoint with {vector_store.index.ntotal} chunks of "
+                    f"{len(self.completed_files)} files; {len(self._remaining)} files left")
+        return vector_store
+    
+    def _file_key(self, pdf: str) -> str:
+        """Path of a PDF relative to the corpus root, as recorded in snapshots."""
+        return os.path.relpath(os.path.abspath(pdf), self._root)
+    
+    def _set_remaining(self) -> None:
+        self._remaining = self.remaining_files()
+        # Chunks carry the streamed path as file_path
+        self._positions = {pdf: position for position, pdf in enumerate(self._remaining)}
+        self._position = 0
+    
+    def remaining_files(self) -> List[str]:
+        """PDF paths not yet fully indexed, in the order they are streamed."""
+        done = set(self.completed_files)
+        return [pdf for pdf in self.pdf_files if self._file_key(pdf) not in done]
+    
+    def track(self, metadata_list: List[Dict]) -> None:
+        """Notes the files of an indexed batch; pages arrive in file order, so earlier files are complete."""
+        for metadata in metadata_list:
+            position = self._positions.get(metadata.get("file_path"))
+            if position is not None and position > self._position:
+                self._position = position
+    
+    @property
+    def due(self) -> bool:
+        return self.interval > 0 and time.time() - self._last_save >= self._gap
+    
+    def save(self, vector_store: FAISS) -> bool:
+        """Writes a snapshot of the store, replacing the previous one."""
+        started = time.time()
+        completed = self.completed_files + [self._file_key(pdf) for pdf in self._remaining[:self._position]]
+        partial = self._remaining[self._position:self._position + 1]
+        saved = save_vector_store(vector_store, self.checkpoint_dir,
+                                  manifest=dict(self.manifest, completed_files=completed,
+                                                partial_files=[self._file_key(pdf) for pdf in partial],
+                                                partial_paths=partial))
+        took = time.time() - started
+        self._last_save = time.time()
+        # Every snapshot rewrites the whole store, so large stores are checkpointed less
+        # often to keep saving under a tenth of the run
+        self._gap = max(self.interval, 10 * took)
+        if saved:
+            logger.info(f"Checkpointed {vector_store.index.ntotal} chunks ({len(completed)} files complete) "
+                        f"in {took:.1f}s")
+        return saved
+    
+    def discard(self) -> None:
+        """Deletes the snapshot once the store it was building has been saved."""
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
 def extract_text_from_pdf(pdf_path: str) -> List[Tuple[str, Dict]]:
     """
     Extracts text from a given PDF file with metadata.
@@ -49,41 +411,52 @@ def extract_text_from_pdf(pdf_path: str) -> List[Tuple[str, Dict]]:
         logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
         return []
 
-def index_pdfs(pdf_inputs: Union[str, List[str]], chunk_size: int = 1000, chunk_overlap: int = 200, 
-               model: str = "mxbai-embed-large:latest") -> Optional[FAISS]:
+def _iter_pdf_texts(pdf_files: List[str], max_workers: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+    """Yields pages in order while later files are still being read, using the process pool for large corpora."""
+    max_workers = RAG_EXTRACT_WORKERS if max_workers is None else max_workers
+    if max_workers > 1:
+        # Counting stops at the threshold, so a large corpus is not opened twice in the parent
+        total_pages = 0
+        for pdf in pdf_files:
+            try:
+                total_pages += len(PdfReader(pdf).pages)
+            except Exception:
+                continue
+            if total_pages >= RAG_PARALLEL_EXTRACT_MIN_PAGES:
+                break
+        if total_pages >= RAG_PARALLEL_EXTRACT_MIN_PAGES:
+            yield from iter_texts_parallel(pdf_files, max_workers=max_workers)
+            return
+    
+    for pdf in pdf_files:
+        yield from extract_text_from_pdf(pdf)
+
+def _resolve_pdf_paths(pdf_inputs: Union[str, List[str]]) -> Optional[List[str]]:
     """
-    Unified function to index PDFs with hybrid storage (local FAISS vs Pinecone)
+    Expands a PDF path, list of PDF paths, or folder path into a list of PDF files.
     
     Args:
         pdf_inputs: Can be a single PDF path, a list of PDF paths, or a folder path
-        chunk_size: Size of text chunks for splitting
-        chunk_overlap: Overlap between chunks
-        model: Embedding model to use
         
     Returns:
-        Vector store (FAISS for legacy compatibility, or hybrid store)
+        List of PDF file paths, or None if the input is invalid
     """
-    all_texts_with_metadata = []
-    
-    # Process different input types
     if isinstance(pdf_inputs, str):
         if os.path.isdir(pdf_inputs):
             # It's a folder path
             logger.info(f"Indexing all PDFs in folder: {pdf_inputs}")
-            pdf_files = [os.path.join(pdf_inputs, f) for f in os.listdir(pdf_inputs) 
+            pdf_files = [os.path.join(pdf_inputs, f) for f in sorted(os.listdir(pdf_inputs))
                          if f.lower().endswith(".pdf")]
             
             if not pdf_files:
                 logger.warning(f"No PDF files found in folder: {pdf_inputs}")
                 return None
-                
-            for pdf in pdf_files:
-                all_texts_with_metadata.extend(extract_text_from_pdf(pdf))
+            return pdf_files
         
         elif os.path.isfile(pdf_inputs) and pdf_inputs.lower().endswith(".pdf"):
             # It's a single PDF file
             logger.info(f"Indexing single PDF: {pdf_inputs}")
-            all_texts_with_metadata = extract_text_from_pdf(pdf_inputs)
+            return [pdf_inputs]
         
         else:
             logger.error(f"Invalid input: {pdf_inputs} is not a PDF file or folder")
@@ -92,35 +465,109 @@ def index_pdfs(pdf_inputs: Union[str, List[str]], chunk_size: int = 1000, chunk_
     elif isinstance(pdf_inputs, list):
         # It's a list of PDF paths
         logger.info(f"Indexing {len(pdf_inputs)} PDF files")
+        pdf_files = []
         for pdf in pdf_inputs:
             if os.path.isfile(pdf) and pdf.lower().endswith(".pdf"):
-                all_texts_with_metadata.extend(extract_text_from_pdf(pdf))
+                pdf_files.append(pdf)
             else:
                 logger.warning(f"Skipping invalid file: {pdf}")
+        return pdf_files
     
     else:
         logger.error("Invalid input type. Expected a string path or list of paths")
         return None
+
+def index_pdfs(pdf_inputs: Union[str, List[str]], chunk_size: int = 1000, chunk_overlap: int = 200, 
+               model: str = "mxbai-embed-large:latest", use_cache: bool = True,
+               index_root: Optional[str] = None, extract_workers: Optional[int] = None,
+               on_batch: Optional[Callable[[FAISS, Dict], None]] = None,
+               resume: bool = True) -> Optional[FAISS]:
+    """
+    Unified function to index PDFs with hybrid storage (local FAISS vs Pinecone)
+    
+    Built stores are saved under a key derived from the PDF contents, chunking
+    parameters and embedding model. Submitting the same corpus again loads the
+    saved store instead of re-embedding every chunk. While a store is built,
+    it is checkpointed every RAG_CHECKPOINT_INTERVAL seconds next to where it
+    will be saved, so a run that crashes or is killed part way through picks
+    up from its last checkpoint when the same corpus is submitted again.
+    
+    Args:
+        pdf_inputs: Can be a single PDF path, a list of PDF paths, or a folder path
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        model: Embedding model to use
+        use_cache: Whether to load/save the store from the on-disk index cache
+        index_root: Directory holding saved stores (defaults to RAG_INDEX_DIR)
+        extract_workers: Processes for PDF extraction (defaults to RAG_EXTRACT_WORKERS; 1 = serial)
+        on_batch: Called with (vector_store, progress) after each embedded batch is searchable
+        resume: Whether to continue from a checkpoint of an interrupted run (needs use_cache)
+        
+    Returns:
+        Vector store (FAISS for legacy compatibility, or hybrid store)
+    """
+    pdf_files = _resolve_pdf_paths(pdf_inputs)
+    if not pdf_files:
+        return None
+    
+    index_dir = None
+    if use_cache:
+        try:
+            corpus_key = compute_corpus_key(pdf_files, chunk_size, chunk_overlap, model)
+            index_dir = os.path.join(index_root or RAG_INDEX_DIR, corpus_key)
+            cached_store = load_vector_store(index_dir, model)
+            if cached_store is not None:
+                logger.info(f"Reusing saved index {corpus_key} for {len(pdf_files)} PDF files")
+                return cached_store
+        except OSError as e:
+            logger.warning(f"Index cache unavailable, indexing from scratch: {str(e)}")
+            index_dir = None
+    
+    manifest = {
+        "model": model,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "files": [os.path.basename(pdf) for pdf in pdf_files],
+    }
+    checkpoint = None
+    resumed_store = None
+    if index_dir and RAG_CHECKPOINT_INTERVAL > 0:
+        checkpoint = IngestCheckpoint(index_dir + CHECKPOINT_SUFFIX, pdf_files, manifest)
+        if resume:
+            resumed_store = checkpoint.resume(model)
+        else:
+            checkpoint.discard()
+    
+    # Pages flow through extract -> split -> embed -> index without the whole
+    # corpus ever being held in memory
+    vector_store = stream_index_pdfs(checkpoint.remaining_files() if checkpoint else pdf_files,
+                                     chunk_size, chunk_overlap, model, vector_store=resumed_store,
+                                     extract_workers=extract_workers, on_batch=on_batch, checkpoint=checkpoint)
     
     # Check if we have any texts to index
-    if not all_texts_with_metadata:
+    if vector_store is None:
         logger.warning("No text content extracted from any PDFs")
         return None
     
     # Use hybrid storage if available, otherwise fall back to legacy FAISS
     if HYBRID_STORE_AVAILABLE:
-        logger.info(f"Creating hybrid vector store with {len(all_texts_with_metadata)} text segments")
-        return create_hybrid_index(all_texts_with_metadata, chunk_size, chunk_overlap, model)
-    else:
-        logger.info(f"Creating legacy FAISS index with {len(all_texts_with_metadata)} text segments")
-        return create_faiss_index(all_texts_with_metadata, chunk_size, chunk_overlap, model)
+        _attach_bm25_index(vector_store)
+    
+    if index_dir and save_vector_store(vector_store, index_dir, manifest=manifest) and checkpoint:
+        checkpoint.discard()
+    
+    return vector_store
 
 def create_hybrid_index(texts_with_metadata: List[Tuple[str, Dict]], 
                        chunk_size: int = 1000, 
                        chunk_overlap: int = 200,
                        model: str = "mxbai-embed-large:latest") -> Optional[FAISS]:
     """
-    Creates a FAISS index (hybrid functionality removed).
+    Creates a FAISS index plus a BM25 lexical index over the same chunks.
+    
+    The BM25 index is attached to the store as ``bm25_index`` and kept in
+    sync by incremental adds and removals; retrieve_answer fuses both
+    rankings with reciprocal rank fusion.
     
     Args:
         texts_with_metadata: List of tuples containing (text, metadata)
@@ -131,114 +578,1400 @@ def create_hybrid_index(texts_with_metadata: List[Tuple[str, Dict]],
     Returns:
         FAISS vector store or None if creation failed
     """
-    # Since hybrid functionality was removed, just use FAISS
-    return create_faiss_index(texts_with_metadata, chunk_size, chunk_overlap, model)
+    vector_store = create_faiss_index(texts_with_metadata, chunk_size, chunk_overlap, model)
+    if vector_store is None:
+        return None
+    
+    _attach_bm25_index(vector_store)
+    return vector_store
+
+def _attach_bm25_index(vector_store: FAISS) -> None:
+    """Builds a BM25 index over every chunk of the store and marks it as hybrid."""
+    bm25_index = BM25Index()
+    chunk_ids = [vector_store.index_to_docstore_id[row] for row in range(vector_store.index.ntotal)]
+    bm25_index.add(chunk_ids, [vector_store.docstore.search(doc_id).page_content for doc_id in chunk_ids])
+    vector_store.bm25_index = bm25_index
+    vector_store.store_type = HYBRID_STORE_TYPE
+    logger.info(f"Built BM25 index with {len(bm25_index.terms)} terms over {len(bm25_index)} chunks")
 
 def create_faiss_index(texts_with_metadata: List[Tuple[str, Dict]], 
                       chunk_size: int = 1000, 
                       chunk_overlap: int = 200,
-                      model: str = "mxbai-embed-large:latest") -> FAISS:
+                      model: str = "mxbai-embed-large:latest",
+                      index_type: str = RAG_INDEX_TYPE,
+                      compression: str = RAG_VECTOR_COMPRESSION) -> FAISS:
     """
     Creates a FAISS index from extracted text using embeddings and stores metadata.
     
+    The index type is picked from the chunk count unless forced: exact flat
+    search for small corpora, a trained IVF-Flat index for large ones, or
+    HNSW on request. With compression enabled the index holds float16, int8
+    or PQ codes, and exact float32 copies are kept on disk for re-ranking.
+    
     Args:
         texts_with_metadata: List of tuples containing (text, metadata)
         chunk_size: Size of text chunks for splitting
         chunk_overlap: Overlap between chunks
         model: Embedding model to use
+        index_type: "auto", "flat", "ivf" or "hnsw"
+        compression: "none", "fp16", "sq8" or "pq"
         
     Returns:
         FAISS vector store
     """
-    # Initialize text splitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, 
-        chunk_overlap=chunk_overlap
+    documents, metadata_list = _split_texts(texts_with_metadata, chunk_size, chunk_overlap)
+    logger.info(f"Created {len(documents)} text chunks after splitting")
+    
+    # Repeated slides and boilerplate are embedded once; copies become (file, page) references
+    documents, metadata_list = deduplicate_chunks(documents, metadata_list)
+    
+    embeddings, embedding_dim = _init_embeddings(model)
+    
+    # Embed first so approximate indexes can be trained on the corpus
+    vectors = _embed_documents(documents, embeddings, model) if documents else []
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, embedding_dim)
+    
+    # Create FAISS index
+    index = build_faiss_index(matrix, index_type, compression)
+    vector_store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=_new_docstore(),
+        index_to_docstore_id={},
     )
+    if is_compressed(index):
+        vector_store.rerank_vectors = RerankVectors.create(embedding_dim, RAG_WORK_DIR)
+    
+    # Add documents to vector store
+    _add_chunks(vector_store, documents, vectors, metadata_list)
+    logger.info(f"Successfully indexed {len(documents)} text chunks")
+    
+    if is_compressed(index) and documents:
+        report = measure_recall(index, matrix)
+        logger.info(f"Compressed index uses {report['index_bytes']} bytes vs {report['flat_bytes']} flat "
+                    f"({report['memory_saved_ratio']:.0%} saved); recall@10 {report['recall_at_k']:.3f}, "
+                    f"{report['reranked_recall_at_k']:.3f} after re-rank")
+    
+    return vector_store
+
+def _new_docstore():
+    """Creates an empty docstore of the configured kind (RAG_DOCSTORE)."""
+    if RAG_DOCSTORE == "memory":
+        return InMemoryDocstore()
+    return MmapDocstore(RAG_WORK_DIR)
+
+def _ensure_writable_index(vector_store: FAISS) -> None:
+    """Copies a memory-mapped index into memory before the store is first modified."""
+    if getattr(vector_store, "index_mapped", False):
+        vector_store.index = writable_index(vector_store.index)
+        vector_store.index_mapped = False
+        logger.info(f"Copied memory-mapped index of {vector_store.index.ntotal} vectors into memory for writing")
+
+def _add_chunks(vector_store: FAISS, documents: List[str], vectors: List[List[float]],
+                metadata_list: List[Dict], update_bm25: bool = True) -> List[str]:
+    """Adds embedded chunks to the store (and its re-rank vectors, if any), returning their ids."""
+    if not documents:
+        return []
+    _ensure_writable_index(vector_store)
+    chunk_ids = vector_store.add_embeddings(zip(documents, vectors), metadatas=metadata_list)
+    vector_store.rows_version = getattr(vector_store, "rows_version", 0) + 1
+    rerank_vectors = getattr(vector_store, "rerank_vectors", None)
+    if rerank_vectors is not None:
+        rerank_vectors.add(chunk_ids, np.asarray(vectors, dtype=np.float32))
+    bm25_index = getattr(vector_store, "bm25_index", None)
+    if bm25_index is not None and update_bm25:
+        bm25_index.add(chunk_ids, documents)
+    return chunk_ids
+
+def compression_report(vector_store: FAISS, k: int = 10) -> Optional[Dict[str, float]]:
+    """
+    Reports memory saved and recall@k of a compressed store against exact search.
+    
+    Args:
+        vector_store: Vector store built with compression enabled
+        k: Number of neighbours compared
+        
+    Returns:
+        Dict from measure_recall, or None if the store is not compressed
+    """
+    rerank_vectors = getattr(vector_store, "rerank_vectors", None)
+    if rerank_vectors is None:
+        return None
+    ordered_ids = [vector_store.index_to_docstore_id[row] for row in range(vector_store.index.ntotal)]
+    return measure_recall(vector_store.index, rerank_vectors.get(ordered_ids), k=k)
+
+class OffsetTextSplitter:
+    """
+    Recursive character splitter that works on offsets into the page text.
+    
+    Splits at the first of ``separators`` found in a span, recursing with the
+    later ones into pieces still longer than chunk_size, the way
+    RecursiveCharacterTextSplitter does. Pieces are only (start, end) pairs
+    and neighbouring pieces are merged into chunks of up to chunk_size
+    characters that overlap by up to chunk_overlap, so the text is sliced
+    once per chunk and every chunk keeps its exact offsets.
+    """
+    
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 separators: Tuple[str, ...] = ("\n\n", "\n", " ", "")):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators
+    
+    def _pieces(self, text: str, start: int, end: int, level: int, pieces: List[Tuple[int, int]]) -> None:
+        """Appends contiguous spans of at most chunk_size covering text[start:end]."""
+        if end - start <= self.chunk_size:
+            pieces.append((start, end))
+            return
+        
+        for i in range(level, len(self.separators)):
+            separator = self.separators[i]
+            if not separator:
+                # Nothing left to split on: cut hard at chunk_size
+                pieces.extend((s, min(s + self.chunk_size, end)) for s in range(start, end, self.chunk_size))
+                return
+            pos = text.find(separator, start, end)
+            if pos == -1:
+                continue
+            # Each separator stays at the start of the piece after it, so pieces tile the span
+            piece_start = start
+            while pos != -1:
+                if pos > piece_start:
+                    self._pieces(text, piece_start, pos, i + 1, pieces)
+                piece_start = pos
+                pos = text.find(separator, pos + len(separator), end)
+            self._pieces(text, piece_start, end, i + 1, pieces)
+            return
+    
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Splits text into chunk spans.
+        
+        Args:
+            text: Text to split
+            
+        Returns:
+            (start, end) offsets of each chunk, with surrounding whitespace excluded
+        """
+        pieces: List[Tuple[int, int]] = []
+        self._pieces(text, 0, len(text), 0, pieces)
+        
+        spans = []
+        window = deque()
+        
+        def emit(start: int, end: int) -> None:
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if end > start and (not spans or spans[-1] != (start, end)):
+                spans.append((start, end))
+        
+        for start, end in pieces:
+            if window and end - window[0][0] > self.chunk_size:
+                emit(window[0][0], window[-1][1])
+                # Carry the tail of the chunk, up to chunk_overlap, into the next one
+                while window and (window[-1][1] - window[0][0] > self.chunk_overlap
+                                  or end - window[0][0] > self.chunk_size):
+                    window.popleft()
+            window.append((start, end))
+        if window:
+            emit(window[0][0], window[-1][1])
+        return spans
+    
+    def split_text(self, text: str) -> List[str]:
+        """Splits text into chunk strings."""
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+def _split_page(text_splitter: RecursiveCharacterTextSplitter, text: str,
+                chunk_overlap: int) -> Iterator[Tuple[str, int]]:
+    """Splits one page with a LangChain splitter, recovering each chunk's offset in the page."""
+    index = 0
+    previous_chunk_len = 0
+    for chunk in text_splitter.split_text(text):
+        # Chunks come in page order, so search from where the previous one's overlap starts
+        index = text.find(chunk, max(0, index + previous_chunk_len - chunk_overlap))
+        previous_chunk_len = len(chunk)
+        yield chunk, index
+
+def _split_file_pages(splitter: OffsetTextSplitter, pages: List[Tuple[str, Dict]]) -> Iterator[Tuple[str, Dict]]:
+    """Splits the pages of one file as a single text, so chunks can run across page breaks."""
+    text = PAGE_BREAK.join(page_text for page_text, _ in pages)
+    page_starts = []
+    position = 0
+    for page_text, _ in pages:
+        page_starts.append(position)
+        position += len(page_text) + len(PAGE_BREAK)
     
-    # Process text chunks with metadata
+    for start, end in splitter.split_spans(text):
+        first = bisect.bisect_right(page_starts, start) - 1
+        last = bisect.bisect_right(page_starts, end - 1) - 1
+        metadata = {**pages[first][1], "start_index": start - page_starts[first]}
+        if last != first:
+            metadata["end_page_index"] = pages[last][1].get("page_index", last)
+        yield text[start:end], metadata
+
+def iter_page_chunks(pages: Iterable[Tuple[str, Dict]], chunk_size: int = 1000, chunk_overlap: int = 200,
+                     splitter: str = RAG_SPLITTER,
+                     across_pages: bool = RAG_SPLIT_ACROSS_PAGES) -> Iterator[Tuple[str, Dict]]:
+    """
+    Splits extracted pages into chunks with their page provenance.
+    
+    Each chunk's metadata is its page's metadata plus ``start_index``, the
+    chunk's character offset in that page. With across_pages, consecutive
+    pages of a file are split as one text joined by PAGE_BREAK; a chunk is
+    then attributed to the page it starts on and records ``end_page_index``
+    if it ends on a later one. A file's chunks are yielded once its last
+    page has arrived.
+    
+    Args:
+        pages: (text, metadata) pairs in file and page order
+        chunk_size: Maximum chunk length in characters
+        chunk_overlap: Characters shared by consecutive chunks
+        splitter: "offset" for OffsetTextSplitter, "langchain" for RecursiveCharacterTextSplitter
+        across_pages: Let chunks span page breaks (offset splitter only)
+        
+    Yields:
+        (chunk text, chunk metadata) pairs
+    """
+    if splitter == "langchain":
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        for text, metadata in pages:
+            for chunk, start in _split_page(text_splitter, text, chunk_overlap):
+                yield chunk, {**metadata, "start_index": start}
+        return
+    
+    offset_splitter = OffsetTextSplitter(chunk_size, chunk_overlap)
+    if not across_pages:
+        for text, metadata in pages:
+            for start, end in offset_splitter.split_spans(text):
+                yield text[start:end], {**metadata, "start_index": start}
+        return
+    
+    file_pages: List[Tuple[str, Dict]] = []
+    for text, metadata in pages:
+        if file_pages and file_pages[-1][1].get("file_name") != metadata.get("file_name"):
+            yield from _split_file_pages(offset_splitter, file_pages)
+            file_pages = []
+        file_pages.append((text, metadata))
+    if file_pages:
+        yield from _split_file_pages(offset_splitter, file_pages)
+
+def _split_texts(texts_with_metadata: List[Tuple[str, Dict]],
+                 chunk_size: int, chunk_overlap: int) -> Tuple[List[str], List[Dict]]:
+    """Splits page texts into chunks, returning the chunks and their metadata."""
     documents = []
     metadata_list = []
     
-    for text, metadata in texts_with_metadata:
-        chunks = text_splitter.split_text(text)
-        documents.extend(chunks)
-        metadata_list.extend([metadata] * len(chunks))
+    for chunk, metadata in iter_page_chunks(texts_with_metadata, chunk_size, chunk_overlap):
+        documents.append(chunk)
+        metadata_list.append(metadata)
     
-    logger.info(f"Created {len(documents)} text chunks after splitting")
+    return documents, metadata_list
+
+def create_embeddings(model: str):
+    """
+    Creates the embedding client for a model name.
     
-    # Initialize embedding model
+    Names starting with "hashed-ngram" (e.g. "hashed-ngram:256") select the
+    offline HashedNgramEmbeddings; anything else is an Ollama model.
+    """
+    if is_local_model(model):
+        return HashedNgramEmbeddings.from_model_name(model)
+    return OllamaEmbeddings(model=model)
+
+def _init_embeddings(model: str) -> Tuple[OllamaEmbeddings, int]:
+    """Creates the embedding model and probes its output dimension."""
     try:
-        embeddings = OllamaEmbeddings(model=model)
+        embeddings = create_embeddings(model)
         # Test the embedding function
         embedding_dim = len(embeddings.embed_query("test"))
         logger.info(f"Using embedding model {model} with dimension {embedding_dim}")
+        return embeddings, embedding_dim
     except Exception as e:
         logger.error(f"Error initializing embedding model: {str(e)}")
         raise
+
+def get_embedding_cache(model: str) -> Optional[EmbeddingCache]:
+    """
+    Returns the shared on-disk embedding cache for a model.
     
-    # Create FAISS index
-    index = faiss.IndexFlatL2(embedding_dim)
-    vector_store = FAISS(
-        embedding_function=embeddings,
-        index=index,
-        docstore=InMemoryDocstore(),
-        index_to_docstore_id={},
+    Args:
+        model: Embedding model name
+        
+    Returns:
+        EmbeddingCache, or None if the cache is disabled or cannot be opened
+    """
+    # Hashed n-gram vectors are cheaper to recompute than to look up
+    if RAG_EMBEDDING_CACHE_MB <= 0 or is_local_model(model):
+        return None
+    
+    with _embedding_caches_lock:
+        if model not in _embedding_caches:
+            safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in model)
+            try:
+                _embedding_caches[model] = EmbeddingCache(
+                    os.path.join(RAG_EMBEDDING_CACHE_DIR, safe_name),
+                    max_bytes=RAG_EMBEDDING_CACHE_MB * 1024 * 1024
+                )
+            except Exception as e:
+                logger.warning(f"Embedding cache unavailable for {model}: {str(e)}")
+                return None
+        return _embedding_caches[model]
+
+def _embed_batch_with_retries(embeddings, batch: List[str], max_retries: int) -> List[List[float]]:
+    """Embeds one batch, retrying with exponential backoff on backend errors."""
+    for attempt in range(max_retries + 1):
+        try:
+            return embeddings.embed_documents(batch)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 0.5 * (2 ** attempt)
+            logger.warning(f"Embedding batch failed ({str(e)}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def embed_in_batches(texts: List[str], embeddings, batch_size: int = RAG_EMBED_BATCH_SIZE,
+                     max_workers: int = RAG_EMBED_WORKERS,
+                     max_retries: int = RAG_EMBED_MAX_RETRIES) -> List[List[float]]:
+    """
+    Embeds texts in fixed-size batches with a bounded number of concurrent requests.
+    
+    Failed batches are retried on their own with exponential backoff, so one
+    transient backend error does not restart the whole corpus.
+    
+    Args:
+        texts: Chunk texts to embed
+        embeddings: Embeddings object used for each batch
+        batch_size: Number of chunks per embedding request
+        max_workers: Maximum number of batches in flight at once
+        max_retries: Retries per batch before giving up
+        
+    Returns:
+        Embeddings aligned with texts
+    """
+    if not texts:
+        return []
+    
+    batch_size = max(1, batch_size)
+    batches = [(start, texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)]
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    
+    started = time.time()
+    last_log = started
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(_embed_batch_with_retries, embeddings, batch, max_retries): (start, len(batch))
+            for start, batch in batches
+        }
+        for future in as_completed(futures):
+            start, count = futures[future]
+            vectors[start:start + count] = future.result()
+            done += count
+            if time.time() - last_log >= RAG_PROGRESS_LOG_INTERVAL:
+                last_log = time.time()
+                elapsed = max(last_log - started, 1e-6)
+                logger.info(f"Embedded {done}/{len(texts)} chunks ({done / elapsed:.1f} chunks/s)")
+    
+    elapsed = max(time.time() - started, 1e-6)
+    logger.info(f"Embedded {len(texts)} chunks in {len(batches)} batches, "
+                f"{elapsed:.1f}s ({len(texts) / elapsed:.1f} chunks/s)")
+    return vectors
+
+def _embed_documents(documents: List[str], embeddings, model: str) -> List[List[float]]:
+    """Embeds chunk texts in concurrent batches, reusing cached vectors for text seen before."""
+    cache = get_embedding_cache(model)
+    if cache is not None:
+        embeddings = CachedEmbeddings(embeddings, cache)
+    
+    vectors = embed_in_batches(documents, embeddings)
+    
+    if cache is not None:
+        logger.info(f"Embedding cache: {cache.hits} hits, {cache.misses} misses so far")
+    return vectors
+
+class _StageError:
+    """Carries an exception raised in a background pipeline stage to the consumer."""
+    
+    def __init__(self, error: BaseException):
+        self.error = error
+
+_STAGE_DONE = object()
+
+def _prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """
+    Runs an iterable in a background thread, handing items over through a bounded queue.
+    
+    The producer blocks once maxsize items are waiting, so a slow consumer
+    applies backpressure instead of letting results pile up in memory.
+    Exceptions from the producer are re-raised in the consumer, and closing
+    the returned generator stops the producer.
+    
+    Args:
+        iterable: Items to produce
+        maxsize: Maximum number of items buffered between the two threads
+        
+    Yields:
+        Items of the iterable, in order
+    """
+    items = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+    
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except BaseException as e:
+            put(_StageError(e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+    
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+def _iter_chunk_batches(pages: Iterable[Tuple[str, Dict]], chunk_size: int, chunk_overlap: int,
+                        batch_size: int = RAG_EMBED_BATCH_SIZE,
+                        deduplicator: Optional[ChunkDeduplicator] = None,
+                        duplicate_refs: Optional[Dict[int, List[Dict]]] = None) -> Iterator[Tuple[List[str], List[Dict]]]:
+    """
+    Splits pages into chunks as they arrive, yielding (documents, metadata) batches of batch_size.
+    
+    With a deduplicator, duplicate chunks are dropped and their metadata is
+    collected in duplicate_refs under the sequence number of the surviving
+    chunk (its position among all chunks yielded).
+    """
+    batch_size = max(1, batch_size)
+    documents: List[str] = []
+    metadata_list: List[Dict] = []
+    
+    for chunk, metadata in iter_page_chunks(pages, chunk_size, chunk_overlap):
+        survivor = deduplicator.check(chunk) if deduplicator is not None else None
+        if survivor is not None:
+            duplicate_refs.setdefault(survivor, []).append(metadata)
+            continue
+        documents.append(chunk)
+        metadata_list.append(metadata)
+        if len(documents) >= batch_size:
+            yield documents, metadata_list
+            documents, metadata_list = [], []
+    
+    if documents:
+        yield documents, metadata_list
+
+def _iter_embedded_batches(batches: Iterable[Tuple[List[str], List[Dict]]], embeddings,
+                           max_workers: int = RAG_EMBED_WORKERS,
+                           max_retries: int = RAG_EMBED_MAX_RETRIES) -> Iterator[Tuple[List[str], List[Dict], List[List[float]]]]:
+    """Embeds batches with up to max_workers requests in flight, yielding them in input order."""
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        try:
+            for documents, metadata_list in batches:
+                in_flight.append((documents, metadata_list,
+                                  executor.submit(_embed_batch_with_retries, embeddings, documents, max_retries)))
+                if len(in_flight) >= max(1, max_workers):
+                    documents, metadata_list, future = in_flight.popleft()
+                    yield documents, metadata_list, future.result()
+            while in_flight:
+                documents, metadata_list, future = in_flight.popleft()
+                yield documents, metadata_list, future.result()
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+
+def _finalize_index(vector_store: FAISS, index_type: str = RAG_INDEX_TYPE,
+                    compression: str = RAG_VECTOR_COMPRESSION) -> None:
+    """
+    Replaces the flat index a store was streamed into with the index type its final size calls for.
+    
+    Streaming starts with an exact flat index because IVF and compressed
+    codecs need the whole corpus to train. Once ingestion finishes, the flat
+    storage is read in place (no copy of the corpus) to train and fill the
+    chosen index; compressed stores also get their exact re-rank vectors.
+    Sharded indexes are left as they are: each shard is already searched
+    exhaustively on its own core.
+    
+    Args:
+        vector_store: Store holding a flat index
+        index_type: "auto", "flat", "ivf" or "hnsw"
+        compression: "none", "fp16", "sq8" or "pq"
+    """
+    flat_index = vector_store.index
+    num_vectors, dim = flat_index.ntotal, flat_index.d
+    if not num_vectors or not isinstance(flat_index, faiss.IndexFlat):
+        return
+    if choose_index_type(num_vectors, index_type) == "flat" and codec_spec(compression, dim, num_vectors) is None:
+        return
+    
+    # Zero-copy view of the float32 rows held by the flat index
+    vectors = faiss.rev_swig_ptr(flat_index.get_xb(), num_vectors * dim).reshape(num_vectors, dim)
+    index = build_faiss_index(vectors, index_type, compression)
+    if type(faiss.downcast_index(index)) is faiss.IndexFlatL2:
+        return
+    
+    rerank_vectors = RerankVectors.create(dim, RAG_WORK_DIR) if is_compressed(index) else None
+    block = 65536
+    for start in range(0, num_vectors, block):
+        end = min(start + block, num_vectors)
+        index.add(vectors[start:end])
+        if rerank_vectors is not None:
+            rerank_vectors.add([vector_store.index_to_docstore_id[row] for row in range(start, end)],
+                               vectors[start:end])
+    
+    vector_store.index = index
+    if rerank_vectors is not None:
+        vector_store.rerank_vectors = rerank_vectors
+    logger.info(f"Rebuilt streamed flat index as {type(faiss.downcast_index(index)).__name__} "
+                f"over {num_vectors} vectors")
+
+def stream_index_pdfs(pdf_files: List[str], chunk_size: int = 1000, chunk_overlap: int = 200,
+                      model: str = "mxbai-embed-large:latest", vector_store: Optional[FAISS] = None,
+                      extract_workers: Optional[int] = None,
+                      on_batch: Optional[Callable[[FAISS, Dict], None]] = None,
+                      checkpoint: Optional[IngestCheckpoint] = None) -> Optional[FAISS]:
+    """
+    Indexes PDFs as a pipeline of extract -> split -> embed -> index stages.
+    
+    Each stage runs concurrently and hands work to the next through a bounded
+    queue, so only a few pages and batches are in memory at any time and
+    embedding starts while later PDFs are still being read. Every embedded
+    batch is added to the store straight away; a new store is streamed into
+    an exact flat index and rebuilt as IVF or a compressed index at the end
+    if its size or the configuration calls for it.
+    
+    Args:
+        pdf_files: PDF paths to index
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        model: Embedding model to use
+        vector_store: Existing store to extend in place (a new one is created if None)
+        extract_workers: Processes for PDF extraction (defaults to RAG_EXTRACT_WORKERS; 1 = serial)
+        on_batch: Called with (vector_store, progress) after each batch is added,
+            so callers can report progress or search the partial store
+        checkpoint: Snapshots the store periodically; if it was resumed,
+            vector_store is its partly built store
+        
+    Returns:
+        The vector store, or None if no text could be extracted
+    """
+    return stream_index_pages(_iter_pdf_texts(pdf_files, extract_workers), chunk_size, chunk_overlap, model,
+                              vector_store=vector_store, on_batch=on_batch, num_files=len(pdf_files),
+                              checkpoint=checkpoint)
+
+def stream_index_pages(pages: Iterable[Tuple[str, Dict]], chunk_size: int = 1000, chunk_overlap: int = 200,
+                       model: str = "mxbai-embed-large:latest", vector_store: Optional[FAISS] = None,
+                       on_batch: Optional[Callable[[FAISS, Dict], None]] = None,
+                       num_files: Optional[int] = None,
+                       checkpoint: Optional[IngestCheckpoint] = None) -> Optional[FAISS]:
+    """
+    Runs the split -> embed -> index stages of stream_index_pdfs over already extracted pages.
+    
+    Args:
+        pages: (text, metadata) pages in file order, as produced by PDF extraction
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        model: Embedding model to use
+        vector_store: Existing store to extend in place (a new one is created if None)
+        on_batch: Called with (vector_store, progress) after each batch is added
+        num_files: Number of files the pages come from, for progress reports
+        checkpoint: Snapshots the store periodically; if it was resumed,
+            vector_store is its partly built store
+        
+    Returns:
+        The vector store, or None if the pages held no text
+    """
+    if vector_store is not None:
+        embeddings = vector_store.embedding_function
+    else:
+        embeddings, _ = _init_embeddings(model)
+    cache = get_embedding_cache(model)
+    batch_embeddings = CachedEmbeddings(embeddings, cache) if cache is not None else embeddings
+    resumed = checkpoint is not None and checkpoint.resumed
+    # A resumed checkpoint is still a new store: its flat index is rebuilt once the corpus is in
+    new_store = vector_store is None or resumed
+    deduplicator = ChunkDeduplicator()
+    duplicate_refs: Dict[int, List[Dict]] = {}
+    added_ids: List[str] = []
+    if resumed:
+        # Chunks already indexed keep their survivor numbers, so later copies of them are still dropped
+        added_ids = [vector_store.index_to_docstore_id[row] for row in range(vector_store.index.ntotal)]
+        for doc_id in added_ids:
+            deduplicator.register(vector_store.docstore.search(doc_id).page_content)
+    first_new = len(added_ids)
+    
+    progress = {"files": num_files, "pages": 0, "chunks": 0}
+    
+    def counted_pages() -> Iterator[Tuple[str, Dict]]:
+        for page in pages:
+            progress["pages"] += 1
+            yield page
+    
+    page_stage = _prefetch(counted_pages(), RAG_STREAM_PAGE_QUEUE)
+    batches = _prefetch(
+        _iter_chunk_batches(page_stage, chunk_size, chunk_overlap, deduplicator=deduplicator,
+                            duplicate_refs=duplicate_refs),
+        RAG_STREAM_BATCH_QUEUE
     )
+    started = time.time()
+    last_log = started
+    try:
+        for documents, metadata_list, vectors in _iter_embedded_batches(batches, batch_embeddings):
+            if vector_store is None:
+                dim = len(vectors[0])
+                vector_store = FAISS(
+                    embedding_function=embeddings,
+                    # On many-core machines the vectors are spread over shard processes
+                    index=ShardedIndex(dim, RAG_SHARDS) if RAG_SHARDS > 1 else faiss.IndexFlatL2(dim),
+                    docstore=_new_docstore(),
+                    index_to_docstore_id={},
+                )
+            # BM25 postings are rebuilt per add, so they are updated once at the end
+            added_ids.extend(_add_chunks(vector_store, documents, vectors, metadata_list, update_bm25=False))
+            progress["chunks"] += len(documents)
+            
+            if time.time() - last_log >= RAG_PROGRESS_LOG_INTERVAL:
+                last_log = time.time()
+                elapsed = max(last_log - started, 1e-6)
+                logger.info(f"Indexed {progress['pages']} pages, {progress['chunks']} chunks "
+                            f"({progress['pages'] / elapsed:.1f} pages/s, {progress['chunks'] / elapsed:.1f} chunks/s)")
+            if on_batch is not None:
+                on_batch(vector_store, dict(progress, elapsed=time.time() - started))
+            if checkpoint is not None:
+                checkpoint.track(metadata_list)
+                if checkpoint.due:
+                    _attach_duplicate_refs(vector_store, duplicate_refs, added_ids)
+                    checkpoint.save(vector_store)
+    finally:
+        # Closing the last stage stops every stage upstream of it
+        batches.close()
     
-    # Add documents to vector store
-    vector_store.add_texts(documents, metadatas=metadata_list)
-    logger.info(f"Successfully indexed {len(documents)} text chunks")
+    if vector_store is None:
+        return None
+    
+    if new_store:
+        _finalize_index(vector_store)
+    # Survivors may already be indexed when a later copy turns up, so references are attached at the end
+    _attach_duplicate_refs(vector_store, duplicate_refs, added_ids)
+    if deduplicator.duplicates:
+        logger.info(f"Dropped {deduplicator.duplicates} duplicate chunks before embedding")
+    bm25_index = getattr(vector_store, "bm25_index", None)
+    new_ids = added_ids[first_new:]
+    if bm25_index is not None and new_ids:
+        bm25_index.add(new_ids, [vector_store.docstore.search(doc_id).page_content for doc_id in new_ids])
     
+    elapsed = max(time.time() - started, 1e-6)
+    source = f" from {num_files} files" if num_files else ""
+    logger.info(f"Indexed {progress['pages']} pages into {progress['chunks']} chunks{source} "
+                f"in {elapsed:.1f}s ({progress['chunks'] / elapsed:.1f} chunks/s)")
+    if cache is not None:
+        logger.info(f"Embedding cache: {cache.hits} hits, {cache.misses} misses so far")
     return vector_store
 
-def retrieve_answer(query: str, vector_store, k: int = 3) -> str:
+def _attach_duplicate_refs(vector_store: FAISS, duplicate_refs: Dict[int, List[Dict]],
+                           added_ids: List[str]) -> None:
+    """Records collected duplicate locations on those survivors that are already indexed, and forgets them."""
+    for survivor in [survivor for survivor in duplicate_refs if survivor < len(added_ids)]:
+        doc_id = added_ids[survivor]
+        metadata = vector_store.docstore.search(doc_id).metadata
+        for ref in duplicate_refs.pop(survivor):
+            metadata = add_duplicate_ref(metadata, ref)
+        _set_chunk_metadata(vector_store, doc_id, metadata)
+
+def _set_chunk_metadata(vector_store: FAISS, doc_id: str, metadata: Dict) -> None:
+    """Replaces the metadata of an indexed chunk."""
+    if isinstance(vector_store.docstore, MmapDocstore):
+        vector_store.docstore.update_metadata(doc_id, metadata)
+    else:
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            doc.metadata = metadata
+
+def _chunks_with_duplicates(vector_store: FAISS) -> List[str]:
+    """Returns the ids of chunks that stand in for removed duplicates."""
+    if isinstance(vector_store.docstore, MmapDocstore):
+        return vector_store.docstore.ids_with_key(DUPLICATE_REFS_KEY)
+    return [
+        doc_id for doc_id in vector_store.index_to_docstore_id.values()
+        if DUPLICATE_REFS_KEY in getattr(vector_store.docstore.search(doc_id), "metadata", {})
+    ]
+
+def _drop_duplicate_refs(vector_store: FAISS, file_name: str, chunk_ids: List[str],
+                         key: str = "file_name") -> List[str]:
     """
-    Retrieves the most relevant documents based on the query, with metadata.
-    Works with both FAISS and hybrid vector stores.
+    Forgets duplicate references into a removed file (matched on the metadata key).
+    
+    A chunk of the removed file that also stood for copies in other files
+    is kept and re-attributed to the first of those copies instead.
+    
+    Returns:
+        The ids among chunk_ids that should actually be deleted
+    """
+    doomed = set(chunk_ids)
+    for doc_id in _chunks_with_duplicates(vector_store):
+        metadata = vector_store.docstore.search(doc_id).metadata
+        old_refs = metadata.get(DUPLICATE_REFS_KEY, [])
+        refs = [ref for ref in old_refs if ref.get(key) != file_name]
+        if doc_id in doomed:
+            if not refs:
+                continue
+            # Promote the first remaining copy to be the chunk's own location
+            metadata = dict(refs[0])
+            refs = refs[1:]
+            doomed.discard(doc_id)
+        elif len(refs) == len(old_refs):
+            continue
+        else:
+            metadata = {key: value for key, value in metadata.items() if key != DUPLICATE_REFS_KEY}
+        if refs:
+            metadata[DUPLICATE_REFS_KEY] = refs
+        _set_chunk_metadata(vector_store, doc_id, metadata)
+    return [doc_id for doc_id in chunk_ids if doc_id in doomed]
+
+def _file_chunk_ids(vector_store: FAISS, file_name: str, key: str = "file_name") -> List[str]:
+    """Returns the docstore ids of every chunk that came from the given file (matched on the metadata key)."""
+    if isinstance(vector_store.docstore, MmapDocstore):
+        return vector_store.docstore.ids_where(key, file_name)
+    chunk_ids = []
+    for doc_id in vector_store.index_to_docstore_id.values():
+        doc = vector_store.docstore.search(doc_id)
+        if getattr(doc, "metadata", {}).get(key) == file_name:
+            chunk_ids.append(doc_id)
+    return chunk_ids
+
+def _file_is_indexed(vector_store: Optional[FAISS], file_name: str, key: str = "file_name") -> bool:
+    """Whether any chunk, or any duplicate a chunk stands for, came from the given file."""
+    if not vector_store:
+        return False
+    if _file_chunk_ids(vector_store, file_name, key):
+        return True
+    return any(ref.get(key) == file_name
+               for doc_id in _chunks_with_duplicates(vector_store)
+               for ref in vector_store.docstore.search(doc_id).metadata.get(DUPLICATE_REFS_KEY, []))
+
+def _delete_chunks(vector_store: FAISS, chunk_ids: List[str]) -> None:
+    """Deletes chunks by docstore id; unlike FAISS.delete this also handles IVF and HNSW indexes."""
+    doomed = set(chunk_ids)
+    doomed_rows = [row for row, doc_id in vector_store.index_to_docstore_id.items() if doc_id in doomed]
+    
+    _ensure_writable_index(vector_store)
+    remove_rows(vector_store.index, doomed_rows)
+    vector_store.docstore.delete(chunk_ids)
+    rerank_vectors = getattr(vector_store, "rerank_vectors", None)
+    if rerank_vectors is not None:
+        rerank_vectors.remove(chunk_ids)
+    bm25_index = getattr(vector_store, "bm25_index", None)
+    if bm25_index is not None:
+        bm25_index.remove(chunk_ids)
+    
+    remaining_ids = [
+        doc_id for _, doc_id in sorted(vector_store.index_to_docstore_id.items())
+        if doc_id not in doomed
+    ]
+    vector_store.index_to_docstore_id = {row: doc_id for row, doc_id in enumerate(remaining_ids)}
+    vector_store.rows_version = getattr(vector_store, "rows_version", 0) + 1
+
+def remove_file_from_store(vector_store: FAISS, file_name: str, key: str = "file_name") -> int:
+    """
+    Deletes all chunks of a given file from a live vector store.
+    
+    Args:
+        vector_store: Vector store to modify in place
+        file_name: Base name of the PDF whose chunks should be removed, or its
+            source path with key="file_path"
+        key: Chunk metadata key to match file_name against; "file_path" leaves
+            same-named files from other folders in place
+        
+    Returns:
+        Number of chunks of the file removed (chunks that also stand for a
+        copy in another file are kept and re-attributed to that copy)
+    """
+    if not vector_store:
+        return 0
+    
+    chunk_ids = _file_chunk_ids(vector_store, file_name, key)
+    kept = 0
+    if chunk_ids:
+        doomed_ids = _drop_duplicate_refs(vector_store, file_name, chunk_ids, key)
+        kept = len(chunk_ids) - len(doomed_ids)
+        if doomed_ids:
+            _delete_chunks(vector_store, doomed_ids)
+        logger.info(f"Removed {len(chunk_ids)} chunks of {file_name} from vector store "
+                    f"({kept} kept for their copies in other files)")
+    else:
+        _drop_duplicate_refs(vector_store, file_name, [], key)
+        logger.info(f"No chunks found for {file_name}")
+    return len(chunk_ids)
+
+def add_pdfs_to_store(vector_store: Optional[FAISS], pdf_inputs: Union[str, List[str]],
+                      chunk_size: int = 1000, chunk_overlap: int = 200,
+                      model: str = "mxbai-embed-large:latest", replace_by: str = "file_name") -> Optional[FAISS]:
+    """
+    Appends PDFs to an existing vector store, embedding only the new documents.
+    
+    A PDF whose file name is already indexed replaces the old copy, so
+    re-uploading an edited file does not leave stale chunks behind.
+    
+    Args:
+        vector_store: Vector store to extend in place (a new one is built if None)
+        pdf_inputs: Can be a single PDF path, a list of PDF paths, or a folder path
+        chunk_size: Size of text chunks for splitting
+        chunk_overlap: Overlap between chunks
+        model: Embedding model to use
+        replace_by: "file_name" replaces indexed files of the same base name,
+            "file_path" only those indexed from the same path
+        
+    Returns:
+        The updated vector store, or None if nothing could be indexed
+    """
+    if vector_store is None:
+        return index_pdfs(pdf_inputs, chunk_size, chunk_overlap, model)
+    
+    pdf_files = _resolve_pdf_paths(pdf_inputs)
+    if not pdf_files:
+        return vector_store
+    
+    for file_name in {pdf if replace_by == "file_path" else os.path.basename(pdf) for pdf in pdf_files}:
+        remove_file_from_store(vector_store, file_name, replace_by)
+    
+    stream_index_pdfs(pdf_files, chunk_size, chunk_overlap, model, vector_store=vector_store)
+    
+    return vector_store
+
+def _embed_queries(vector_store: FAISS, queries: List[str]) -> np.ndarray:
+    """
+    Embeds several queries, sending all query cache misses to the model at once.
+    
+    Ollama and the offline hashed embedder embed a query exactly like a
+    document, so the misses go out as a single embed_documents request;
+    other embedding classes may prefix queries differently and are asked
+    one query at a time.
+    
+    Returns:
+        (n, d) float32 matrix of query embeddings
+    """
+    embeddings = vector_store.embedding_function
+    model = getattr(embeddings, "model", type(embeddings).__name__)
+    vectors = [query_embedding_cache.get(model, query) for query in queries]
+    missing = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+    
+    if missing:
+        if isinstance(embeddings, (OllamaEmbeddings, HashedNgramEmbeddings)):
+            fresh = embeddings.embed_documents(missing)
+        else:
+            fresh = [embeddings.embed_query(query) for query in missing]
+        fresh_by_query = dict(zip(missing, fresh))
+        for query, vector in fresh_by_query.items():
+            query_embedding_cache.put(model, query, vector)
+        vectors = [vector if vector is not None else fresh_by_query[query]
+                   for query, vector in zip(queries, vectors)]
+    
+    return np.asarray(vectors, dtype=np.float32)
+
+def _cached_docstore_rows(vector_store: FAISS, name: str, version, doc_ids) -> np.ndarray:
+    """Docstore rows of an id sequence (FAISS or BM25 row order), cached until version changes."""
+    cache = vector_store.__dict__.setdefault("_docstore_row_cache", {})
+    entry = cache.get(name)
+    if entry is None or entry[0] != version:
+        entry = cache[name] = (version, vector_store.docstore.rows_of(doc_ids()))
+    return entry[1]
+
+def _filter_masks(vector_store: FAISS, search_filter: SearchFilter) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Evaluates a filter into row masks for the FAISS index and the BM25 index.
+    
+    With the memory-mapped docstore the filter is computed on its metadata
+    code columns and mapped to index rows through a cached row table;
+    otherwise every chunk's metadata is checked.
+    
+    Returns:
+        (mask over FAISS rows, mask over BM25 rows or None without BM25)
+    """
+    num_vectors = vector_store.index.ntotal
+    bm25_index = getattr(vector_store, "bm25_index", None)
+    docstore = vector_store.docstore
+    
+    if isinstance(docstore, MmapDocstore):
+        doc_mask = search_filter.docstore_mask(docstore)
+        
+        def to_index_rows(doc_rows: np.ndarray) -> np.ndarray:
+            mask = np.zeros(len(doc_rows), dtype=bool)
+            known = doc_rows >= 0
+            mask[known] = doc_mask[doc_rows[known]]
+            return mask
+        
+        vector_rows = _cached_docstore_rows(
+            vector_store, "faiss", (num_vectors, getattr(vector_store, "rows_version", 0)),
+            lambda: [vector_store.index_to_docstore_id[row] for row in range(num_vectors)]
+        )
+        vector_mask = to_index_rows(vector_rows)
+        bm25_mask = None
+        if bm25_index is not None:
+            bm25_rows = _cached_docstore_rows(vector_store, "bm25", (len(bm25_index), bm25_index.version),
+                                              lambda: list(bm25_index.doc_ids))
+            bm25_mask = to_index_rows(bm25_rows)
+        return vector_mask, bm25_mask
+    
+    allowed = set()
+    for doc_id in vector_store.index_to_docstore_id.values():
+        doc = docstore.search(doc_id)
+        if isinstance(doc, Document) and search_filter.matches(doc.metadata):
+            allowed.add(doc_id)
+    vector_mask = np.fromiter((vector_store.index_to_docstore_id[row] in allowed for row in range(num_vectors)),
+                              dtype=bool, count=num_vectors)
+    bm25_mask = None
+    if bm25_index is not None:
+        bm25_mask = np.fromiter((doc_id in allowed for doc_id in bm25_index.doc_ids),
+                                dtype=bool, count=len(bm25_index))
+    return vector_mask, bm25_mask
+
+def _search_allowed_rows(vector_store: FAISS, query_vectors: np.ndarray, rows: np.ndarray,
+                         k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact L2 search over just the given rows, returning (distances, rows) like index.search."""
+    rerank_vectors = getattr(vector_store, "rerank_vectors", None)
+    if rerank_vectors is not None:
+        vectors = rerank_vectors.get([vector_store.index_to_docstore_id[int(row)] for row in rows])
+    else:
+        vectors = vector_store.index.reconstruct_batch(rows.astype(np.int64))
+    
+    distances = (
+        (query_vectors ** 2).sum(axis=1)[:, None]
+        + (vectors ** 2).sum(axis=1)[None, :]
+        - 2 * query_vectors @ vectors.T
+    )
+    k = min(k, len(rows))
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    top_distances = np.take_along_axis(distances, top, axis=1)
+    order = np.argsort(top_distances, axis=1)
+    return np.take_along_axis(top_distances, order, axis=1), rows[np.take_along_axis(top, order, axis=1)]
+
+def _search_vectors(vector_store: FAISS, query_vectors: np.ndarray, k: int,
+                    nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None,
+                    row_mask: Optional[np.ndarray] = None) -> List[List[Tuple[Document, float]]]:
+    """
+    Runs _search_vector_ids and looks the hits up in the docstore.
+    
+    Returns:
+        For each query, a list of (document, L2 distance) pairs
+    """
+    results = []
+    for candidates in _search_vector_ids(vector_store, query_vectors, k, nprobe, ef_search, row_mask):
+        hits = []
+        for doc_id, distance in candidates:
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                hits.append((doc, distance))
+        results.append(hits)
+    return results
+
+def _search_vector_ids(vector_store: FAISS, query_vectors: np.ndarray, k: int,
+                       nprobe: Optional[int] = None,
+                       ef_search: Optional[int] = None,
+                       row_mask: Optional[np.ndarray] = None) -> List[List[Tuple[str, float]]]:
+    """
+    Searches the store's FAISS index directly with per-query parameters.
+    
+    A row mask restricts the search inside the index. Small scopes are
+    searched exactly over just their vectors; larger ones pass an id
+    selector to FAISS, which skips all other rows while searching.
+    
+    Args:
+        vector_store: FAISS vector store to search
+        query_vectors: (n, d) matrix of query embeddings
+        k: Number of results per query
+        nprobe: IVF lists to probe
+        ef_search: HNSW candidate list size
+        row_mask: Optional boolean mask over FAISS rows that may be returned
+        
+    Returns:
+        For each query, a list of (document id, L2 distance) pairs; chunk
+        texts are not read, so fusion can pick the hits it keeps first
+    """
+    query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    rerank_vectors = getattr(vector_store, "rerank_vectors", None)
+    # Compressed indexes over-fetch candidates that are re-ranked with exact vectors
+    fetch_k = k * max(1, RAG_RERANK_FACTOR) if rerank_vectors is not None else k
+    index = vector_store.index
+    
+    selector, selectivity = None, 1.0
+    if row_mask is not None:
+        allowed_rows = np.flatnonzero(row_mask)
+        if not len(allowed_rows):
+            return [[] for _ in query_vectors]
+        selectivity = len(allowed_rows) / max(1, index.ntotal)
+    
+    # IVF cannot reconstruct rows without a direct map, so it always uses the selector
+    exact_scan = (row_mask is not None and len(allowed_rows) <= RAG_FILTER_EXACT_MAX
+                  and not isinstance(index, ShardedIndex)
+                  and (rerank_vectors is not None or faiss.try_extract_index_ivf(index) is None))
+    if exact_scan:
+        distances, rows = _search_allowed_rows(vector_store, query_vectors, allowed_rows, k)
+        rerank_vectors = None
+    elif isinstance(index, ShardedIndex):
+        # Every shard searches its part of the mask in its own process
+        distances, rows = index.search(query_vectors, fetch_k, row_mask=row_mask)
+    else:
+        if row_mask is not None:
+            # The bitmap must outlive the search that uses the selector
+            bitmap = np.packbits(row_mask, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(row_mask), faiss.swig_ptr(bitmap))
+        params = search_parameters(index, nprobe, ef_search, selector, selectivity)
+        if params is not None:
+            distances, rows = index.search(query_vectors, fetch_k, params=params)
+        else:
+            distances, rows = index.search(query_vectors, fetch_k)
+    
+    results = []
+    for query_vector, query_distances, query_rows in zip(query_vectors, distances, rows):
+        # -1 rows happen when not enough docs are returned
+        candidates = [(vector_store.index_to_docstore_id[int(row)], float(distance))
+                      for distance, row in zip(query_distances, query_rows) if row != -1]
+        
+        if rerank_vectors is not None and candidates:
+            candidate_ids = [doc_id for doc_id, _ in candidates]
+            exact = rerank_exact(query_vector[None, :], rerank_vectors.get(candidate_ids)[None, :, :])[0]
+            candidates = sorted(zip(candidate_ids, exact.tolist()), key=lambda item: item[1])
+        results.append(candidates[:k])
+    return results
+
+def _fuse_rankings(vector_store: FAISS, query: str, k: int,
+                   vector_hits: Optional[List[Tuple[str, float]]],
+                   bm25_mask: Optional[np.ndarray] = None) -> List[Tuple[Document, float]]:
+    """
+    Fuses the BM25 ranking of a query with its (document id, distance) vector hits (None in lexical mode).
+    
+    Both rankings are fused by id; only the k documents kept are read from the docstore.
+    """
+    candidates = max(k, RAG_HYBRID_CANDIDATES)
+    rankings = [[doc_id for doc_id, _ in vector_store.bm25_index.search(query, candidates, row_mask=bm25_mask)]]
+    if vector_hits is not None:
+        rankings.append([doc_id for doc_id, _ in vector_hits])
+    
+    docs = []
+    for doc_id, score in reciprocal_rank_fusion(rankings)[:k]:
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            docs.append((doc, score))
+    return docs
+
+def retrieve_hits(query: str, vector_store, k: int = 3, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None, mode: str = "hybrid",
+                  filters: Optional[Union[Dict, SearchFilter]] = None) -> List[Dict]:
+    """
+    Retrieves the most relevant chunks for a query as structured hits.
     
     Args:
         query: The search query
         vector_store: Vector store to search in (FAISS or hybrid)
         k: Number of results to return
+        nprobe: IVF lists to probe per query (IVF indexes only)
+        ef_search: HNSW search depth per query (HNSW indexes only)
+        mode: "hybrid" (BM25 + vectors), "vector" or "lexical" (BM25 only);
+            stores without a BM25 index always use vector search
+        filters: Optional SearchFilter or filter dict (see SearchFilter.from_dict)
+            restricting results to files, a page range or metadata values
         
     Returns:
-        Formatted string with search results
+        Hit dicts (content, score, score_type, file_name, page, total_pages,
+        start, end, also_in), best first; start and end are character
+        offsets in the page, or None for chunks indexed without them
     """
-    if not vector_store:
-        return "No vector store available."
-    
     logger.info(f"Searching for: '{query}'")
+    return retrieve_batch([query], vector_store, k, nprobe, ef_search, mode, filters)[0]
+
+def _federated_candidates(vector_store: FAISS, query: str, k: int, nprobe: Optional[int],
+                          ef_search: Optional[int], mode: str,
+                          search_filter: Optional[SearchFilter]) -> Tuple[List[Tuple[str, float]], List[Tuple[str, float]]]:
+    """
+    Searches one index of a federated query for the candidates to merge.
     
-    try:
-        # Handle both FAISS and hybrid vector stores
-        if hasattr(vector_store, 'similarity_search_with_score'):
-            docs = vector_store.similarity_search_with_score(query, k=k)
+    Returns:
+        (document id, L2 distance) vector candidates and (document id, BM25
+        score over the index's bound for the query, see BM25Index.max_score)
+        lexical candidates, best first; a list is empty if the mode or the
+        store does not use that search
+    """
+    vector_mask = bm25_mask = None
+    if search_filter is not None:
+        vector_mask, bm25_mask = _filter_masks(vector_store, search_filter)
+    
+    bm25_index = getattr(vector_store, "bm25_index", None)
+    fused = bm25_index is not None and mode != "vector"
+    candidates = max(k, RAG_HYBRID_CANDIDATES) if fused else k
+    vector_hits, lexical_hits = [], []
+    if not (fused and mode == "lexical"):
+        query_vectors = _embed_queries(vector_store, [query])
+        vector_hits = _search_vector_ids(vector_store, query_vectors, candidates, nprobe, ef_search,
+                                         row_mask=vector_mask)[0]
+    if fused:
+        lexical_hits = bm25_index.search(query, candidates, row_mask=bm25_mask)
+        if lexical_hits:
+            bound = bm25_index.max_score(query)
+            lexical_hits = [(doc_id, score / bound) for doc_id, score in lexical_hits]
+    return vector_hits, lexical_hits
+
+def retrieve_federated(query: str, vector_stores: Dict[str, FAISS], k: int = 3,
+                       nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                       mode: str = "hybrid",
+                       filters: Optional[Union[Dict, SearchFilter]] = None) -> List[Dict]:
+    """
+    Retrieves the most relevant chunks for a query across several named indexes.
+    
+    Each index is searched for candidates on its own thread (FAISS releases
+    the GIL while searching). The candidates are then ranked together:
+    vector candidates by their L2 distance to the query, which is
+    comparable between indexes embedded with the same model, and BM25
+    candidates by their score divided by the highest score the query can
+    reach in their own index. Raw BM25 scores are not comparable, since IDF
+    and average chunk length are per corpus; the normalized score is the
+    fraction of the query's weight in that index that a chunk matches.
+    Hybrid and lexical queries fuse these pooled rankings with one RRF pass;
+    per-index ranks are never compared, so the best chunk of a barely
+    related index does not tie with the best chunk of the relevant one.
+    
+    Args:
+        query: The search query
+        vector_stores: Index name -> FAISS vector store; empty stores are skipped
+        k: Number of results to return
+        nprobe, ef_search, mode, filters: As in retrieve_hits, applied to every index
+        
+    Returns:
+        Hit dicts as returned by retrieve_hits, best first, each with the
+        name of its "index" and its score within that index as "index_score".
+        "score" is a similarity if all candidates come from vector search
+        with one embedding model, and an RRF relevance otherwise
+        
+    Raises:
+        ValueError: If more than RAG_FEDERATED_MAX_INDEXES indexes are given
+            or a store is not a FAISS store
+    """
+    if len(vector_stores) > RAG_FEDERATED_MAX_INDEXES:
+        raise ValueError(f"At most {RAG_FEDERATED_MAX_INDEXES} indexes per query")
+    stores = {name: store for name, store in vector_stores.items() if store}
+    if not stores:
+        return []
+    if not all(isinstance(store, FAISS) for store in stores.values()):
+        raise ValueError("Federated search needs FAISS vector stores")
+    
+    start_time = time.time()
+    search_filter = SearchFilter.from_dict(filters) if isinstance(filters, dict) else filters
+    if mode != "lexical":
+        # Embed the query once per model up front; the searches find it in the query cache
+        for store in stores.values():
+            _embed_queries(store, [query])
+    
+    results: Dict[str, Tuple[List, List]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(RAG_FEDERATED_WORKERS, len(stores)))) as executor:
+        futures = {
+            executor.submit(_federated_candidates, store, query, k, nprobe, ef_search, mode, search_filter): name
+            for name, store in stores.items()
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    
+    # Candidates are keyed by (index name, document id); distances are only comparable within one model
+    vector_rankings: Dict[str, List[Tuple[float, Tuple[str, str]]]] = {}
+    lexical_ranking: List[Tuple[float, Tuple[str, str]]] = []
+    index_scores: Dict[Tuple[str, str], float] = {}
+    for name, store in stores.items():
+        vector_hits, lexical_hits = results[name]
+        embeddings = store.embedding_function
+        model = getattr(embeddings, "model", type(embeddings).__name__)
+        vector_rankings.setdefault(model, []).extend((distance, (name, doc_id)) for doc_id, distance in vector_hits)
+        lexical_ranking.extend((-score, (name, doc_id)) for doc_id, score in lexical_hits)
+        if lexical_hits:
+            own_rankings = [[doc_id for doc_id, _ in lexical_hits], [doc_id for doc_id, _ in vector_hits]]
+            index_scores.update(((name, doc_id), score) for doc_id, score in reciprocal_rank_fusion(own_rankings))
         else:
-            logger.error("Vector store does not support similarity search")
-            return "Search not supported for this vector store type."
+            index_scores.update(((name, doc_id), 1 - distance) for doc_id, distance in vector_hits)
+    
+    rankings = [ranking for ranking in vector_rankings.values() if ranking]
+    if lexical_ranking:
+        rankings.append(lexical_ranking)
+    # Stable sorts keep index order between equal scores
+    rankings = [sorted(ranking, key=lambda item: item[0]) for ranking in rankings]
+    fused = len(rankings) > 1 or bool(lexical_ranking)
+    if fused:
+        ranked = reciprocal_rank_fusion([[key for _, key in ranking] for ranking in rankings])
+    else:
+        # One model's vector candidates: rank by distance, reported as similarity like retrieve_hits
+        ranked = [(key, distance) for distance, key in rankings[0]] if rankings else []
+    
+    merged = []
+    for (name, doc_id), score in ranked:
+        doc = stores[name].docstore.search(doc_id)
+        if isinstance(doc, Document):
+            merged.append(dict(_hit_to_dict(doc, score, fused), index=name, index_score=index_scores[(name, doc_id)]))
+            if len(merged) == k:
+                break
+    logger.info(f"Federated search over {len(stores)} indexes in {time.time() - start_time:.2f}s")
+    return merged
+
+def format_hits(hits: List[Dict]) -> str:
+    """Formats hits as the numbered result list passed to the LLM."""
+    results = []
+    for i, hit in enumerate(hits):
+        score_text = f"{hit['score_type'].capitalize()}: {hit['score']:.4f}"
+        page_num = hit['page'] if hit['page'] is not None else 'Unknown'
+        total_pages = hit['total_pages'] if hit['total_pages'] is not None else 'Unknown'
         
-        if not docs:
-            return "No relevant information found."
+        location = f"File: {hit['file_name']}, Page: {page_num}/{total_pages}\n"
+        if hit.get('index'):
+            # Federated results name the index they came from
+            location = f"Index: {hit['index']}, {location}"
+        if hit['also_in']:
+            # The same passage also appears at these locations
+            also_in = ", ".join(f"{ref['file_name']} p.{ref['page']}" for ref in hit['also_in'][:5])
+            if len(hit['also_in']) > 5:
+                also_in += f" and {len(hit['also_in']) - 5} more"
+            location += f"Also in: {also_in}\n"
         
-        results = []
-        for i, (doc, score) in enumerate(docs):
-            metadata = doc.metadata if hasattr(doc, 'metadata') else {}
-            content = doc.page_content if hasattr(doc, 'page_content') else str(doc)
-            
-            # Handle different metadata formats
-            file_name = metadata.get('file_name', 'Unknown')
-            page_num = metadata.get('page_index', 0) + 1 if 'page_index' in metadata else 'Unknown'
-            total_pages = metadata.get('total_pages', 'Unknown')
-            
-            results.append(
-                f"Result {i+1} (Similarity: {1 - score:.4f}):\n"
-                f"File: {file_name}, Page: {page_num}/{total_pages}\n"
-                f"Content: {content.strip()}\n"
-            )
+        results.append(
+            f"Result {i+1} ({score_text}):\n"
+            f"{location}"
+            f"Content: {hit['content']}\n"
+        )
+    
+    return "\n".join(results)
+
+def retrieve_answer(query: str, vector_store, k: int = 3, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None, mode: str = "hybrid",
+                    filters: Optional[Union[Dict, SearchFilter]] = None) -> str:
+    """
+    Retrieves the most relevant documents based on the query, with metadata.
+    Works with both FAISS and hybrid vector stores. Takes the same arguments
+    as retrieve_hits and formats its hits with format_hits.
         
-        return "\n".join(results)
+    Returns:
+        Formatted string with search results
+    """
+    if not vector_store:
+        return "No vector store available."
+    
+    try:
+        hits = retrieve_hits(query, vector_store, k, nprobe, ef_search, mode, filters)
+        if not hits:
+            return "No relevant information found."
+        return format_hits(hits)
         
     except Exception as e:
         logger.error(f"Error during retrieval: {str(e)}")
         return f"Error retrieving information: {str(e)}"
+
+def _hit_to_dict(doc: Document, score: float, fused: bool) -> Dict:
+    """Turns a (document, score) pair into a JSON-friendly result."""
+    metadata = doc.metadata if hasattr(doc, 'metadata') else {}
+    raw = doc.page_content if hasattr(doc, 'page_content') else str(doc)
+    content = raw.strip()
+    page_index = metadata.get('page_index')
+    start = metadata.get('start_index')
+    if isinstance(start, int) and start >= 0:
+        # Offsets of the stripped content within the page text
+        start += len(raw) - len(raw.lstrip())
+        end = start + len(content)
+    else:
+        start = end = None
+    return {
+        "content": content,
+        "file_name": metadata.get('file_name', 'Unknown'),
+        "page": page_index + 1 if isinstance(page_index, int) else None,
+        "total_pages": metadata.get('total_pages'),
+        # Fused results carry an RRF relevance, vector results 1 - L2 distance
+        "score": float(score) if fused else 1 - float(score),
+        "score_type": "relevance" if fused else "similarity",
+        "start": start,
+        "end": end,
+        "also_in": [
+            {"file_name": ref.get('file_name', 'Unknown'), "page": ref.get('page_index', 0) + 1}
+            for ref in metadata.get(DUPLICATE_REFS_KEY, [])
+        ],
+    }
+
+def retrieve_batch(queries: List[str], vector_store, k: int = 3, nprobe: Optional[int] = None,
+                   ef_search: Optional[int] = None, mode: str = "hybrid",
+                   filters: Optional[Union[Dict, SearchFilter]] = None) -> List[List[Dict]]:
+    """
+    Retrieves results for many queries in one pass over the index.
+    
+    All queries are embedded with one request to the embedding model and
+    searched with a single (n, d) FAISS search, so a batch costs little
+    more than one query. BM25 and rank fusion still run per query.
+    
+    Args:
+        queries: Search queries
+        vector_store: Vector store to search in (FAISS or hybrid)
+        k: Number of results per query
+        nprobe: IVF lists to probe (IVF indexes only)
+        ef_search: HNSW search depth (HNSW indexes only)
+        mode: "hybrid", "vector" or "lexical", as in retrieve_answer
+        filters: Optional SearchFilter or filter dict applied to every query
+        
+    Returns:
+        For each query, a list of hit dicts as returned by retrieve_hits
+        
+    Raises:
+        ValueError: If more than RAG_BATCH_MAX_QUERIES queries are given or
+            the store cannot be searched
+    """
+    if len(queries) > RAG_BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {RAG_BATCH_MAX_QUERIES} queries per batch")
+    if not vector_store or not queries:
+        return [[] for _ in queries]
+    
+    start_time = time.time()
+    search_filter = SearchFilter.from_dict(filters) if isinstance(filters, dict) else filters
+    
+    if not isinstance(vector_store, FAISS):
+        if not hasattr(vector_store, 'similarity_search_with_score'):
+            raise ValueError("Search not supported for this vector store type.")
+        # Stores without a FAISS index have no batched search; query them one by one
+        return [[_hit_to_dict(doc, score, False) for doc, score in vector_store.similarity_search_with_score(query, k=k)]
+                for query in queries]
+    
+    vector_mask = bm25_mask = None
+    if search_filter is not None:
+        vector_mask, bm25_mask = _filter_masks(vector_store, search_filter)
+    
+    fused = getattr(vector_store, "bm25_index", None) is not None and mode != "vector"
+    vector_hits = [None] * len(queries)
+    if not (fused and mode == "lexical"):
+        query_vectors = _embed_queries(vector_store, queries)
+        if fused:
+            vector_hits = _search_vector_ids(vector_store, query_vectors, max(k, RAG_HYBRID_CANDIDATES),
+                                             nprobe, ef_search, row_mask=vector_mask)
+        else:
+            vector_hits = _search_vectors(vector_store, query_vectors, k, nprobe, ef_search, row_mask=vector_mask)
+    
+    results = []
+    for query, hits in zip(queries, vector_hits):
+        docs = _fuse_rankings(vector_store, query, k, hits, bm25_mask) if fused else hits
+        results.append([_hit_to_dict(doc, score, fused) for doc, score in docs])
+    
+    logger.info(f"Retrieved {len(queries)} queries in {time.time() - start_time:.2f}s")
+    return results
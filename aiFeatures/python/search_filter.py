@@ -0,0 +1,151 @@
+"""
+Metadata filters for scoped retrieval in the RAG pipeline.
+A filter restricts a search to some files, a page range and/or exact
+metadata values, and is turned into a row mask that the FAISS and BM25
+searches apply inside the index instead of post-filtering their results.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from .dedup import DUPLICATE_REFS_KEY
+from .docstore import MmapDocstore
+
+
+def _as_set(value: Any) -> Set:
+    """Accepts a single value or a list of alternatives."""
+    if isinstance(value, (list, tuple, set)):
+        return set(value)
+    return {value}
+
+
+def _contains(options: Set, value: Any) -> bool:
+    """Set membership that treats unhashable values (lists, dicts) as non-matching."""
+    try:
+        return value in options
+    except TypeError:
+        return False
+
+
+class SearchFilter:
+    """
+    Conjunction of metadata conditions.
+
+    ``file_name`` and ``page_range`` describe a location. A chunk matches
+    them if its own (file, page) does, or if any duplicate it stands for
+    (see dedup.DUPLICATE_REFS_KEY) does. A chunk running across pages
+    (``end_page_index``) matches a page range it overlaps. ``fields`` are
+    exact-match conditions on the chunk's own metadata.
+    """
+
+    def __init__(self, file_names: Optional[Iterable[str]] = None,
+                 page_range: Optional[Tuple[int, int]] = None,
+                 fields: Optional[Dict[str, Set]] = None):
+        self.file_names = set(file_names) if file_names is not None else None
+        self.page_range = page_range
+        self.fields = dict(fields or {})
+
+    @classmethod
+    def from_dict(cls, spec: Optional[Dict]) -> Optional["SearchFilter"]:
+        """
+        Parses a filter from a request body.
+
+        Example: ``{"file_name": ["ch3.pdf"], "pages": [10, 25], "metadata": {"course": "physics"}}``.
+        ``file_name`` and ``metadata`` values may be a value or a list of
+        alternatives; ``pages`` is an inclusive, 1-based page range.
+
+        Args:
+            spec: Filter dict, or None
+
+        Returns:
+            SearchFilter, or None if spec is empty
+
+        Raises:
+            ValueError: If the spec is malformed
+        """
+        if not spec:
+            return None
+        if not isinstance(spec, dict):
+            raise ValueError("filters must be an object")
+        unknown = set(spec) - {"file_name", "pages", "metadata"}
+        if unknown:
+            raise ValueError(f"Unknown filter keys: {sorted(unknown)}")
+
+        file_names = _as_set(spec["file_name"]) if spec.get("file_name") else None
+
+        page_range = None
+        if spec.get("pages") is not None:
+            pages = spec["pages"]
+            if isinstance(pages, int):
+                pages = [pages, pages]
+            if (not isinstance(pages, (list, tuple)) or len(pages) != 2
+                    or not all(isinstance(page, int) for page in pages) or pages[0] > pages[1]):
+                raise ValueError("pages must be a page number or a [first, last] range")
+            # Stored page_index values are 0-based
+            page_range = (pages[0] - 1, pages[1] - 1)
+
+        metadata = spec.get("metadata") or {}
+        if not isinstance(metadata, dict):
+            raise ValueError("metadata filter must be an object")
+        fields = {key: _as_set(value) for key, value in metadata.items()}
+
+        return cls(file_names, page_range, fields)
+
+    def _location_matches(self, metadata: Dict) -> bool:
+        if self.file_names is not None and not _contains(self.file_names, metadata.get("file_name")):
+            return False
+        if self.page_range is not None:
+            page = metadata.get("page_index")
+            end_page = metadata.get("end_page_index", page)
+            if not isinstance(end_page, int):
+                end_page = page
+            if not isinstance(page, int) or not (page <= self.page_range[1] and end_page >= self.page_range[0]):
+                return False
+        return True
+
+    def _ref_matches(self, refs: Any) -> bool:
+        return isinstance(refs, list) and any(isinstance(ref, dict) and self._location_matches(ref) for ref in refs)
+
+    def _field_matches(self, key: str, value: Any) -> bool:
+        return _contains(self.fields[key], value)
+
+    @property
+    def has_location(self) -> bool:
+        return self.file_names is not None or self.page_range is not None
+
+    def matches(self, metadata: Dict) -> bool:
+        """Evaluates the filter against one chunk's metadata."""
+        if self.has_location and not (self._location_matches(metadata)
+                                      or self._ref_matches(metadata.get(DUPLICATE_REFS_KEY))):
+            return False
+        return all(key in metadata and self._field_matches(key, metadata[key]) for key in self.fields)
+
+    def docstore_mask(self, docstore: MmapDocstore) -> np.ndarray:
+        """
+        Evaluates the filter over every row of a memory-mapped docstore.
+
+        Each condition is checked once per distinct metadata value and then
+        applied to the int32 code columns, so no Document is materialized.
+
+        Returns:
+            Boolean mask over docstore rows
+        """
+        mask = np.ones(docstore.num_rows, dtype=bool)
+        if self.has_location:
+            own = np.ones(docstore.num_rows, dtype=bool)
+            if self.file_names is not None:
+                own &= docstore.match_rows("file_name", lambda value: _contains(self.file_names, value))
+            if self.page_range is not None:
+                low, high = self.page_range
+                # The chunk's pages [page_index, end_page_index] must overlap [low, high]
+                has_end = docstore.match_rows("end_page_index", lambda value: isinstance(value, int))
+                ends_in_range = docstore.match_rows("end_page_index", lambda value: isinstance(value, int) and value >= low)
+                own &= docstore.match_rows("page_index", lambda value: isinstance(value, int) and value <= high)
+                own &= ends_in_range | (~has_end & docstore.match_rows(
+                    "page_index", lambda value: isinstance(value, int) and value >= low
+                ))
+            mask &= own | docstore.match_rows(DUPLICATE_REFS_KEY, self._ref_matches)
+        for key in self.fields:
+            mask &= docstore.match_rows(key, lambda value, key=key: self._field_matches(key, value))
+        return mask
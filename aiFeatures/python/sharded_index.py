@@ -0,0 +1,285 @@
+"""
+Multi-process sharded FAISS index for the RAG pipeline.
+Vectors are spread over worker processes that each hold a flat index of
+their own. A search is sent to every shard at once and the per-shard top-k
+lists are merged in the parent, so one query uses all cores instead of one.
+Kept free of LangChain imports so spawned worker processes start quickly.
+"""
+
+import os
+import logging
+import threading
+import weakref
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Worker processes holding index shards; 1 keeps the usual in-process index
+RAG_SHARDS = int(os.getenv("RAG_SHARDS", "1"))
+
+SHARD_FILE = "shard_{}.faiss"
+SHARD_MAP_FILE = "shards.npz"
+# Block size for reading files into the page cache ahead of their first use
+WARM_BLOCK_BYTES = 8 << 20
+
+
+def warm_page_cache(path: str) -> threading.Thread:
+    """
+    Reads a file into the OS page cache from a background thread.
+
+    A flat index maps all its codes and scans every one on the first
+    query. Faulting them in page by page is several times slower than
+    sequential reads. Reading ahead fills the shared page cache without
+    adding to this process's private memory.
+    """
+    def read_through():
+        buffer = bytearray(WARM_BLOCK_BYTES)
+        try:
+            with open(path, "rb", buffering=0) as f:
+                while f.readinto(buffer):
+                    pass
+        except OSError as e:
+            logger.warning(f"Could not pre-read {path}: {str(e)}")
+
+    thread = threading.Thread(target=read_through, name=f"warm:{os.path.basename(path)}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _shard_worker(conn, dim: int, index_path: Optional[str], mmap: bool = False) -> None:
+    """Serves one shard: a flat L2 index driven by (command, args) messages from the parent."""
+    # Parallelism comes from the shards themselves, so each one stays on a single core
+    faiss.omp_set_num_threads(1)
+    mapped = bool(index_path) and mmap
+    if index_path:
+        index = faiss.read_index(index_path, getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) if mapped else 0)
+        if mapped:
+            warm_page_cache(index_path)
+    else:
+        index = faiss.IndexFlatL2(dim)
+    while True:
+        try:
+            command, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if mapped and command in ("add", "remove"):
+                # Mapped codes are read-only; the first write copies them into this process
+                index = faiss.deserialize_index(faiss.serialize_index(index))
+                mapped = False
+            if command == "add":
+                index.add(args[0])
+                result = index.ntotal
+            elif command == "search":
+                queries, k, mask = args
+                if mask is not None:
+                    # The bitmap must outlive the search that uses the selector
+                    bitmap = np.packbits(mask, bitorder="little")
+                    selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+                    result = index.search(queries, k, params=faiss.SearchParameters(sel=selector))
+                else:
+                    result = index.search(queries, k)
+            elif command == "remove":
+                # IndexFlat shifts later rows down, keeping them in insertion order
+                index.remove_ids(args[0])
+                result = index.ntotal
+            elif command == "save":
+                faiss.write_index(index, args[0])
+                result = index.ntotal
+            elif command == "close":
+                # The parent does not wait for a reply and may already have closed its end
+                break
+            else:
+                raise ValueError(f"Unknown shard command: {command}")
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+def _stop_workers(conns: List, processes: List) -> None:
+    """Shuts shard workers down; also run when a ShardedIndex is garbage collected."""
+    for conn in conns:
+        try:
+            conn.send(("close", ()))
+            conn.close()
+        except (OSError, ValueError):
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+
+class ShardedIndex:
+    """
+    Flat L2 index whose vectors live in shard worker processes.
+
+    Implements the part of the faiss.Index interface the vector stores use
+    (``d``, ``ntotal``, ``add``, ``search``), so a LangChain FAISS store can
+    hold it in place of a local index and keep its usual add/search API.
+    Rows are numbered globally in insertion order and renumbered on removal,
+    like IndexFlat. ``row_shard`` records the shard of each row; within a
+    shard rows keep their global order, so a row's local number is its rank
+    among the rows of its shard.
+    """
+
+    def __init__(self, d: int, num_shards: int = RAG_SHARDS,
+                 row_shard: Optional[np.ndarray] = None, index_dir: Optional[str] = None, mmap: bool = False):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self.d = d
+        self.num_shards = num_shards
+        self.row_shard = np.zeros(0, dtype=np.int32) if row_shard is None else row_shard.astype(np.int32)
+        self._rebuild_maps()
+
+        context = multiprocessing.get_context("spawn")
+        self._conns = []
+        self._processes = []
+        for shard in range(num_shards):
+            index_path = os.path.join(index_dir, SHARD_FILE.format(shard)) if index_dir else None
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child_conn, d, index_path, mmap), daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        # One request at a time per pipe; concurrent searches queue here
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _stop_workers, self._conns, self._processes)
+        logger.info(f"Started {num_shards} index shard workers")
+
+    def _rebuild_maps(self) -> None:
+        """Derives each shard's global rows (its local row order) from row_shard."""
+        self._shard_rows = [np.flatnonzero(self.row_shard == shard) for shard in range(self.num_shards)]
+
+    def _call(self, requests: Dict[int, Tuple[str, tuple]]) -> Dict[int, object]:
+        """Sends one command to each listed shard, then collects all replies (shards work in parallel)."""
+        with self._lock:
+            if not self._finalizer.alive:
+                raise RuntimeError("Index shard workers are closed")
+            replies = {}
+            shard = None
+            try:
+                for shard, request in requests.items():
+                    self._conns[shard].send(request)
+                for shard in requests:
+                    replies[shard] = self._conns[shard].recv()
+            except (EOFError, OSError) as e:
+                # A dead worker takes its shard's vectors with it, so the whole index is unusable
+                self._finalizer()
+                raise RuntimeError(f"Index shard {shard} worker died ({type(e).__name__}); "
+                                   f"shard workers were shut down") from e
+        errors = [f"shard {shard}: {result}" for shard, (ok, result) in replies.items() if not ok]
+        if errors:
+            raise RuntimeError("Index shard failed: " + "; ".join(errors))
+        return {shard: result for shard, (_, result) in replies.items()}
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.row_shard)
+
+    def add(self, x: np.ndarray) -> None:
+        """Adds vectors, dealing them round-robin over the shards."""
+        x = np.ascontiguousarray(x, dtype=np.float32).reshape(-1, self.d)
+        if not len(x):
+            return
+        shards = ((self.ntotal + np.arange(len(x))) % self.num_shards).astype(np.int32)
+        self._call({
+            shard: ("add", (np.ascontiguousarray(x[shards == shard]),))
+            for shard in range(self.num_shards) if np.any(shards == shard)
+        })
+        new_rows = self.ntotal + np.arange(len(x))
+        self.row_shard = np.concatenate([self.row_shard, shards])
+        # New rows come after all existing ones, so they extend each shard's row list in order
+        self._shard_rows = [np.concatenate([rows, new_rows[shards == shard]])
+                            for shard, rows in enumerate(self._shard_rows)]
+
+    def search(self, x: np.ndarray, k: int, params=None,
+               row_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches every shard and merges their results.
+
+        Args:
+            x: (n, d) query vectors
+            k: Results per query
+            params: Accepted for faiss.Index compatibility; shards search exhaustively
+            row_mask: Optional boolean mask over global rows that may be returned
+
+        Returns:
+            (distances, rows) arrays of shape (n, k), padded with inf and -1
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32).reshape(-1, self.d)
+        requests = {}
+        for shard, rows in enumerate(self._shard_rows):
+            mask = row_mask[rows] if row_mask is not None else None
+            if len(rows) and (mask is None or mask.any()):
+                requests[shard] = ("search", (x, k, mask))
+
+        all_distances = [np.full((len(x), k), np.inf, dtype=np.float32)]
+        all_rows = [np.full((len(x), k), -1, dtype=np.int64)]
+        for shard, (distances, local_rows) in self._call(requests).items():
+            found = local_rows >= 0
+            all_distances.append(np.where(found, distances, np.inf).astype(np.float32))
+            all_rows.append(np.where(found, self._shard_rows[shard][np.maximum(local_rows, 0)], -1))
+
+        distances = np.concatenate(all_distances, axis=1)
+        rows = np.concatenate(all_rows, axis=1)
+        top = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, top, axis=1), np.take_along_axis(rows, top, axis=1)
+
+    def remove_rows(self, rows) -> None:
+        """Removes vectors by global row and renumbers the survivors to 0..n-1 in order."""
+        rows = np.unique(np.asarray(list(rows), dtype=np.int64))
+        if rows.size == 0:
+            return
+        keep = np.ones(self.ntotal, dtype=bool)
+        keep[rows] = False
+
+        requests = {}
+        for shard, shard_rows in enumerate(self._shard_rows):
+            local_rows = np.flatnonzero(~keep[shard_rows]).astype(np.int64)
+            if len(local_rows):
+                requests[shard] = ("remove", (local_rows,))
+        self._call(requests)
+        self.row_shard = self.row_shard[keep]
+        self._rebuild_maps()
+
+    def resident_bytes(self) -> int:
+        """Memory held by the shard workers' vectors."""
+        return self.ntotal * self.d * 4
+
+    def save(self, index_dir: str) -> None:
+        """Writes every shard's index plus the row-to-shard map into index_dir."""
+        self._call({shard: ("save", (os.path.join(index_dir, SHARD_FILE.format(shard)),))
+                    for shard in range(self.num_shards)})
+        np.savez(os.path.join(index_dir, SHARD_MAP_FILE), row_shard=self.row_shard,
+                 d=np.int64(self.d), num_shards=np.int64(self.num_shards))
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = False) -> Optional["ShardedIndex"]:
+        """
+        Starts shard workers on an index saved by save.
+
+        Args:
+            index_dir: Directory of the saved store
+            mmap: Whether workers memory-map their shard files instead of reading them
+
+        Returns:
+            ShardedIndex, or None if the store was saved without shards
+        """
+        map_path = os.path.join(index_dir, SHARD_MAP_FILE)
+        if not os.path.isfile(map_path):
+            return None
+        with np.load(map_path) as data:
+            return cls(int(data["d"]), int(data["num_shards"]), row_shard=data["row_shard"], index_dir=index_dir,
+                       mmap=mmap)
+
+    def close(self) -> None:
+        """Stops the shard workers."""
+        self._finalizer()
@@ -0,0 +1,225 @@
+"""
+Per-workspace vector store registry for the RAG pipeline.
+Each session or workspace id owns its own store. Stores share a total memory
+budget: when it is exceeded the least recently used idle stores are saved to
+disk and dropped from memory, and they are loaded again on their next use.
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_community.vectorstores import FAISS
+
+from .docstore import MmapDocstore
+from .rag_pipeline import RAG_CACHE_DIR, load_vector_store, save_vector_store
+from .vector_index import index_resident_bytes
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Total memory allowed for resident stores across all workspaces
+RAG_STORE_MEMORY_MB = int(os.getenv("RAG_STORE_MEMORY_MB", "2048"))
+# Where evicted stores are kept until their next use
+RAG_WORKSPACE_DIR = os.path.join(RAG_CACHE_DIR, "workspaces")
+# Rough per-chunk overhead of the Document object, its metadata and id mappings
+CHUNK_OVERHEAD_BYTES = 512
+
+
+def estimate_store_bytes(vector_store: FAISS) -> int:
+    """
+    Estimates the resident memory of a vector store.
+
+    Counts the index codes, the chunk texts plus a fixed per-chunk overhead,
+    and the BM25 postings. Re-rank vectors and memory-mapped docstore files
+    are not counted.
+
+    Args:
+        vector_store: Store to measure
+
+    Returns:
+        Approximate size in bytes
+    """
+    total = index_resident_bytes(vector_store.index)
+    if isinstance(vector_store.docstore, MmapDocstore):
+        total += vector_store.docstore.memory_bytes()
+    else:
+        documents = getattr(vector_store.docstore, "_dict", {})
+        total += sum(len(doc.page_content) for doc in documents.values())
+        total += CHUNK_OVERHEAD_BYTES * len(documents)
+    bm25_index = getattr(vector_store, "bm25_index", None)
+    if bm25_index is not None:
+        total += bm25_index.post_rows.nbytes + bm25_index.post_tf.nbytes + bm25_index.offsets.nbytes
+    return int(total)
+
+
+class _Workspace:
+    """Registry slot for one workspace: its store (None while on disk) and bookkeeping."""
+
+    def __init__(self, workspace_id: str, spill_dir: str):
+        self.workspace_id = workspace_id
+        self.spill_dir = spill_dir
+        self.vector_store: Optional[FAISS] = None
+        self.model: Optional[str] = None
+        self.size_bytes = 0
+        # True while the in-memory store has changes not yet written to spill_dir
+        self.dirty = False
+        self.lock = threading.RLock()
+
+
+class VectorStoreRegistry:
+    """
+    Thread-safe map of workspace id to vector store with LRU eviction to disk.
+
+    Use ``lock(workspace_id)`` around read-modify-write sequences such as
+    adding documents; eviction skips workspaces whose lock is held.
+    """
+
+    def __init__(self, memory_budget_bytes: int = RAG_STORE_MEMORY_MB * 1024 * 1024,
+                 spill_root: str = RAG_WORKSPACE_DIR,
+                 default_model: str = "mxbai-embed-large:latest"):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spill_root = spill_root
+        self.default_model = default_model
+        self.evictions = 0
+        self.reloads = 0
+        self._workspaces: "OrderedDict[str, _Workspace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _spill_dir(self, workspace_id: str) -> str:
+        safe_id = hashlib.sha256(workspace_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.spill_root, safe_id)
+
+    def _slot(self, workspace_id: str, create: bool = False) -> Optional[_Workspace]:
+        """Returns the workspace slot and marks it most recently used."""
+        with self._lock:
+            slot = self._workspaces.get(workspace_id)
+            if slot is None and create:
+                slot = _Workspace(workspace_id, self._spill_dir(workspace_id))
+                self._workspaces[workspace_id] = slot
+            if slot is not None:
+                self._workspaces.move_to_end(workspace_id)
+            return slot
+
+    def lock(self, workspace_id: str) -> threading.RLock:
+        """Returns the lock serializing updates of one workspace's store."""
+        return self._slot(workspace_id, create=True).lock
+
+    def get(self, workspace_id: str) -> Optional[FAISS]:
+        """
+        Returns a workspace's store, loading it back from disk if it was evicted.
+
+        Args:
+            workspace_id: Session or workspace id
+
+        Returns:
+            The vector store, or None if the workspace has none
+        """
+        slot = self._slot(workspace_id)
+        if slot is None:
+            return None
+
+        with slot.lock:
+            if slot.vector_store is None and slot.model is not None:
+                slot.vector_store = load_vector_store(slot.spill_dir, slot.model)
+                if slot.vector_store is None:
+                    logger.warning(f"Saved store for workspace {workspace_id} could not be loaded")
+                    slot.model = None
+                    return None
+                slot.size_bytes = estimate_store_bytes(slot.vector_store)
+                slot.dirty = False
+                self.reloads += 1
+                logger.info(f"Reloaded store for workspace {workspace_id} ({slot.size_bytes} bytes)")
+            vector_store = slot.vector_store
+
+        if vector_store is not None:
+            self._evict_over_budget(keep=workspace_id)
+        return vector_store
+
+    def put(self, workspace_id: str, vector_store: Optional[FAISS]) -> None:
+        """
+        Sets a workspace's store, or clears it when vector_store is None.
+
+        Call again after modifying a store in place so its size is re-measured.
+
+        Args:
+            workspace_id: Session or workspace id
+            vector_store: Store to hold for the workspace
+        """
+        if vector_store is None:
+            self.remove(workspace_id)
+            return
+
+        slot = self._slot(workspace_id, create=True)
+        with slot.lock:
+            slot.vector_store = vector_store
+            slot.model = getattr(vector_store.embedding_function, "model", None) or self.default_model
+            slot.size_bytes = estimate_store_bytes(vector_store)
+            slot.dirty = True
+        self._evict_over_budget(keep=workspace_id)
+
+    def remove(self, workspace_id: str) -> bool:
+        """Drops a workspace's store from memory and disk; returns True if it had one."""
+        with self._lock:
+            slot = self._workspaces.pop(workspace_id, None)
+        if slot is None:
+            return False
+        with slot.lock:
+            had_store = slot.vector_store is not None or slot.model is not None
+            slot.vector_store = None
+            slot.model = None
+            shutil.rmtree(slot.spill_dir, ignore_errors=True)
+        return had_store
+
+    def _evict_over_budget(self, keep: Optional[str] = None) -> None:
+        """Spills least recently used idle stores to disk until resident stores fit the budget."""
+        with self._lock:
+            resident = [slot for slot in self._workspaces.values() if slot.vector_store is not None]
+        total = sum(slot.size_bytes for slot in resident)
+
+        for slot in resident:
+            if total <= self.memory_budget_bytes:
+                break
+            if slot.workspace_id == keep:
+                continue
+            # A workspace being updated or reloaded right now is not idle
+            if not slot.lock.acquire(blocking=False):
+                continue
+            try:
+                if slot.vector_store is None:
+                    continue
+                if slot.dirty and not save_vector_store(slot.vector_store, slot.spill_dir,
+                                                        manifest={"workspace_id": slot.workspace_id,
+                                                                  "model": slot.model}):
+                    continue
+                slot.vector_store = None
+                slot.dirty = False
+                total -= slot.size_bytes
+                self.evictions += 1
+                logger.info(f"Evicted store for workspace {slot.workspace_id} to disk ({slot.size_bytes} bytes)")
+            finally:
+                slot.lock.release()
+
+    def workspaces(self) -> List[str]:
+        """Returns the ids of all workspaces that have a store, in memory or on disk."""
+        with self._lock:
+            return [ws for ws, slot in self._workspaces.items()
+                    if slot.vector_store is not None or slot.model is not None]
+
+    def stats(self) -> Dict[str, int]:
+        """Returns workspace counts, resident bytes and eviction counters."""
+        with self._lock:
+            slots = list(self._workspaces.values())
+        resident = [slot for slot in slots if slot.vector_store is not None]
+        return {
+            "workspaces": sum(1 for slot in slots if slot.vector_store is not None or slot.model is not None),
+            "resident": len(resident),
+            "resident_bytes": sum(slot.size_bytes for slot in resident),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+        }
@@ -0,0 +1,501 @@
+"""
+FAISS index construction for the RAG pipeline.
+Chooses between exact and approximate (IVF / HNSW) indexes from the corpus
+size, optionally compresses the stored vectors (float16 / int8 / PQ), trains
+the index, and builds per-query search parameters.
+"""
+
+import os
+import json
+import math
+import uuid
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from .sharded_index import ShardedIndex, warm_page_cache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# "auto" picks from the corpus size; "flat", "ivf" and "hnsw" force a type
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+# Corpora up to this many chunks use exact flat search
+RAG_FLAT_MAX_VECTORS = int(os.getenv("RAG_FLAT_MAX_VECTORS", "50000"))
+
+# Vector codec for the coarse search: "none", "fp16", "sq8" or "pq"
+RAG_VECTOR_COMPRESSION = os.getenv("RAG_VECTOR_COMPRESSION", "none")
+# Compressed indexes fetch k * factor candidates and re-rank them exactly
+RAG_RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+
+# Open saved indexes with their vector codes memory-mapped: pages are read
+# on first use and shared by every process that maps the same file
+RAG_MMAP_INDEX = os.getenv("RAG_MMAP_INDEX", "1") == "1"
+# Zero-copy mapping of flat, SQ, PQ, IVF and HNSW codes (older FAISS releases only map IVF lists)
+_MMAP_READ_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+
+
+def choose_index_type(num_vectors: int, index_type: str = RAG_INDEX_TYPE) -> str:
+    """
+    Resolves the index type to build for a corpus.
+
+    Args:
+        num_vectors: Number of vectors that will be indexed
+        index_type: "auto", "flat", "ivf" or "hnsw"
+
+    Returns:
+        Concrete index type ("flat", "ivf" or "hnsw")
+    """
+    if index_type != "auto":
+        return index_type
+    # IVF rather than HNSW for large corpora: documents can be removed without a rebuild
+    return "flat" if num_vectors <= RAG_FLAT_MAX_VECTORS else "ivf"
+
+
+def ivf_nlist(num_vectors: int) -> int:
+    """Number of IVF lists for a corpus (about 4 * sqrt(n))."""
+    return int(min(65536, max(16, 4 * math.sqrt(max(num_vectors, 1)))))
+
+
+def default_nprobe(nlist: int) -> int:
+    """Lists probed per query when the caller does not specify nprobe."""
+    return int(min(128, max(8, nlist // 32)))
+
+
+def pq_subquantizers(dim: int) -> int:
+    """Number of PQ sub-quantizers: the largest divisor of dim up to dim / 16 (one byte each)."""
+    target = max(1, dim // 16)
+    return max(m for m in range(1, target + 1) if dim % m == 0)
+
+
+def codec_spec(compression: str, dim: int, num_vectors: int) -> Optional[str]:
+    """
+    Maps a compression name to a FAISS index_factory codec string.
+
+    Args:
+        compression: "none", "fp16", "sq8" or "pq"
+        dim: Vector dimension
+        num_vectors: Corpus size (PQ needs at least 256 training vectors)
+
+    Returns:
+        Codec string such as "SQ8", or None for uncompressed float32 storage
+    """
+    if compression == "fp16":
+        return "SQfp16"
+    if compression == "sq8":
+        return "SQ8"
+    if compression == "pq":
+        if num_vectors < 256:
+            logger.warning(f"Too few vectors ({num_vectors}) to train PQ; using int8 scalar quantization")
+            return "SQ8"
+        return f"PQ{pq_subquantizers(dim)}"
+    return None
+
+
+def is_compressed(index: faiss.Index) -> bool:
+    """Whether the index stores lossy codes instead of raw float32 vectors."""
+    concrete = faiss.downcast_index(index)
+    if isinstance(concrete, faiss.IndexHNSW):
+        concrete = faiss.downcast_index(concrete.storage)
+    ivf = faiss.try_extract_index_ivf(concrete)
+    if ivf is not None:
+        return not isinstance(ivf, faiss.IndexIVFFlat)
+    return not isinstance(concrete, faiss.IndexFlat)
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = RAG_INDEX_TYPE,
+                      compression: str = RAG_VECTOR_COMPRESSION) -> faiss.Index:
+    """
+    Creates and, if needed, trains an empty L2 index suited to the given vectors.
+
+    The vectors are only used for dimension and training; callers add them
+    afterwards (for example through FAISS.add_embeddings).
+
+    Args:
+        vectors: (n, d) float32 matrix of the corpus embeddings
+        index_type: "auto", "flat", "ivf" or "hnsw"
+        compression: "none", "fp16", "sq8" or "pq"
+
+    Returns:
+        Empty, trained FAISS index
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    resolved = choose_index_type(num_vectors, index_type)
+
+    codec = codec_spec(compression, dim, num_vectors)
+    if codec is not None:
+        if resolved == "hnsw":
+            spec = f"HNSW{HNSW_M},{codec}"
+        elif resolved == "ivf" and num_vectors >= ivf_nlist(num_vectors):
+            spec = f"IVF{ivf_nlist(num_vectors)},{codec}"
+        else:
+            spec = codec
+        index = faiss.index_factory(dim, spec)
+        train_index(index, vectors)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = default_nprobe(ivf.nlist)
+        if isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+            hnsw_index = faiss.downcast_index(index)
+            hnsw_index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            hnsw_index.hnsw.efSearch = HNSW_EF_SEARCH
+        logger.info(f"Using compressed index {spec} for {num_vectors} vectors")
+        return index
+
+    if resolved == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        logger.info(f"Using HNSW index (M={HNSW_M}) for {num_vectors} vectors")
+        return index
+
+    if resolved == "ivf":
+        nlist = ivf_nlist(num_vectors)
+        if num_vectors < nlist:
+            logger.warning(f"Too few vectors ({num_vectors}) to train IVF; using flat index")
+            return faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        train_index(index, vectors)
+        index.nprobe = default_nprobe(nlist)
+        logger.info(f"Using IVF-Flat index (nlist={nlist}, nprobe={index.nprobe}) for {num_vectors} vectors")
+        return index
+
+    return faiss.IndexFlatL2(dim)
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray, max_points_per_list: int = 64,
+                max_points: int = 100000) -> None:
+    """Trains an index on a random sample of the corpus if it needs training."""
+    if index.is_trained:
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    sample_size = min(len(vectors), max_points)
+    if ivf is not None:
+        sample_size = min(len(vectors), ivf.nlist * max_points_per_list)
+    if sample_size < len(vectors):
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    else:
+        sample = vectors
+    logger.info(f"Training index on {len(sample)} vectors")
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+
+def remove_rows(index: faiss.Index, rows) -> None:
+    """
+    Removes vectors by row and renumbers the survivors to 0..n-1 in order.
+
+    This matches what IndexFlat.remove_ids does and what FAISS.delete
+    assumes for index_to_docstore_id. IVF indexes keep their original labels
+    on removal, so the inverted lists are relabelled in place; HNSW graphs
+    cannot remove vectors and are rebuilt from the remaining ones. Sharded
+    indexes remove the rows inside their workers.
+
+    Args:
+        index: Index to modify in place
+        rows: Row numbers to remove
+    """
+    if isinstance(index, ShardedIndex):
+        index.remove_rows(rows)
+        return
+    rows = np.unique(np.asarray(list(rows), dtype=np.int64))
+    if rows.size == 0:
+        return
+    ntotal = index.ntotal
+    keep = np.ones(ntotal, dtype=bool)
+    keep[rows] = False
+
+    concrete = faiss.downcast_index(index)
+    if isinstance(concrete, faiss.IndexHNSW):
+        logger.warning(f"Rebuilding HNSW index without {rows.size} removed vectors")
+        kept_vectors = concrete.reconstruct_n(0, ntotal)[keep]
+        concrete.reset()
+        if len(kept_vectors):
+            concrete.add(kept_vectors)
+        return
+
+    index.remove_ids(rows)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return
+
+    new_labels = np.cumsum(keep, dtype=np.int64) - 1
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size == 0:
+            continue
+        ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+        ids[:] = new_labels[ids]
+
+
+def search_parameters(index: faiss.Index, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None, selector: Optional[faiss.IDSelector] = None,
+                      selectivity: float = 1.0) -> Optional[faiss.SearchParameters]:
+    """
+    Builds per-query search parameters without mutating the shared index.
+
+    With an id selector, the search only visits the selected rows. IVF probes
+    and the HNSW candidate list are widened by 1 / selectivity, so a narrow
+    filter still finds k matches instead of coming back short.
+
+    Args:
+        index: Index that will be searched
+        nprobe: IVF lists to probe (ignored for non-IVF indexes)
+        ef_search: HNSW candidate list size (ignored for non-HNSW indexes)
+        selector: Optional faiss.IDSelector restricting the searched rows
+        selectivity: Fraction of rows the selector accepts
+
+    Returns:
+        SearchParameters to pass to index.search, or None for defaults
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    hnsw_index = faiss.downcast_index(index)
+    widen = 1.0 / max(selectivity, 1e-6) if selector is not None else 1.0
+
+    if ivf is not None and (nprobe or selector is not None):
+        probes = min(ivf.nlist, math.ceil(int(nprobe or ivf.nprobe) * widen))
+        return faiss.SearchParametersIVF(sel=selector, nprobe=probes)
+    if isinstance(hnsw_index, faiss.IndexHNSW) and (ef_search or selector is not None):
+        ef = int(ef_search or hnsw_index.hnsw.efSearch)
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=min(max(ef, 1024), math.ceil(ef * widen)))
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """Approximate in-RAM size of an index (its serialized size)."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def index_resident_bytes(index: faiss.Index) -> int:
+    """Cheap estimate of an index's in-RAM size from its code size, without serializing it."""
+    if isinstance(index, ShardedIndex):
+        return index.resident_bytes()
+    index = faiss.downcast_index(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # Codes plus one int64 id per vector, plus the coarse centroids
+        return int(ivf.ntotal * (ivf.code_size + 8) + ivf.nlist * ivf.d * 4)
+    if isinstance(index, faiss.IndexHNSW):
+        # Stored vectors plus roughly 2 * M int32 neighbour links per vector on level 0
+        storage = faiss.downcast_index(index.storage)
+        return int(index.ntotal * (storage.code_size + 2 * HNSW_M * 4))
+    if isinstance(index, faiss.IndexFlatCodes):
+        return int(index.ntotal * index.code_size)
+    return index_memory_bytes(index)
+
+
+def read_index(path: str, mmap: bool = RAG_MMAP_INDEX) -> faiss.Index:
+    """
+    Reads a saved FAISS index, memory-mapping its vector codes if mmap is set.
+
+    A mapped index is read-only: FAISS aborts the process on an add or
+    remove, so pass it through writable_index before modifying it.
+    Indexes searched exhaustively (flat, SQ, PQ) have their file read
+    into the page cache in the background, since their first query
+    touches every page anyway; IVF and HNSW pages load as queries reach them.
+    """
+    index = faiss.read_index(path, _MMAP_READ_FLAG if mmap else 0)
+    if mmap and isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes):
+        warm_page_cache(path)
+    return index
+
+
+def writable_index(index: faiss.Index) -> faiss.Index:
+    """Copies an index (e.g. a memory-mapped one) into process memory so it can be modified."""
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+class RerankVectors:
+    """
+    Exact float32 copies of indexed vectors, kept on disk for re-ranking.
+
+    Rows are appended to a flat file and read through a memory map, so only
+    the candidates being re-ranked are paged in. Rows are addressed by
+    docstore id; removed ids are dropped from the mapping and their rows are
+    compacted away when the store is saved.
+
+    Vectors loaded from a saved index are mapped as soon as they are opened,
+    and saves replace files instead of rewriting them. A loaded instance
+    therefore keeps reading the rows it was opened with, even after its
+    store is saved again into the same directory.
+    """
+
+    FILE_NAME = "rerank_vectors.f32"
+    IDS_FILE_NAME = "rerank_ids.json"
+
+    def __init__(self, dim: int, path: str, work_dir: str, ids: Optional[List[Optional[str]]] = None,
+                 owned: bool = True):
+        self.dim = dim
+        self.path = path
+        self.work_dir = work_dir
+        self._ids: List[Optional[str]] = list(ids or [])
+        self._row_of: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(self._ids) if doc_id is not None}
+        # Owned files are private working copies; others belong to a saved index and are copied before writing
+        self._owned = owned
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, dim: int, work_dir: str) -> "RerankVectors":
+        """Creates an empty store backed by a new working file in work_dir."""
+        os.makedirs(work_dir, exist_ok=True)
+        path = os.path.join(work_dir, f"{uuid.uuid4().hex}.f32")
+        open(path, "wb").close()
+        return cls(dim, path, work_dir)
+
+    @classmethod
+    def load(cls, index_dir: str, work_dir: str) -> Optional["RerankVectors"]:
+        """Opens the vectors saved in index_dir read-only, or returns None if there are none."""
+        ids_path = os.path.join(index_dir, cls.IDS_FILE_NAME)
+        if not os.path.isfile(ids_path):
+            return None
+        with open(ids_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        vectors = cls(saved["dim"], os.path.join(index_dir, cls.FILE_NAME), work_dir, saved["ids"], owned=False)
+        with vectors._lock:
+            vectors._matrix()
+        return vectors
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def __del__(self):
+        try:
+            if self._owned and os.path.isfile(self.path):
+                self._mmap = None
+                os.remove(self.path)
+        except Exception:
+            pass
+
+    def _matrix(self) -> np.ndarray:
+        """Memory map over all rows written so far (caller holds the lock)."""
+        if self._mmap is None or self._mmap.shape[0] != len(self._ids):
+            if not self._ids:
+                return np.empty((0, self.dim), dtype=np.float32)
+            self._mmap = np.memmap(self.path, dtype=np.float32, mode="r", shape=(len(self._ids), self.dim))
+        return self._mmap
+
+    def add(self, ids: List[str], vectors: np.ndarray) -> None:
+        """Appends exact vectors for newly indexed chunks."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            if not self._owned:
+                # Copied from the mapping, since the saved file may have been replaced since it was opened
+                os.makedirs(self.work_dir, exist_ok=True)
+                work_path = os.path.join(self.work_dir, f"{uuid.uuid4().hex}.f32")
+                with open(work_path, "wb") as f:
+                    self._write_rows(f, range(len(self._ids)))
+                self.path, self._owned, self._mmap = work_path, True, None
+            with open(self.path, "ab") as f:
+                f.write(vectors.tobytes())
+            for doc_id in ids:
+                self._row_of[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+
+    def remove(self, ids: List[str]) -> None:
+        """Forgets the vectors of removed chunks."""
+        with self._lock:
+            for doc_id in ids:
+                row = self._row_of.pop(doc_id, None)
+                if row is not None:
+                    self._ids[row] = None
+
+    def get(self, ids: List[str]) -> np.ndarray:
+        """Returns the exact vectors for the given docstore ids as an (n, d) matrix."""
+        with self._lock:
+            rows = [self._row_of[doc_id] for doc_id in ids]
+            return np.asarray(self._matrix()[rows], dtype=np.float32)
+
+    def _write_rows(self, f, rows) -> None:
+        """Writes the given rows to an open file in blocks (caller holds the lock)."""
+        rows = list(rows)
+        matrix = self._matrix()
+        for start in range(0, len(rows), 4096):
+            f.write(np.ascontiguousarray(matrix[rows[start:start + 4096]], dtype=np.float32).tobytes())
+
+    def save(self, index_dir: str) -> None:
+        """Writes the live rows, compacted, into index_dir."""
+        with self._lock:
+            live = [(row, doc_id) for row, doc_id in enumerate(self._ids) if doc_id is not None]
+            # New files replace the old ones, so a mapping of the old file (possibly this one's) stays valid
+            path = os.path.join(index_dir, self.FILE_NAME)
+            with open(path + ".tmp", "wb") as f:
+                self._write_rows(f, [row for row, _ in live])
+            os.replace(path + ".tmp", path)
+            ids_path = os.path.join(index_dir, self.IDS_FILE_NAME)
+            with open(ids_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "ids": [doc_id for _, doc_id in live]}, f)
+            os.replace(ids_path + ".tmp", ids_path)
+
+
+def rerank_exact(query_vectors: np.ndarray, candidate_vectors: np.ndarray) -> np.ndarray:
+    """Squared L2 distances between each query and its candidate vectors, shape (n, c)."""
+    diff = candidate_vectors - query_vectors[:, None, :]
+    return np.einsum("ncd,ncd->nc", diff, diff)
+
+
+def measure_recall(index: faiss.Index, exact_vectors: np.ndarray, k: int = 10, num_queries: int = 200,
+                   rerank_factor: int = RAG_RERANK_FACTOR) -> Dict[str, float]:
+    """
+    Compares an index against exact flat search over the same vectors.
+
+    A random sample of the stored vectors is used as queries. Recall@k is
+    reported for the raw index results and after exact re-ranking of
+    k * rerank_factor candidates.
+
+    Args:
+        index: Index to evaluate (rows must align with exact_vectors)
+        exact_vectors: (n, d) float32 vectors in index row order
+        k: Number of neighbours compared
+        num_queries: Number of sampled queries
+        rerank_factor: Candidate multiplier for the re-ranked recall
+
+    Returns:
+        Dict with recall_at_k, reranked_recall_at_k, index_bytes, flat_bytes and memory_saved_ratio
+    """
+    exact_vectors = np.ascontiguousarray(exact_vectors, dtype=np.float32)
+    num_vectors = len(exact_vectors)
+    flat_bytes = exact_vectors.nbytes
+    index_bytes = index_memory_bytes(index)
+    report = {
+        "index_bytes": index_bytes,
+        "flat_bytes": flat_bytes,
+        "memory_saved_ratio": 1 - index_bytes / flat_bytes if flat_bytes else 0.0,
+        "recall_at_k": 1.0,
+        "reranked_recall_at_k": 1.0,
+    }
+    if num_vectors == 0:
+        return report
+
+    k = min(k, num_vectors)
+    rng = np.random.default_rng(0)
+    queries = exact_vectors[rng.choice(num_vectors, min(num_queries, num_vectors), replace=False)]
+
+    flat = faiss.IndexFlatL2(exact_vectors.shape[1])
+    flat.add(exact_vectors)
+    _, truth = flat.search(queries, k)
+
+    fetch_k = min(num_vectors, k * max(1, rerank_factor))
+    _, approx = index.search(queries, fetch_k)
+    safe_rows = np.where(approx >= 0, approx, 0)
+    distances = rerank_exact(queries, exact_vectors[safe_rows])
+    distances[approx < 0] = np.inf
+    reranked = np.take_along_axis(approx, np.argsort(distances, axis=1)[:, :k], axis=1)
+
+    def recall(found: np.ndarray) -> float:
+        return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+    report["recall_at_k"] = recall(approx[:, :k])
+    report["reranked_recall_at_k"] = recall(reranked)
+    return report
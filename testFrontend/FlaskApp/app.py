@@ -7,6 +7,7 @@ from flask import Flask, request, jsonify, session
 from flask_cors import CORS
 import threading
 import tempfile
+import shutil
 import warnings
 
 # Suppress Google Cloud warnings
@@ -35,7 +36,14 @@ from aiFeatures.python.speech_to_text import speech_to_text
 from aiFeatures.python.speech_to_text import stop_speech_recognition
 from aiFeatures.python.text_to_speech import say, stop_speech
 from aiFeatures.python.enhanced_web_search import enhanced_web_search, get_search_content_for_ai
-from aiFeatures.python.rag_pipeline import index_pdfs, retrieve_answer
+from aiFeatures.python.rag_pipeline import index_pdfs, retrieve_hits, format_hits, add_pdfs_to_store, remove_file_from_store
+from aiFeatures.python.rag_pipeline import query_embedding_cache, retrieve_batch, RAG_BATCH_MAX_QUERIES, RAG_BATCH_MAX_K
+from aiFeatures.python.rag_pipeline import retrieve_federated, RAG_FEDERATED_MAX_INDEXES
+from aiFeatures.python.store_registry import VectorStoreRegistry
+from aiFeatures.python.search_filter import SearchFilter
+from aiFeatures.python.folder_sync import sync_folder, FolderWatcher
+from aiFeatures.python.indexing_jobs import IndexingJobManager
+from aiFeatures.python.context_packer import RAG_CONTEXT_TOKENS, RAG_CONTEXT_CANDIDATES, estimate_tokens, pack_context, truncate_to_tokens
 from aiFeatures.python.simple_video_processor import process_video
 from aiFeatures.python.image_processor import process_image
 
@@ -44,9 +52,60 @@ app.secret_key = os.urandom(24)  # Add a secret key for sessions
 CORS(app)  # Enable CORS for frontend requests
 
 # Global variables
-vector_store = None
+vector_stores = VectorStoreRegistry()  # One vector store per workspace, idle ones evicted to disk
+indexing_jobs = IndexingJobManager()  # Background /initialize-rag jobs
 session_manager = ChatSessionManager()
 default_session_id = "user_session_001"  # Default session ID
+folder_watchers = {}  # (workspace_id, folder) -> FolderWatcher keeping that workspace in sync
+folder_watchers_lock = threading.Lock()
+workspace_owners = {}  # workspace_id -> session id that first indexed into it; gates federated reads
+workspace_owners_lock = threading.Lock()
+
+def get_workspace_id(data=None):
+    """Workspace owning the vector store: workspace_id, else session_id, else the default session."""
+    data = data or {}
+    return (data.get("workspace_id") or request.form.get("workspace_id")
+            or request.args.get("workspace_id")
+            or data.get("session_id") or request.form.get("session_id")
+            or default_session_id)
+
+def get_caller_session_id(data=None):
+    """Session the caller identifies as: session_id, else the default session."""
+    data = data or {}
+    return data.get("session_id") or request.form.get("session_id") or default_session_id
+
+def claim_workspace(workspace_id, data=None):
+    """Records the calling session as the creator of a workspace, unless another session already is."""
+    with workspace_owners_lock:
+        workspace_owners.setdefault(workspace_id, get_caller_session_id(data))
+
+def can_read_workspace(workspace_id, data=None):
+    """A caller may read its own workspace and the workspaces its session created."""
+    if workspace_id == get_workspace_id(data):
+        return True
+    with workspace_owners_lock:
+        return workspace_owners.get(workspace_id) == get_caller_session_id(data)
+
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+
+def get_search_params(data):
+    """
+    Validated nprobe, ef_search and retrieval mode of a retrieval request.
+
+    Raises:
+        ValueError: With a message for the client if a value is invalid
+    """
+    params = {}
+    for name in ("nprobe", "ef_search"):
+        value = data.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            raise ValueError(f"{name} must be a positive integer")
+        params[name] = value
+    mode = data.get("retrieval_mode", "hybrid")
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}")
+    params["mode"] = mode
+    return params
 
 @app.route("/")
 def home():
@@ -54,14 +113,19 @@ def home():
 
 @app.route("/status", methods=["GET"])
 def get_status():
-    """Get the current status of the vector store."""
-    global vector_store
+    """Get the current status of a workspace's vector store (workspace_id query parameter)."""
+    global vector_stores
     
     try:
+        workspace_id = get_workspace_id()
+        vector_store = vector_stores.get(workspace_id)
         if not vector_store:
             return jsonify({
                 "vector_store": None,
                 "store_type": None,
+                "workspace_id": workspace_id,
+                "registry": vector_stores.stats(),
+                "query_cache": query_embedding_cache.stats(),
                 "message": "No vector store initialized"
             })
         
@@ -72,6 +136,9 @@ def get_status():
             "vector_store": "initialized",
             "store_type": store_type,
             "is_hybrid": is_hybrid,
+            "workspace_id": workspace_id,
+            "registry": vector_stores.stats(),
+            "query_cache": query_embedding_cache.stats(),
             "message": f"Vector store active: {store_type}"
         })
     
@@ -106,27 +173,21 @@ def health():
 
 @app.route("/clear-session", methods=["POST"])
 def clear_session():
-    """Clears a specific chat session (if provided) and optionally resets the vector store."""
-    global vector_store, session_manager, default_session_id
+    """Clears a specific chat session (if provided) and optionally resets its vector store."""
+    global vector_stores, session_manager, default_session_id
     
     try:
         data = request.json if request.json else {}
         # If a session_id is provided clear only that session, otherwise default
         session_id = data.get("session_id") or default_session_id
-        # Handle both FAISS and hybrid vector stores
-        if vector_store:
-            # Try to clear hybrid store first
-            if hasattr(vector_store, 'hybrid_manager'):
-                try:
-                    hybrid_manager = getattr(vector_store, 'hybrid_manager', None)
-                    if hybrid_manager and hasattr(hybrid_manager, 'clear_store'):
-                        hybrid_manager.clear_store()
-                    store_type = getattr(vector_store, 'store_type', 'unknown')
-                    print(f"Cleared {store_type} vector store")
-                except Exception as e:
-                    print(f"Error clearing hybrid store: {e}")
-            # For legacy FAISS, just reset the reference
-            vector_store = None
+        # Indexed documents outlive the chat history unless a reset is requested
+        if data.get("reset_vector_store"):
+            workspace_id = get_workspace_id(data)
+            stop_folder_watchers(workspace_id)
+            if vector_stores.remove(workspace_id):
+                print(f"Cleared vector store of workspace {workspace_id}")
+            with workspace_owners_lock:
+                workspace_owners.pop(workspace_id, None)
         
         # Clear the session
         session_manager.delete_session(session_id)
@@ -139,40 +200,205 @@ def clear_session():
 
 @app.route("/initialize-rag", methods=["POST"])
 def initialize_rag():
-    """Handles indexing PDFs from uploaded files or a folder path."""
-    global vector_store
+    """Starts a background job indexing uploaded files or a folder path into the caller's workspace."""
+    global vector_stores
     
+    upload_dir = None
     try:
+        workspace_id = get_workspace_id()
+        claim_workspace(workspace_id)
         if 'files' in request.files:
             files = request.files.getlist('files')
             
-            with tempfile.TemporaryDirectory() as temp_dir:
-                file_paths = []
-                for file in files:
-                    if file.filename and file.filename.endswith('.pdf'):
-                        file_path = os.path.join(temp_dir, file.filename)
-                        file.save(file_path)
-                        file_paths.append(file_path)
-
-                if len(file_paths) == 1:
-                    vector_store = index_pdfs(file_paths[0])  # Using unified index_pdfs function
-                else:
-                    vector_store = index_pdfs(file_paths)  # Using unified index_pdfs function
+            # Uploads must outlive the request; the job deletes the directory when it ends
+            upload_dir = tempfile.mkdtemp(prefix="studybuddy-upload-")
+            pdf_inputs = []
+            for file in files:
+                if file.filename and file.filename.endswith('.pdf'):
+                    file_path = os.path.join(upload_dir, os.path.basename(file.filename))
+                    file.save(file_path)
+                    pdf_inputs.append(file_path)
+            if not pdf_inputs:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                return jsonify({"success": False, "message": "No PDF files provided"}), 400
         
         elif 'folder' in request.form:
-            folder_path = request.form.get('folder')
-            if folder_path:
-                vector_store = index_pdfs(folder_path)  # Using unified index_pdfs function
-            else:
+            pdf_inputs = request.form.get('folder')
+            if not pdf_inputs:
                 return jsonify({"success": False, "message": "Invalid folder path"}), 400
         
         else:
             return jsonify({"success": False, "message": "No files or folder provided"}), 400
         
-        return jsonify({"success": True, "message": "RAG initialized successfully"})
+        def swap_in(vector_store):
+            # The workspace keeps answering from its previous store until this single swap
+            with vector_stores.lock(workspace_id):
+                vector_stores.put(workspace_id, vector_store)
+        
+        job = indexing_jobs.submit(workspace_id, pdf_inputs, swap_in, cleanup_dir=upload_dir)
+        
+        return jsonify({"success": True, "message": "Indexing started", "job_id": job.job_id,
+                        "job": job.to_dict(), "workspace_id": workspace_id}), 202
     
+    except ValueError as e:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         print(f"RAG initialization error: {e}")
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/index-jobs", methods=["GET"])
+def list_index_jobs():
+    """Lists the indexing jobs of the caller's workspace."""
+    workspace_id = get_workspace_id()
+    return jsonify({"jobs": [job.to_dict() for job in indexing_jobs.list(workspace_id)],
+                    "workspace_id": workspace_id})
+
+@app.route("/index-jobs/<job_id>", methods=["GET"])
+def get_index_job(job_id):
+    """Reports the status, progress and ETA of an indexing job."""
+    job = indexing_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/index-jobs/<job_id>/cancel", methods=["POST"])
+def cancel_index_job(job_id):
+    """Cancels a queued or running indexing job; the workspace keeps its current store."""
+    job = indexing_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown job"}), 404
+    return jsonify({"success": True, "message": "Cancellation requested", "job": job.to_dict()})
+
+@app.route("/add-documents", methods=["POST"])
+def add_documents():
+    """Appends uploaded PDFs (or a folder of PDFs) to the caller's workspace vector store."""
+    global vector_stores
+    
+    try:
+        workspace_id = get_workspace_id()
+        claim_workspace(workspace_id)
+        with vector_stores.lock(workspace_id):
+            vector_store = vector_stores.get(workspace_id)
+            if 'files' in request.files:
+                files = request.files.getlist('files')
+                
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    file_paths = []
+                    for file in files:
+                        if file.filename and file.filename.endswith('.pdf'):
+                            file_path = os.path.join(temp_dir, os.path.basename(file.filename))
+                            file.save(file_path)
+                            file_paths.append(file_path)
+                    
+                    if not file_paths:
+                        return jsonify({"success": False, "message": "No PDF files provided"}), 400
+                    vector_store = add_pdfs_to_store(vector_store, file_paths)
+            
+            elif 'folder' in request.form:
+                folder_path = request.form.get('folder')
+                if folder_path:
+                    vector_store = add_pdfs_to_store(vector_store, folder_path)
+                else:
+                    return jsonify({"success": False, "message": "Invalid folder path"}), 400
+            
+            else:
+                return jsonify({"success": False, "message": "No files or folder provided"}), 400
+            
+            vector_stores.put(workspace_id, vector_store)
+            total_chunks = vector_store.index.ntotal if vector_store else 0
+        
+        return jsonify({"success": True, "message": "Documents added successfully", "total_chunks": total_chunks,
+                        "workspace_id": workspace_id})
+    
+    except Exception as e:
+        print(f"Add documents error: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route("/remove-document", methods=["POST"])
+def remove_document():
+    """Removes all chunks of a given file_name from the caller's workspace vector store."""
+    global vector_stores
+    data = request.json if request.json else {}
+    file_name = data.get("file_name")
+    workspace_id = get_workspace_id(data)
+    
+    if not file_name:
+        return jsonify({"success": False, "message": "No file_name provided"}), 400
+    
+    try:
+        with vector_stores.lock(workspace_id):
+            vector_store = vector_stores.get(workspace_id)
+            if not vector_store:
+                return jsonify({"success": False, "message": "No vector store initialized"}), 404
+            removed = remove_file_from_store(vector_store, file_name)
+            if removed:
+                vector_stores.put(workspace_id, vector_store)
+        
+        if not removed:
+            return jsonify({"success": False, "message": f"No chunks found for {file_name}"}), 404
+        
+        return jsonify({"success": True, "message": f"Removed {file_name}", "removed_chunks": removed})
+    
+    except Exception as e:
+        print(f"Remove document error: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+def run_folder_sync(workspace_id, folder):
+    """Syncs a folder into a workspace's vector store under the workspace lock."""
+    with vector_stores.lock(workspace_id):
+        vector_store, report = sync_folder(vector_stores.get(workspace_id), folder)
+        if report["added"] or report["updated"] or report["removed"]:
+            vector_stores.put(workspace_id, vector_store)
+    return vector_store, report
+
+def stop_folder_watchers(workspace_id, folder=None):
+    """Stops the watchers of a workspace (or of one of its folders); returns how many were stopped."""
+    with folder_watchers_lock:
+        keys = [key for key in folder_watchers if key[0] == workspace_id and folder in (None, key[1])]
+        watchers = [folder_watchers.pop(key) for key in keys]
+    for watcher in watchers:
+        watcher.stop()
+    return len(watchers)
+
+@app.route("/sync-folder", methods=["POST"])
+def sync_folder_route():
+    """Re-indexes only the new, changed and deleted PDFs of a folder; optionally keeps watching it."""
+    data = request.json if request.json else {}
+    folder = data.get("folder")
+    workspace_id = get_workspace_id(data)
+    watch = data.get("watch")
+    
+    if not folder or not os.path.isdir(folder):
+        return jsonify({"success": False, "message": "Invalid folder path"}), 400
+    if watch is not None and not isinstance(watch, bool):
+        return jsonify({"success": False, "message": "watch must be true or false"}), 400
+    folder = os.path.abspath(folder)
+    
+    try:
+        claim_workspace(workspace_id, data)
+        vector_store, report = run_folder_sync(workspace_id, folder)
+        
+        watching = None
+        if watch:
+            with folder_watchers_lock:
+                watcher = folder_watchers.get((workspace_id, folder))
+                if watcher is None:
+                    watcher = FolderWatcher(folder, lambda: run_folder_sync(workspace_id, folder)).start()
+                    folder_watchers[(workspace_id, folder)] = watcher
+            watching = watcher.mode
+        elif watch is False:
+            stop_folder_watchers(workspace_id, folder)
+        
+        return jsonify({"success": True, "message": "Folder synced", "report": report,
+                        "total_chunks": vector_store.index.ntotal if vector_store else 0,
+                        "watching": watching, "workspace_id": workspace_id})
+    
+    except Exception as e:
+        print(f"Folder sync error: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
 @app.route("/enhanced-search", methods=["POST"])
@@ -245,7 +471,7 @@ def enhanced_search():
 @app.route("/ask", methods=["POST"])
 def ask():
     """Handles text input and returns AI response with chat history management."""
-    global vector_store, session_manager, default_session_id
+    global vector_stores, session_manager, default_session_id
     data = request.json if request.json else {}
     user_query = data.get("query")
     web_search_results = data.get("web_search_results")  # New: web search results from frontend
@@ -255,6 +481,28 @@ def ask():
     if not user_query:
         return jsonify({"error": "No input provided"}), 400
 
+    try:
+        search_params = get_search_params(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Optional scope, e.g. {"file_name": "chapter3.pdf", "pages": [10, 20]}
+    try:
+        search_filter = SearchFilter.from_dict(data.get("filters"))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filters: {str(e)}"}), 400
+
+    # Optional named indexes (workspace ids) to search together, e.g. ["physics-101", "calculus"]
+    indexes = data.get("indexes")
+    if indexes is not None:
+        if not isinstance(indexes, list) or not indexes or not all(isinstance(name, str) and name for name in indexes):
+            return jsonify({"error": "indexes must be a non-empty list of workspace ids"}), 400
+        if len(indexes) > RAG_FEDERATED_MAX_INDEXES:
+            return jsonify({"error": f"At most {RAG_FEDERATED_MAX_INDEXES} indexes per query"}), 400
+        forbidden = [name for name in dict.fromkeys(indexes) if not can_read_workspace(name, data)]
+        if forbidden:
+            return jsonify({"error": f"Not allowed to read indexes: {', '.join(forbidden)}"}), 403
+
     # Debug logging for web search results
     if web_search_results:
         print(f"🔍 Received web search results: {len(web_search_results.get('results', []))} results")
@@ -264,8 +512,36 @@ def ask():
         print("❌ No web search results received")
 
     try:
-        # Get retrieved information if vector store exists
-        retrieved_info = retrieve_answer(user_query, vector_store) if vector_store else ""
+        # Get retrieved information if the workspace has a vector store (reloaded from disk if evicted)
+        hits = []
+        missing_indexes = []
+        if indexes is not None:
+            # Federated search: every named index that has a store, merged into one ranking
+            federated_stores = {}
+            for name in dict.fromkeys(indexes):
+                federated_stores[name] = vector_stores.get(name)
+                if not federated_stores[name]:
+                    missing_indexes.append(name)
+            vector_store = any(federated_stores.values())
+            if missing_indexes:
+                print(f"Indexes without a vector store: {', '.join(missing_indexes)}")
+        else:
+            vector_store = vector_stores.get(get_workspace_id(data))
+        if vector_store:
+            try:
+                retrieval_args = dict(
+                    k=RAG_CONTEXT_CANDIDATES,
+                    filters=search_filter,
+                    **search_params
+                )
+                if indexes is not None:
+                    hits = retrieve_federated(user_query, federated_stores, **retrieval_args)
+                else:
+                    hits = retrieve_hits(user_query, vector_store, **retrieval_args)
+            except Exception as e:
+                # Answering without the documents would pass off a guess as grounded
+                print(f"Retrieval error: {e}")
+                return jsonify({"error": f"Retrieval failed: {str(e)}"}), 500
         
         # Prepare web content for AI processing
         web_content = ""
@@ -280,6 +556,16 @@ def ask():
                 web_content += f"   URL: {result.get('url', 'No URL')}\n"
                 web_content += f"   Description: {result.get('snippet', result.get('content', 'No description'))[:200]}...\n\n"
         
+        # Keep the prompt within the context budget: web results get up to a quarter,
+        # retrieved passages the rest, best first with overlapping chunks merged
+        web_budget = min(estimate_tokens(web_content), RAG_CONTEXT_TOKENS // 4)
+        packed_hits, used_tokens = pack_context(hits, RAG_CONTEXT_TOKENS - web_budget)
+        web_content = truncate_to_tokens(web_content, RAG_CONTEXT_TOKENS - used_tokens)
+        if packed_hits:
+            retrieved_info = format_hits(packed_hits)
+        else:
+            retrieved_info = "No relevant information found." if vector_store else ""
+        
         # Generate response based on whether retrieval was performed
         if retrieved_info:
             # Combine retrieved info with web content
@@ -299,7 +585,9 @@ def ask():
             return jsonify({
                 "response": response,
                 "retrieved": retrieved_info,
+                "hits": packed_hits,
                 "hasRetrieval": bool(retrieved_info),
+                "missing_indexes": missing_indexes,
                 "web_sources": web_search_results.get("results", []) if web_search_results else [],
                 "hasWebSources": bool(web_search_results)
             })
@@ -307,7 +595,8 @@ def ask():
         else:
             # If no web search results provided, get search content as before
             if not web_content:
-                scraped_text = get_search_content_for_ai(user_query, "educational")
+                scraped_text = truncate_to_tokens(get_search_content_for_ai(user_query, "educational") or "",
+                                                  RAG_CONTEXT_TOKENS)
             else:
                 scraped_text = web_content
             
@@ -332,6 +621,60 @@ def ask():
         print(f"Error processing query: {e}")
         return jsonify({"error": f"Failed to process query: {str(e)}"}), 500
     
+@app.route("/ask-batch", methods=["POST"])
+def ask_batch():
+    """Retrieves passages for many questions in one index pass (no generated answers)."""
+    global vector_stores
+    data = request.json if request.json else {}
+    queries = data.get("queries")
+    
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({"error": "queries must be a non-empty list of strings"}), 400
+    if len(queries) > RAG_BATCH_MAX_QUERIES:
+        return jsonify({"error": f"At most {RAG_BATCH_MAX_QUERIES} queries per request"}), 400
+    
+    try:
+        k = data.get("k", 3)
+        if isinstance(k, bool):
+            raise ValueError
+        k = int(k)
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be an integer"}), 400
+    if k < 1:
+        return jsonify({"error": "k must be at least 1"}), 400
+    k = min(k, RAG_BATCH_MAX_K)
+    
+    try:
+        search_params = get_search_params(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        search_filter = SearchFilter.from_dict(data.get("filters"))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filters: {str(e)}"}), 400
+    
+    try:
+        vector_store = vector_stores.get(get_workspace_id(data))
+        if not vector_store:
+            return jsonify({"success": False, "message": "No vector store initialized"}), 404
+        
+        results = retrieve_batch(
+            queries,
+            vector_store,
+            k=k,
+            filters=search_filter,
+            **search_params
+        )
+        return jsonify({
+            "success": True,
+            "results": [{"query": query, "hits": hits} for query, hits in zip(queries, results)]
+        })
+    
+    except Exception as e:
+        print(f"Batch retrieval error: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
 @app.route("/speech-to-text", methods=["POST"])
 def process_voice():
     """Handles voice input and converts it to text."""
@@ -0,0 +1,99 @@
+"""
+Shared fixtures for the RAG pipeline tests.
+Stores are embedded with the offline hashed n-gram model, so the tests need
+neither an Ollama server nor network access.
+"""
+
+import os
+import sys
+import tempfile
+
+# Saved indexes and embedding caches go to a scratch directory, not the repo's .rag_cache
+os.environ.setdefault("RAG_CACHE_DIR", tempfile.mkdtemp(prefix="rag_cache_"))
+
+# Make aiFeatures importable when pytest is run from the repository root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+# Small offline embedding model used for every store built in the tests
+TEST_MODEL = "hashed-ngram:256"
+
+COURSE_PAGES = {
+    "physics.pdf": [
+        "The second law of Newton states that force equals mass times acceleration. "
+        "A larger force on the same mass produces a larger acceleration.",
+        "Kinetic energy is one half of mass times velocity squared. "
+        "Momentum is mass times velocity and is conserved in collisions.",
+    ],
+    "calculus.pdf": [
+        "The derivative of a function measures its rate of change. "
+        "The chain rule differentiates a composition of functions.",
+        "An integral accumulates area under a curve. "
+        "The fundamental theorem of calculus links the integral and the derivative.",
+    ],
+    "cooking.pdf": [
+        "Knead the dough for ten minutes until it is smooth and elastic. "
+        "Let the dough rise in a warm place for an hour.",
+        "Bake the bread at two hundred degrees until the crust is golden brown.",
+    ],
+}
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages) -> str:
+    """
+    Writes a minimal PDF with one line of Helvetica text per page.
+
+    Args:
+        path: Output file
+        pages: Page texts
+
+    Returns:
+        The path
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 10 Tf 20 700 Td ({_escape(text)}) Tj ET".encode("latin-1")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream.decode('latin-1')}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+@pytest.fixture
+def course_dir(tmp_path):
+    """Folder with one small PDF per course in COURSE_PAGES."""
+    folder = tmp_path / "courses"
+    folder.mkdir()
+    for file_name, pages in COURSE_PAGES.items():
+        write_pdf(str(folder / file_name), pages)
+    return str(folder)
+
+
+@pytest.fixture
+def index_root(tmp_path):
+    """Empty directory for saved indexes."""
+    root = tmp_path / "indexes"
+    root.mkdir()
+    return str(root)
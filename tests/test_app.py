@@ -0,0 +1,131 @@
+import importlib
+import os
+import sys
+import tempfile
+import types
+import uuid
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "testFrontend", "FlaskApp")))
+
+# Feature modules the routes under test never call into; they pull in the LLM, speech, search and vision stacks
+OPTIONAL_APP_MODULES = [
+    "aiFeatures.python.ai_response",
+    "aiFeatures.python.speech_to_text",
+    "aiFeatures.python.text_to_speech",
+    "aiFeatures.python.enhanced_web_search",
+    "aiFeatures.python.simple_video_processor",
+    "aiFeatures.python.image_processor",
+]
+
+
+def _stub_missing_modules(names):
+    """Replaces modules whose dependencies are not installed with mocks so the app can be imported."""
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            stub = types.ModuleType(name)
+            stub.__getattr__ = lambda attr: mock.MagicMock(name=attr)
+            sys.modules[name] = stub
+
+
+_stub_missing_modules(OPTIONAL_APP_MODULES)
+app_module = pytest.importorskip("app", reason="Flask is not installed")
+
+from aiFeatures.python.rag_pipeline import index_pdfs, remove_file_from_store
+
+from conftest import TEST_MODEL, write_pdf
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def workspace(course_dir):
+    """Workspace id with a store of the course PDFs."""
+    workspace_id = f"test-{uuid.uuid4().hex}"
+    app_module.vector_stores.put(workspace_id, index_pdfs(course_dir, model=TEST_MODEL, use_cache=False))
+    yield workspace_id
+    app_module.vector_stores.put(workspace_id, None)
+
+
+def test_add_documents_ignores_directories_in_upload_names(client, workspace, tmp_path):
+    file_name = f"escape-{uuid.uuid4().hex}.pdf"
+    pdf = write_pdf(str(tmp_path / "upload.pdf"), ["An atom bonds with another atom."])
+    with open(pdf, "rb") as f:
+        response = client.post("/add-documents", content_type="multipart/form-data",
+                               data={"workspace_id": workspace, "files": (f, "../" + file_name)})
+
+    assert response.status_code == 200
+    assert not os.path.exists(os.path.join(tempfile.gettempdir(), file_name))
+    assert remove_file_from_store(app_module.vector_stores.get(workspace), file_name) == 1
+
+
+@pytest.mark.parametrize("k, status", [("three", 400), (None, 400), ([3], 400), (True, 400), (0, 400), (-2, 400)])
+def test_ask_batch_rejects_bad_k(client, workspace, k, status):
+    response = client.post("/ask-batch", json={"queries": ["force"], "workspace_id": workspace, "k": k})
+    assert response.status_code == status
+
+
+@pytest.mark.parametrize("route", ["/ask", "/ask-batch"])
+@pytest.mark.parametrize("params", [
+    {"nprobe": 0}, {"nprobe": "8"}, {"nprobe": True}, {"ef_search": -1}, {"ef_search": 2.5},
+    {"retrieval_mode": "semantic"}, {"retrieval_mode": None},
+])
+def test_ask_routes_reject_bad_search_params(client, workspace, route, params):
+    body = {"query": "force", "queries": ["force"], "workspace_id": workspace, **params}
+    response = client.post(route, json=body)
+
+    assert response.status_code == 400
+
+
+def test_ask_batch_accepts_search_params(client, workspace):
+    response = client.post("/ask-batch", json={"queries": ["dough"], "workspace_id": workspace, "nprobe": 4,
+                                               "ef_search": 16, "retrieval_mode": "lexical"})
+
+    assert response.status_code == 200
+    assert response.get_json()["results"][0]["hits"][0]["file_name"] == "cooking.pdf"
+
+
+def test_ask_batch_caps_k(client, workspace, monkeypatch):
+    monkeypatch.setattr(app_module, "RAG_BATCH_MAX_K", 2)
+    response = client.post("/ask-batch", json={"queries": ["force", "dough"], "workspace_id": workspace, "k": "10"})
+
+    assert response.status_code == 200
+    assert [len(result["hits"]) for result in response.get_json()["results"]] == [2, 2]
+
+
+@pytest.fixture
+def answering(monkeypatch):
+    """Replaces answer generation and speech, so /ask returns once retrieval is done."""
+    monkeypatch.setattr(app_module, "generate_response_with_retrieval", lambda *args: "answer")
+    monkeypatch.setattr(app_module, "generate_response_without_retrieval", lambda *args: "answer")
+    monkeypatch.setattr(app_module, "say", lambda text: None)
+
+
+def test_ask_only_federates_indexes_the_caller_may_read(client, workspace, answering, monkeypatch):
+    body = {"query": "force", "session_id": "someone-else", "indexes": [workspace]}
+    assert client.post("/ask", json=body).status_code == 403
+
+    monkeypatch.setitem(app_module.workspace_owners, workspace, "owner")
+    assert client.post("/ask", json=body).status_code == 403
+    response = client.post("/ask", json=dict(body, session_id="owner"))
+
+    assert response.status_code == 200
+    assert {hit["index"] for hit in response.get_json()["hits"]} == {workspace}
+
+
+def test_ask_reports_retrieval_errors(client, workspace, answering, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("index file is corrupt")
+
+    monkeypatch.setattr(app_module, "retrieve_hits", fail)
+    response = client.post("/ask", json={"query": "force", "workspace_id": workspace})
+
+    assert response.status_code == 500
+    assert "index file is corrupt" in response.get_json()["error"]
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from aiFeatures.python.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index():
+    bm25 = BM25Index()
+    bm25.add(["energy", "momentum"], ["Kinetic energy is one half m v^2.", "Momentum p = m v is conserved."])
+    bm25.add(["einstein"], ["Rest energy E = mc^2 relates mass and energy."])
+    return bm25
+
+
+def test_tokenize_keeps_formulas_and_numbers():
+    assert tokenize("E = mc^2, pi is 3.14!") == ["e", "mc^2", "pi", "is", "3.14"]
+
+
+def test_search_ranks_by_bm25(index):
+    results = index.search("energy", k=5)
+
+    # The chunk mentioning energy twice ranks first; chunks without the term are not returned
+    assert [doc_id for doc_id, _ in results] == ["einstein", "energy"]
+    assert results[0][1] > results[1][1] > 0
+    assert index.search("mc^2", k=5)[0][0] == "einstein"
+    assert index.search("unrelated words", k=5) == []
+
+
+def test_max_score_bounds_every_score(index):
+    for query in ("energy", "energy mass mc^2", "momentum conserved"):
+        assert 0 < max(score for _, score in index.search(query, k=5)) < index.max_score(query)
+    # A term missing from the index weighs as much as the rarest one
+    assert index.max_score("energy unrelated") > 2 * index.max_score("energy")
+    assert index.max_score("...") == 0.0
+
+
+def test_search_respects_row_mask(index):
+    assert [doc_id for doc_id, _ in index.search("energy", k=5, row_mask=np.array([True, True, False]))] == ["energy"]
+
+
+def test_remove_compacts_rows(index):
+    version = index.version
+    index.remove(["energy"])
+
+    assert len(index) == 2
+    assert index.version > version
+    assert [doc_id for doc_id, _ in index.search("energy conserved", k=5)] == ["einstein", "momentum"]
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_save_and_load(index, tmp_path, mmap):
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path), mmap=mmap)
+
+    assert isinstance(loaded.post_rows, np.memmap) == mmap
+    assert loaded.search("energy mass", k=5) == index.search("energy mass", k=5)
+    # Edits replace the mapped arrays rather than writing into them
+    loaded.remove(["einstein"])
+    loaded.add(["heat"], ["Heat is energy in transit."])
+    assert sorted(doc_id for doc_id, _ in loaded.search("energy", k=5)) == ["energy", "heat"]
+    assert BM25Index.load(str(tmp_path / "missing")) is None
+
+
+def test_loads_stores_saved_as_npz(index, tmp_path):
+    index.save(str(tmp_path))
+    arrays = {name: np.load(tmp_path / BM25Index.ARRAY_FILE_NAME.format(name)) for name in BM25Index.ARRAY_NAMES}
+    np.savez(tmp_path / BM25Index.FILE_NAME, **arrays)
+    for name in BM25Index.ARRAY_NAMES:
+        (tmp_path / BM25Index.ARRAY_FILE_NAME.format(name)).unlink()
+
+    assert BM25Index.load(str(tmp_path), mmap=True).search("energy", k=5) == index.search("energy", k=5)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
@@ -0,0 +1,49 @@
+from aiFeatures.python.context_packer import (
+    TRUNCATION_MARKER, estimate_tokens, merge_adjacent, pack_context, truncate_to_tokens
+)
+
+PAGE = " ".join(f"Sentence {i} explains one more step of the derivation." for i in range(200))
+
+
+def _hit(start, end, score, file_name="notes.pdf", page=1):
+    return {"content": PAGE[start:end], "score": score, "score_type": "relevance", "file_name": file_name,
+            "page": page, "total_pages": 3, "start": start, "end": end, "also_in": []}
+
+
+def test_truncate_to_tokens_cuts_at_a_boundary():
+    assert truncate_to_tokens("short text", 10) == "short text"
+
+    cut = truncate_to_tokens(PAGE, 50)
+    assert cut.endswith("." + TRUNCATION_MARKER)
+    assert estimate_tokens(cut) <= 50
+    assert PAGE.startswith(cut[:-len(TRUNCATION_MARKER)])
+
+
+def test_merge_adjacent_joins_overlapping_chunks_of_a_page():
+    hits = [_hit(0, 120, 0.2), _hit(100, 220, 0.9), _hit(500, 600, 0.5), _hit(0, 120, 0.4, page=2)]
+
+    merged = merge_adjacent(hits)
+
+    assert [(hit["start"], hit["end"], hit["page"], hit["score"]) for hit in merged] == [
+        (0, 220, 1, 0.9), (500, 600, 1, 0.5), (0, 120, 2, 0.4)
+    ]
+    assert merged[0]["content"] == PAGE[0:220]
+
+
+def test_pack_context_drops_redundant_hits_and_respects_budget():
+    hits = [_hit(0, 400, 0.9), dict(_hit(0, 400, 0.8), file_name="copy.pdf"), _hit(2000, 2400, 0.5)]
+
+    packed, used = pack_context(hits, max_tokens=1000)
+
+    assert [hit["file_name"] for hit in packed] == ["notes.pdf", "notes.pdf"]
+    assert used <= 1000
+
+
+def test_truncated_hit_range_matches_its_text():
+    packed, used = pack_context([_hit(0, 4000, 0.9)], max_tokens=300)
+
+    hit = packed[0]
+    assert hit["truncated"]
+    assert used <= 300
+    kept = hit["content"][:-len(TRUNCATION_MARKER)]
+    assert PAGE[hit["start"]:hit["end"]] == kept
@@ -0,0 +1,66 @@
+import pytest
+
+from aiFeatures.python.dedup import DUPLICATE_REFS_KEY, ChunkDeduplicator, add_duplicate_ref, deduplicate_chunks
+
+SLIDE = ("Lecture notes for week three cover conservation of momentum in elastic and inelastic "
+         "collisions, with worked examples on carts, billiard balls and rocket propulsion.")
+
+
+def test_exact_duplicates_ignore_whitespace():
+    deduplicator = ChunkDeduplicator(mode="exact")
+
+    assert deduplicator.check(SLIDE) is None
+    assert deduplicator.check("Something else entirely.") is None
+    assert deduplicator.check("  " + SLIDE.replace(" ", "\n", 3)) == 0
+    assert deduplicator.check(SLIDE.replace("three", "four")) is None
+    assert deduplicator.duplicates == 1
+
+
+def test_near_duplicates_are_caught_by_minhash():
+    deduplicator = ChunkDeduplicator(mode="near")
+    deduplicator.check(SLIDE)
+    assert deduplicator.check("An unrelated paragraph about baking bread and kneading dough.") is None
+
+    # A page footer on a chunk-sized text changes only a few shingles
+    chunk = " ".join(f"{word}{i}" for i, word in enumerate(SLIDE.split() * 8))
+    deduplicator.check(chunk)
+    near_copy = chunk + " Page 12"
+    assert deduplicator.check(near_copy) == 2
+    assert ChunkDeduplicator(mode="exact").check(near_copy) is None
+
+
+def test_off_mode_keeps_everything():
+    deduplicator = ChunkDeduplicator(mode="off")
+    assert deduplicator.check(SLIDE) is None
+    assert deduplicator.check(SLIDE) is None
+
+
+def test_register_continues_sequence_numbers():
+    deduplicator = ChunkDeduplicator(mode="near")
+    assert deduplicator.register("Already indexed chunk about waves.") == 0
+    assert deduplicator.register(SLIDE) == 1
+    assert deduplicator.check(SLIDE) == 1
+    assert deduplicator.check("A new chunk.") is None
+
+
+def test_add_duplicate_ref_records_each_location_once():
+    survivor = {"file_name": "week3.pdf", "page_index": 4, "start_index": 0}
+    copy = {"file_name": "review.pdf", "page_index": 9, "start_index": 120}
+
+    updated = add_duplicate_ref(survivor, copy)
+    assert updated[DUPLICATE_REFS_KEY] == [{"file_name": "review.pdf", "page_index": 9}]
+    assert DUPLICATE_REFS_KEY not in survivor
+    assert add_duplicate_ref(updated, copy) is updated
+    # A copy on the survivor's own page adds nothing
+    assert add_duplicate_ref(survivor, dict(survivor, start_index=500)) is survivor
+
+
+def test_deduplicate_chunks_keeps_first_copy():
+    documents = [SLIDE, "Other text.", SLIDE]
+    metadata = [{"file_name": "a.pdf", "page_index": 0}, {"file_name": "a.pdf", "page_index": 1},
+                {"file_name": "b.pdf", "page_index": 2}]
+
+    kept, kept_metadata = deduplicate_chunks(documents, metadata, mode="exact")
+
+    assert kept == [SLIDE, "Other text."]
+    assert kept_metadata[0][DUPLICATE_REFS_KEY] == [{"file_name": "b.pdf", "page_index": 2}]
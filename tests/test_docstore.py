@@ -0,0 +1,143 @@
+import json
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+from aiFeatures.python.docstore import ZSTD_AVAILABLE, MmapDocstore
+
+
+def _doc(text, file_name, page):
+    return Document(page_content=text, metadata={"file_name": file_name, "page_index": page})
+
+
+def _reopen(store, tmp_path, name="saved"):
+    saved = tmp_path / name
+    saved.mkdir()
+    store.save(str(saved))
+    return MmapDocstore.load(str(saved), str(tmp_path / "work"))
+
+
+@pytest.fixture
+def store(tmp_path):
+    docstore = MmapDocstore(str(tmp_path / "work"), compression="none")
+    docstore.add({
+        "a": _doc("Force equals mass times acceleration.", "physics.pdf", 0),
+        "b": _doc("Momentum is conserved — even in ünicode.", "physics.pdf", 1),
+        "c": _doc("Knead the dough.", "cooking.pdf", 0),
+    })
+    return docstore
+
+
+def test_docstore_looks_up_text_and_metadata(store):
+    doc = store.search("b")
+
+    assert doc.page_content == "Momentum is conserved — even in ünicode."
+    assert doc.metadata == {"file_name": "physics.pdf", "page_index": 1}
+    assert store.search("missing") == "ID missing not found."
+    with pytest.raises(ValueError):
+        store.add({"a": _doc("again", "x.pdf", 0)})
+
+
+def test_docstore_metadata_queries(store):
+    assert store.ids_where("file_name", "physics.pdf") == ["a", "b"]
+    # Values are pooled across keys, so predicates see values of other keys too
+    assert store.match_rows("page_index", lambda page: isinstance(page, int) and page >= 1).tolist() == [
+        False, True, False
+    ]
+
+    store.update_metadata("c", {"file_name": "baking.pdf", "page_index": 3})
+    assert store.ids_where("file_name", "baking.pdf") == ["c"]
+    assert store.ids_where("file_name", "cooking.pdf") == []
+
+
+def test_docstore_save_compacts_deleted_rows(store, tmp_path):
+    store.delete(["a"])
+    assert len(store) == 2
+    assert store.search("a") == "ID a not found."
+
+    loaded = _reopen(store, tmp_path)
+
+    assert loaded.ids() == ["b", "c"]
+    assert loaded.search("c").page_content == "Knead the dough."
+    assert loaded.rows_of(["c", "a"]).tolist() == [1, -1]
+
+
+def test_loaded_docstore_accepts_new_rows_and_edits(store, tmp_path):
+    loaded = _reopen(store, tmp_path)
+    loaded.add({"d": _doc("Bake until golden.", "cooking.pdf", 1)})
+    loaded.update_metadata("a", {"file_name": "mechanics.pdf", "page_index": 0})
+    loaded.delete(["b"])
+
+    assert loaded.ids_where("file_name", "cooking.pdf") == ["c", "d"]
+    assert loaded.search("a").metadata["file_name"] == "mechanics.pdf"
+
+    again = _reopen(loaded, tmp_path, "saved-again")
+    assert again.ids() == ["a", "c", "d"]
+    assert [again.search(doc_id).page_content for doc_id in again.ids()] == [
+        "Force equals mass times acceleration.", "Knead the dough.", "Bake until golden."
+    ]
+    assert again.ids_where("file_name", "mechanics.pdf") == ["a"]
+
+
+def _chapter(count=100):
+    return {
+        f"id{i}": _doc(" ".join(f"Paragraph {i} sentence {j} about kinematics and dynamics." for j in range(20)),
+                       f"book{i // 50}.pdf", i % 50)
+        for i in range(count)
+    }
+
+
+@pytest.mark.parametrize("compression", [
+    "zlib",
+    pytest.param("zstd", marks=pytest.mark.skipif(not ZSTD_AVAILABLE, reason="zstandard is not installed")),
+])
+def test_compressed_docstore_round_trip(tmp_path, compression):
+    docs = _chapter()
+    store = MmapDocstore(str(tmp_path / "work"), compression=compression)
+    store.add(docs)
+    # Rows in written blocks and in the block still being filled read back alike
+    assert all(store.search(doc_id).page_content == doc.page_content for doc_id, doc in docs.items())
+
+    loaded = _reopen(store, tmp_path)
+    raw_bytes = sum(len(doc.page_content.encode("utf-8")) for doc in docs.values())
+    assert os.path.getsize(tmp_path / "saved" / MmapDocstore.TEXT_FILE_NAME) < raw_bytes / 2
+    assert [loaded.search(doc_id).page_content for doc_id in loaded.ids()] == [
+        doc.page_content for doc in docs.values()
+    ]
+    assert loaded.search("id7").metadata == {"file_name": "book0.pdf", "page_index": 7}
+
+
+def test_block_cache_keeps_recent_blocks(tmp_path):
+    store = MmapDocstore(str(tmp_path / "work"), compression="zlib")
+    store.add(_chapter())
+    loaded = _reopen(store, tmp_path)
+    loaded.block_cache = 1
+
+    loaded.search("id0")
+    loaded.search("id1")
+    assert loaded.blocks_decompressed == 1
+    # Each read of a row in another block evicts the only cached block
+    loaded.search("id99")
+    loaded.search("id0")
+    assert loaded.blocks_decompressed == 3
+
+
+def test_docstore_saved_before_compression_still_loads(store, tmp_path):
+    saved = tmp_path / "saved"
+    saved.mkdir()
+    store.save(str(saved))
+    meta_path = saved / MmapDocstore.META_FILE_NAME
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    del meta["compression"]
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+    loaded = MmapDocstore.load(str(saved), str(tmp_path / "work"))
+    assert loaded.search("b").page_content == "Momentum is conserved — even in ünicode."
+    loaded.add({"d": _doc("Bake until golden.", "cooking.pdf", 1)})
+    assert loaded.search("d").page_content == "Bake until golden."
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        MmapDocstore(str(tmp_path / "work"), compression="lzma")
@@ -0,0 +1,122 @@
+import itertools
+import multiprocessing
+import types
+
+import numpy as np
+import pytest
+
+from aiFeatures.python import embedding_cache
+from aiFeatures.python.embedding_cache import CachedEmbeddings, EmbeddingCache, QueryEmbeddingCache
+from aiFeatures.python.local_embeddings import HashedNgramEmbeddings
+
+
+class CountingEmbeddings(HashedNgramEmbeddings):
+    """Offline embedder that records which texts reached it."""
+
+    def __init__(self):
+        super().__init__(dim=16)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def _fill_cache(cache_dir, worker, start):
+    """Writes 300 small batches of texts owned by one worker process."""
+    cache = EmbeddingCache(cache_dir)
+    start.wait(60)
+    for batch in range(300):
+        texts = [f"worker {worker} text {batch} {i}" for i in range(3)]
+        cache.put_many(texts, [[float(worker), float(batch), float(i)] for i in range(3)])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Deterministic clock for last-use ordering."""
+    ticks = itertools.count()
+    monkeypatch.setattr(embedding_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def test_embedding_cache_persists_by_normalized_text(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many(["force  equals\nmass"], [[1.0, 2.0, 3.0]])
+
+    reopened = EmbeddingCache(str(tmp_path))
+    hit, miss = reopened.get_many(["force equals mass", "something else"])
+
+    np.testing.assert_array_equal(hit, np.array([1.0, 2.0, 3.0], dtype=np.float32))
+    assert miss is None
+    assert (reopened.hits, reopened.misses) == (1, 1)
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path, clock):
+    cache = EmbeddingCache(str(tmp_path), max_bytes=2 * 2 * 4)
+    cache.put_many(["a"], [[1.0, 1.0]])
+    cache.put_many(["b"], [[2.0, 2.0]])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [[3.0, 3.0]])
+
+    a, b, c = cache.get_many(["a", "b", "c"])
+    assert len(cache) == 2
+    assert b is None
+    assert a[0] == 1.0 and c[0] == 3.0
+
+
+def test_cached_embeddings_only_embeds_misses(tmp_path):
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, EmbeddingCache(str(tmp_path)))
+    first = embeddings.embed_documents(["force", "mass"])
+    second = embeddings.embed_documents(["mass", "velocity", "force"])
+
+    assert model.embedded == ["force", "mass", "velocity"]
+    assert second[0] == first[1] and second[2] == first[0]
+
+
+def test_query_cache_is_lru_per_model(clock):
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=100)
+    cache.put("m1", "what is force", [1.0])
+    cache.put("m1", "what is mass", [2.0])
+    assert cache.get("m1", "what  is\tforce") == [1.0]
+    assert cache.get("m2", "what is force") is None
+    cache.put("m1", "what is energy", [3.0])
+
+    assert cache.get("m1", "what is mass") is None
+    assert cache.get("m1", "what is force") == [1.0]
+    assert cache.stats()["entries"] == 2
+
+
+def test_query_cache_expires_entries(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(embedding_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    cache = QueryEmbeddingCache(max_entries=10, ttl_seconds=60)
+    cache.put("m", "q", [1.0])
+
+    now[0] = 59.0
+    assert cache.get("m", "q") == [1.0]
+    now[0] = 61.0
+    assert cache.get("m", "q") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.stats()["entries"] == 0
+
+
+def test_processes_sharing_a_cache_get_distinct_rows(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    # Released once every worker has opened the cache, so their writes overlap
+    start = context.Barrier(4)
+    workers = [context.Process(target=_fill_cache, args=(str(tmp_path), worker, start)) for worker in range(3)]
+    for process in workers:
+        process.start()
+    start.wait(60)
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+
+    cache = EmbeddingCache(str(tmp_path))
+    texts = [f"worker {worker} text {batch} {i}" for worker in range(3) for batch in range(300) for i in range(3)]
+    vectors = cache.get_many(texts)
+    assert len(cache) == len(texts)
+    assert all(vector is not None for vector in vectors)
+    expected = [[worker, batch, i] for worker in range(3) for batch in range(300) for i in range(3)]
+    np.testing.assert_array_equal(np.array(vectors), np.array(expected, dtype=np.float32))
+    assert (cache.hits, cache.misses) == (len(texts), 0)
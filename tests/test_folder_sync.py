@@ -0,0 +1,92 @@
+import os
+import threading
+
+from aiFeatures.python import folder_sync
+from aiFeatures.python.folder_sync import FolderWatcher, sync_folder
+from aiFeatures.python.rag_pipeline import retrieve_hits
+
+from conftest import TEST_MODEL, write_pdf
+
+
+def _indexed_files(store):
+    return sorted({store.docstore.search(doc_id).metadata["file_name"]
+                   for doc_id in store.index_to_docstore_id.values()})
+
+
+def test_sync_only_reindexes_changed_files(course_dir, monkeypatch):
+    store, report = sync_folder(None, course_dir, model=TEST_MODEL)
+    assert sorted(report["added"]) == ["calculus.pdf", "cooking.pdf", "physics.pdf"]
+    assert _indexed_files(store) == ["calculus.pdf", "cooking.pdf", "physics.pdf"]
+
+    reindexed = []
+    original = folder_sync.add_pdfs_to_store
+    monkeypatch.setattr(folder_sync, "add_pdfs_to_store",
+                        lambda store, paths, *args, **kwargs: reindexed.extend(map(os.path.basename, paths))
+                        or original(store, paths, *args, **kwargs))
+
+    # A touched but identical file is hashed, not re-embedded
+    physics = os.path.join(course_dir, "physics.pdf")
+    os.utime(physics, ns=(0, 0))
+    store, report = sync_folder(store, course_dir, model=TEST_MODEL)
+    assert report["added"] == report["updated"] == report["removed"] == []
+    assert report["unchanged"] == 3
+    assert reindexed == []
+
+    write_pdf(physics, ["Photons carry quantized electromagnetic radiation."])
+    os.remove(os.path.join(course_dir, "cooking.pdf"))
+    write_pdf(os.path.join(course_dir, "biology.pdf"), ["Mitochondria produce energy for the cell."])
+    store, report = sync_folder(store, course_dir, model=TEST_MODEL)
+
+    assert report["added"] == ["biology.pdf"]
+    assert report["updated"] == ["physics.pdf"]
+    assert report["removed"] == ["cooking.pdf"]
+    assert report["unchanged"] == 1
+    assert sorted(reindexed) == ["biology.pdf", "physics.pdf"]
+    assert _indexed_files(store) == ["biology.pdf", "calculus.pdf", "physics.pdf"]
+    hit = retrieve_hits("quantized electromagnetic radiation", store, k=1)[0]
+    assert hit["file_name"] == "physics.pdf" and "Photons" in hit["content"]
+
+
+def test_sync_leaves_same_named_files_of_other_folders_alone(course_dir, tmp_path):
+    other = tmp_path / "other"
+    other.mkdir()
+    write_pdf(str(other / "cooking.pdf"), ["Braising meat slowly in a covered pot keeps it tender."])
+    store, _ = sync_folder(None, str(other), model=TEST_MODEL)
+    store, _ = sync_folder(store, course_dir, model=TEST_MODEL)
+    assert len(retrieve_hits("braising meat covered pot", store, k=10, mode="lexical")) == 1
+
+    os.remove(os.path.join(course_dir, "cooking.pdf"))
+    store, report = sync_folder(store, course_dir, model=TEST_MODEL)
+
+    assert report["removed"] == ["cooking.pdf"]
+    hits = retrieve_hits("braising meat covered pot", store, k=10, mode="lexical")
+    assert [hit["file_name"] for hit in hits] == ["cooking.pdf"]
+    assert not retrieve_hits("golden crust", store, k=10, mode="lexical")
+
+
+def test_sync_retries_files_that_failed_to_extract(course_dir):
+    broken = os.path.join(course_dir, "broken.pdf")
+    with open(broken, "wb") as f:
+        f.write(b"not a pdf")
+    store, report = sync_folder(None, course_dir, model=TEST_MODEL)
+    assert report["failed"] == ["broken.pdf"]
+    assert broken not in store.sync_manifest[os.path.abspath(course_dir)]
+
+    write_pdf(broken, ["Enzymes speed up chemical reactions."])
+    store, report = sync_folder(store, course_dir, model=TEST_MODEL)
+
+    assert report["added"] == ["broken.pdf"] and report["failed"] == []
+    assert retrieve_hits("enzymes chemical reactions", store, k=1)[0]["file_name"] == "broken.pdf"
+
+
+def test_polling_watcher_fires_once_the_folder_settles(tmp_path, monkeypatch):
+    monkeypatch.setattr(folder_sync, "INOTIFY_AVAILABLE", False)
+    changed = threading.Event()
+    watcher = FolderWatcher(str(tmp_path), changed.set, debounce=0.1, poll_interval=0.05).start()
+    try:
+        assert watcher.mode == "polling"
+        assert not changed.wait(0.2)
+        write_pdf(str(tmp_path / "new.pdf"), ["Fresh notes."])
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
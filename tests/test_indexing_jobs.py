@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+
+import pytest
+
+from aiFeatures.python.indexing_jobs import CANCELLED, COMPLETED, FAILED, FINISHED_STATES, IndexingJobManager
+
+from conftest import TEST_MODEL
+
+
+def _wait(job, timeout=30):
+    deadline = time.time() + timeout
+    while job.status not in FINISHED_STATES:
+        assert time.time() < deadline, f"job still {job.status}"
+        time.sleep(0.02)
+    return job
+
+
+def test_job_hands_its_store_over_and_reports_progress(course_dir, tmp_path):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    stores = []
+    manager = IndexingJobManager(max_workers=1)
+    job = manager.submit("ws", course_dir, stores.append, cleanup_dir=str(uploads),
+                         model=TEST_MODEL, use_cache=False)
+
+    assert manager.get(job.job_id) is job
+    _wait(job)
+    status = job.to_dict()
+    assert status["status"] == COMPLETED
+    assert status["files"] == 3 and status["total_pages"] == 6 and status["pages"] == 6
+    assert status["chunks"] == status["total_chunks"] == stores[0].index.ntotal
+    assert status["eta_seconds"] is None
+    assert not uploads.exists()
+    assert manager.list("ws") == [job] and manager.list("other") == []
+
+
+def test_cancelled_job_never_swaps_its_store(course_dir):
+    release = threading.Event()
+    stores = []
+    manager = IndexingJobManager(max_workers=1)
+    first = manager.submit("ws", course_dir, lambda store: release.wait(10),
+                           model=TEST_MODEL, use_cache=False)
+    queued = manager.submit("ws", course_dir, stores.append, model=TEST_MODEL, use_cache=False)
+
+    assert manager.cancel(queued.job_id) is queued
+    release.set()
+    assert _wait(first).status == COMPLETED
+    assert _wait(queued).status == CANCELLED
+    assert stores == []
+    assert manager.cancel("unknown") is None
+
+
+def test_unreadable_upload_fails_the_job(tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    manager = IndexingJobManager(max_workers=1)
+    job = _wait(manager.submit("ws", [str(broken)], lambda store: None, model=TEST_MODEL, use_cache=False))
+
+    assert job.status == FAILED
+    assert job.error
+
+
+def test_submit_without_pdfs_raises(tmp_path):
+    with pytest.raises(ValueError):
+        IndexingJobManager().submit("ws", str(tmp_path), lambda store: None)
+
+
+def test_oldest_finished_jobs_are_forgotten(course_dir):
+    manager = IndexingJobManager(max_workers=1, max_history=1)
+    pdf = os.path.join(course_dir, "cooking.pdf")
+    jobs = [_wait(manager.submit("ws", [pdf], lambda store: None, model=TEST_MODEL, use_cache=False))
+            for _ in range(3)]
+
+    # Pruning runs on submit, so the last finished job plus the one before it remain
+    assert manager.get(jobs[0].job_id) is None
+    assert manager.get(jobs[2].job_id) is jobs[2]
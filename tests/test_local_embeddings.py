@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from aiFeatures.python.local_embeddings import HashedNgramEmbeddings, is_local_model
+from aiFeatures.python.rag_pipeline import create_embeddings
+
+
+def test_embeddings_are_deterministic_and_normalised():
+    texts = ["Force equals mass times acceleration.", "Knead the dough", ""]
+    matrix = HashedNgramEmbeddings(64).embed_matrix(texts)
+
+    assert matrix.shape == (3, 64) and matrix.dtype == np.float32
+    np.testing.assert_array_equal(matrix, HashedNgramEmbeddings(64).embed_matrix(texts))
+    np.testing.assert_allclose(np.linalg.norm(matrix[:2], axis=1), 1.0, rtol=1e-6)
+    assert not matrix[2].any()
+    # A text embeds the same alone as in a batch, so bigrams never cross texts
+    np.testing.assert_allclose(HashedNgramEmbeddings(64).embed_query(texts[1]), matrix[1], rtol=1e-6)
+
+
+def test_embeddings_follow_word_overlap():
+    embeddings = HashedNgramEmbeddings(256)
+    query, close, far = embeddings.embed_matrix(["mass times acceleration", "Mass times ACCELERATION!",
+                                                 "bake the bread until golden"])
+    assert query @ close == pytest.approx(1.0)
+    assert query @ far < 0.5
+
+
+def test_model_names_select_the_local_embedder():
+    assert is_local_model("hashed-ngram") and is_local_model("hashed-ngram:128")
+    assert not is_local_model("hashed-ngram-large") and not is_local_model("mxbai-embed-large:latest")
+    assert create_embeddings("hashed-ngram:128").dim == 128
+    with pytest.raises(ValueError):
+        HashedNgramEmbeddings(0)
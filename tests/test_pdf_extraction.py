@@ -0,0 +1,49 @@
+import os
+import time
+
+from aiFeatures.python import pdf_extraction
+from aiFeatures.python.pdf_extraction import _extract_page_range as extract_page_range, iter_texts_parallel
+from aiFeatures.python.rag_pipeline import extract_text_from_pdf
+
+from conftest import write_pdf
+
+
+def _stuck_extract(pdf_path, start, end, page_timeout):
+    """Runs in a worker: hangs on files named stuck*.pdf, extracts the rest normally."""
+    if os.path.basename(pdf_path).startswith("stuck"):
+        time.sleep(600)
+    return extract_page_range(pdf_path, start, end, page_timeout)
+
+
+def test_parallel_extraction_matches_serial_order(course_dir, tmp_path):
+    long_pdf = write_pdf(str(tmp_path / "long.pdf"), [f"Page number {i} of the long file." for i in range(7)])
+    paths = [long_pdf] + sorted(os.path.join(course_dir, name) for name in os.listdir(course_dir))
+    serial = [page for path in paths for page in extract_text_from_pdf(path)]
+
+    assert list(iter_texts_parallel(paths, max_workers=2, pages_per_task=3)) == serial
+
+
+def test_parallel_extraction_skips_unreadable_files(course_dir, tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    good = os.path.join(course_dir, "physics.pdf")
+
+    pages = list(iter_texts_parallel([str(broken), good], max_workers=2))
+
+    assert [metadata["file_name"] for _, metadata in pages] == ["physics.pdf", "physics.pdf"]
+
+
+def test_stuck_task_is_abandoned_and_its_worker_replaced(course_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_extraction, "_extract_page_range", _stuck_extract)
+    monkeypatch.setattr(pdf_extraction, "RAG_EXTRACT_TASK_GRACE", 3.0)
+    stuck = write_pdf(str(tmp_path / "stuck.pdf"), ["This page never finishes."])
+    paths = [stuck] + sorted(os.path.join(course_dir, name) for name in os.listdir(course_dir))
+
+    started = time.time()
+    pages = list(iter_texts_parallel(paths, max_workers=1, page_timeout=0.1))
+
+    # With one worker, the other files only finish if the stuck worker was replaced
+    assert [metadata["file_name"] for _, metadata in pages] == [
+        "calculus.pdf", "calculus.pdf", "cooking.pdf", "cooking.pdf", "physics.pdf", "physics.pdf"
+    ]
+    assert time.time() - started < 60
@@ -0,0 +1,45 @@
+import json
+
+from aiFeatures.python import rag_benchmark
+from aiFeatures.python.rag_benchmark import SyntheticCorpus, benchmark_size, compare_reports
+
+from conftest import TEST_MODEL
+
+
+def test_synthetic_corpus_is_deterministic():
+    corpus = SyntheticCorpus(40, vocab_size=500, num_topics=5)
+    pages = list(corpus.pages())
+
+    assert len(pages) == corpus.num_pages == 10
+    assert pages == list(SyntheticCorpus(40, vocab_size=500, num_topics=5).pages())
+    assert len(set(corpus.queries(8))) == 8
+
+
+def test_benchmark_reports_exact_recall_for_a_flat_index():
+    result = benchmark_size(80, TEST_MODEL, k=5, num_queries=10)
+
+    assert result["chunks"] > 0
+    assert result["index"] == "IndexFlatL2"
+    assert set(result["latency_ms"]) == {"vector", "hybrid"}
+    assert result["recall_at_k"] == 1.0
+
+
+def test_compare_reports_marks_regressions():
+    baseline = {"results": [{"target_chunks": 100, "recall_at_k": 1.0, "latency_ms": {"vector": {"p50": 2.0}}}]}
+    current = {"results": [{"target_chunks": 100, "recall_at_k": 0.9, "latency_ms": {"vector": {"p50": 1.0}}}]}
+    rows = {row["metric"]: row for row in compare_reports(baseline, current)}
+
+    assert rows["recall_at_k"]["improved"] is False
+    assert rows["latency_ms.vector.p50"]["improved"] is True
+    assert rows["latency_ms.vector.p50"]["change"] == -0.5
+
+
+def test_main_writes_a_report(tmp_path):
+    output = tmp_path / "bench.json"
+    assert rag_benchmark.main(["--sizes", "40", "--queries", "5", "--modes", "vector", "--pdf-pages", "2",
+                               "--model", TEST_MODEL, "--output", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    assert report["format_version"] == rag_benchmark.BENCHMARK_FORMAT_VERSION
+    assert [result["target_chunks"] for result in report["results"]] == [40]
+    assert report["pdf_ingest"]["pages"] == 2
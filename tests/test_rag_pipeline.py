@@ -0,0 +1,425 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from aiFeatures.python import rag_pipeline
+from aiFeatures.python.rag_pipeline import (
+    add_pdfs_to_store, compute_corpus_key, embed_in_batches, index_pdfs, remove_file_from_store, retrieve_hits
+)
+
+from conftest import COURSE_PAGES, TEST_MODEL, write_pdf
+
+
+def _pdf_paths(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder))
+
+
+def test_corpus_key_depends_on_contents_not_names(course_dir, tmp_path):
+    paths = _pdf_paths(course_dir)
+    renamed = tmp_path / "renamed"
+    renamed.mkdir()
+    for i, path in enumerate(paths):
+        shutil.copy(path, renamed / f"copy{i}.pdf")
+    key = compute_corpus_key(paths, 1000, 200, TEST_MODEL)
+
+    assert compute_corpus_key(_pdf_paths(str(renamed))[::-1], 1000, 200, TEST_MODEL) == key
+    assert compute_corpus_key(paths, 500, 200, TEST_MODEL) != key
+    assert compute_corpus_key(paths[:-1], 1000, 200, TEST_MODEL) != key
+
+
+def test_index_pdfs_reuses_saved_store(course_dir, index_root, monkeypatch):
+    store = index_pdfs(course_dir, model=TEST_MODEL, index_root=index_root)
+    assert store is not None
+    assert len(os.listdir(index_root)) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("saved corpus was re-embedded")
+
+    monkeypatch.setattr(rag_pipeline, "stream_index_pdfs", fail)
+    reloaded = index_pdfs(course_dir, model=TEST_MODEL, index_root=index_root)
+
+    assert reloaded.index.ntotal == store.index.ntotal
+    expected = retrieve_hits("derivative of a function", store, k=2)
+    assert retrieve_hits("derivative of a function", reloaded, k=2) == expected
+
+
+def test_index_pdfs_rebuilds_changed_corpus(course_dir, index_root):
+    index_pdfs(course_dir, model=TEST_MODEL, index_root=index_root)
+    write_pdf(os.path.join(course_dir, "chemistry.pdf"), ["An atom bonds with another atom."])
+    store = index_pdfs(course_dir, model=TEST_MODEL, index_root=index_root)
+
+    assert len(os.listdir(index_root)) == 2
+    assert retrieve_hits("atom bonds", store, k=1)[0]["file_name"] == "chemistry.pdf"
+
+
+def _file_names(store):
+    return {store.docstore.search(doc_id).metadata["file_name"]
+            for doc_id in store.index_to_docstore_id.values()}
+
+
+def _documents(store):
+    return [store.docstore.search(doc_id) for doc_id in store.index_to_docstore_id.values()]
+
+
+def test_add_and_remove_pdfs_on_live_store(course_dir, tmp_path):
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    chunks = store.index.ntotal
+    extra = write_pdf(str(tmp_path / "chemistry.pdf"), ["An atom bonds with another atom."])
+
+    add_pdfs_to_store(store, [extra], model=TEST_MODEL)
+    assert store.index.ntotal == chunks + 1
+    assert retrieve_hits("atom bonds", store, k=1)[0]["file_name"] == "chemistry.pdf"
+
+    # Re-adding a file replaces its old chunks instead of duplicating them
+    write_pdf(extra, ["Covalent bonds share electrons between atoms."])
+    add_pdfs_to_store(store, [extra], model=TEST_MODEL)
+    assert store.index.ntotal == chunks + 1
+    assert "Covalent" in retrieve_hits("covalent electrons", store, k=1)[0]["content"]
+
+    assert remove_file_from_store(store, "chemistry.pdf") == 1
+    assert remove_file_from_store(store, "chemistry.pdf") == 0
+    assert store.index.ntotal == chunks
+    assert _file_names(store) == {"physics.pdf", "calculus.pdf", "cooking.pdf"}
+
+
+class FlakyEmbeddings:
+    """Embeds each text as [len(text)], failing the first attempt at every batch listed in fail_batches."""
+
+    def __init__(self, fail_batches=()):
+        self.fail_batches = set(fail_batches)
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        if texts[0] in self.fail_batches:
+            self.fail_batches.discard(texts[0])
+            raise ConnectionError("backend unavailable")
+        return [[float(len(text))] for text in texts]
+
+
+def test_embed_in_batches_keeps_order_and_retries_failed_batches(monkeypatch):
+    monkeypatch.setattr(rag_pipeline.time, "sleep", lambda seconds: None)
+    texts = ["x" * n for n in range(1, 11)]
+    embeddings = FlakyEmbeddings(fail_batches={"xxxxx"})
+
+    vectors = embed_in_batches(texts, embeddings, batch_size=4, max_workers=3, max_retries=2)
+
+    assert vectors == [[float(n)] for n in range(1, 11)]
+    assert sorted(len(batch) for batch in embeddings.batches) == [2, 4, 4, 4]
+
+
+def test_embed_in_batches_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(rag_pipeline.time, "sleep", lambda seconds: None)
+
+    class DownEmbeddings:
+        calls = 0
+
+        def embed_documents(self, texts):
+            DownEmbeddings.calls += 1
+            raise ConnectionError("backend unavailable")
+
+    with pytest.raises(ConnectionError):
+        embed_in_batches(["a", "b"], DownEmbeddings(), batch_size=2, max_retries=2)
+    assert DownEmbeddings.calls == 3
+
+
+def test_compressed_store_reranks_to_exact_results(course_dir, index_root):
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    query = "mass times acceleration"
+    exact = [hit["content"] for hit in retrieve_hits(query, store, k=3, mode="vector")]
+
+    rag_pipeline._finalize_index(store, index_type="flat", compression="sq8")
+    assert store.rerank_vectors is not None
+    assert [hit["content"] for hit in retrieve_hits(query, store, k=3, mode="vector")] == exact
+
+    saved = os.path.join(index_root, "compressed")
+    assert rag_pipeline.save_vector_store(store, saved)
+    loaded = rag_pipeline.load_vector_store(saved, TEST_MODEL)
+    assert [hit["content"] for hit in retrieve_hits(query, loaded, k=3, mode="vector")] == exact
+    assert rag_pipeline.compression_report(loaded)["reranked_recall_at_k"] == 1.0
+
+
+def test_loaded_compressed_store_can_be_saved_over_its_directory(course_dir, index_root):
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    rag_pipeline._finalize_index(store, index_type="flat", compression="sq8")
+    saved = os.path.join(index_root, "compressed")
+    assert rag_pipeline.save_vector_store(store, saved)
+
+    loaded = rag_pipeline.load_vector_store(saved, TEST_MODEL)
+    rag_pipeline.remove_file_from_store(loaded, "cooking.pdf")
+    query = "mass times acceleration"
+    expected = [hit["content"] for hit in retrieve_hits(query, loaded, k=3, mode="vector")]
+    assert rag_pipeline.save_vector_store(loaded, saved)
+
+    assert [hit["content"] for hit in retrieve_hits(query, loaded, k=3, mode="vector")] == expected
+    reloaded = rag_pipeline.load_vector_store(saved, TEST_MODEL)
+    assert [hit["content"] for hit in retrieve_hits(query, reloaded, k=3, mode="vector")] == expected
+
+
+def test_hybrid_and_lexical_retrieval(course_dir):
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    assert store.bm25_index is not None
+
+    hybrid = retrieve_hits("golden crust", store, k=2)
+    assert hybrid[0]["file_name"] == "cooking.pdf"
+    assert hybrid[0]["score_type"] == "relevance"
+
+    lexical = retrieve_hits("golden crust", store, k=5, mode="lexical")
+    # BM25 alone only returns chunks sharing a query term
+    assert [hit["file_name"] for hit in lexical] == ["cooking.pdf"]
+    assert retrieve_hits("golden crust", store, k=2, mode="vector")[0]["score_type"] == "similarity"
+
+
+def test_repeated_queries_reuse_their_embedding(course_dir, monkeypatch):
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    embedded = []
+    original = store.embedding_function.embed_documents
+    monkeypatch.setattr(store.embedding_function, "embed_documents",
+                        lambda texts: embedded.extend(texts) or original(texts))
+
+    first = retrieve_hits("kinetic energy of a moving mass", store, k=2)
+    again = retrieve_hits("kinetic  energy of a moving mass ", store, k=2)
+
+    assert first == again
+    assert embedded == ["kinetic energy of a moving mass"]
+
+
+def test_prefetch_is_bounded_and_forwards_errors():
+    produced = []
+
+    def numbers():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    stage = rag_pipeline._prefetch(numbers(), maxsize=4)
+    assert next(stage) == 0
+    time.sleep(0.3)
+    # One item handed over, up to four queued and one waiting to be put
+    assert len(produced) <= 6
+    assert list(stage) == list(range(1, 100))
+
+    def failing():
+        yield 1
+        raise ValueError("bad page")
+
+    with pytest.raises(ValueError, match="bad page"):
+        list(rag_pipeline._prefetch(failing(), maxsize=2))
+
+
+def test_stream_index_pages_reports_each_batch():
+    pages = [(f"Lecture {i} covers topic number {i} in detail.", {"file_name": f"notes{i % 3}.pdf",
+                                                                  "page_index": i // 3, "total_pages": 50})
+             for i in range(150)]
+    progress = []
+
+    store = rag_pipeline.stream_index_pages(iter(pages), model=TEST_MODEL, num_files=3,
+                                            on_batch=lambda vector_store, report: progress.append(report["chunks"]))
+
+    assert store.index.ntotal == 150
+    batch_size = rag_pipeline.RAG_EMBED_BATCH_SIZE
+    assert progress == [min(end, 150) for end in range(batch_size, 150 + batch_size, batch_size)]
+    assert retrieve_hits("topic number 42", store, k=1, mode="vector")[0]["content"].startswith("Lecture 42 ")
+
+
+def test_duplicate_pages_are_indexed_once(course_dir):
+    shutil.copy(os.path.join(course_dir, "physics.pdf"), os.path.join(course_dir, "physics-copy.pdf"))
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+
+    assert store.index.ntotal == 6
+    hit = retrieve_hits("momentum conserved in collisions", store, k=1)[0]
+    assert (hit["file_name"], hit["page"]) == ("physics-copy.pdf", 2)
+    assert hit["also_in"] == [{"file_name": "physics.pdf", "page": 2}]
+
+    # Removing the kept copy hands its chunks over to the other file
+    remove_file_from_store(store, "physics-copy.pdf")
+    assert store.index.ntotal == 6
+    hit = retrieve_hits("momentum conserved in collisions", store, k=1)[0]
+    assert (hit["file_name"], hit["also_in"]) == ("physics.pdf", [])
+
+
+@pytest.mark.parametrize("exact_max", [4096, 0])
+@pytest.mark.parametrize("mode", ["hybrid", "vector", "lexical"])
+def test_filters_apply_inside_the_search(course_dir, monkeypatch, exact_max, mode):
+    # 0 sends every filtered search through the index with an id selector
+    monkeypatch.setattr(rag_pipeline, "RAG_FILTER_EXACT_MAX", exact_max)
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+
+    hits = retrieve_hits("bread dough mass force", store, k=5, mode=mode,
+                         filters={"file_name": ["physics.pdf", "calculus.pdf"], "pages": [2, 2]})
+
+    assert hits
+    assert {(hit["file_name"], hit["page"]) for hit in hits} <= {("physics.pdf", 2), ("calculus.pdf", 2)}
+    assert retrieve_hits("bread", store, k=5, mode=mode, filters={"file_name": "missing.pdf"}) == []
+
+
+def test_retrieve_batch_matches_single_queries(course_dir):
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    queries = ["rate of change", "golden crust", "momentum conserved", "rate of change"]
+
+    for mode in ("hybrid", "vector", "lexical"):
+        batch = rag_pipeline.retrieve_batch(queries, store, k=3, mode=mode)
+        assert batch == [retrieve_hits(query, store, k=3, mode=mode) for query in queries]
+
+    with pytest.raises(ValueError):
+        rag_pipeline.retrieve_batch(["q"] * (rag_pipeline.RAG_BATCH_MAX_QUERIES + 1), store)
+
+
+def test_hits_point_at_their_text_in_the_page(course_dir):
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False, chunk_size=60, chunk_overlap=10)
+    pages = {(metadata["file_name"], metadata["page_index"] + 1): text
+             for name in os.listdir(course_dir)
+             for text, metadata in rag_pipeline.extract_text_from_pdf(os.path.join(course_dir, name))}
+
+    hits = retrieve_hits("integral of the derivative", store, k=6)
+
+    assert len(hits) == 6
+    for hit in hits:
+        assert set(hit) >= {"content", "score", "score_type", "file_name", "page", "total_pages",
+                            "start", "end", "also_in"}
+        assert pages[(hit["file_name"], hit["page"])][hit["start"]:hit["end"]] == hit["content"]
+    assert f"File: {hits[0]['file_name']}, Page: {hits[0]['page']}/2\n" in rag_pipeline.format_hits(hits[:1])
+
+
+def test_mapped_store_can_be_edited_after_loading(course_dir, index_root, tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "RAG_MMAP_INDEX", True)
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    saved = os.path.join(index_root, "mapped")
+    assert rag_pipeline.save_vector_store(store, saved)
+
+    loaded = rag_pipeline.load_vector_store(saved, TEST_MODEL)
+    assert loaded.index_mapped
+    assert retrieve_hits("golden crust", loaded, k=2) == retrieve_hits("golden crust", store, k=2)
+
+    extra = write_pdf(str(tmp_path / "chemistry.pdf"), ["An atom bonds with another atom."])
+    add_pdfs_to_store(loaded, [extra], model=TEST_MODEL)
+    assert not loaded.index_mapped
+    assert retrieve_hits("atom bonds", loaded, k=1)[0]["file_name"] == "chemistry.pdf"
+    assert remove_file_from_store(loaded, "cooking.pdf") == 2
+    assert _file_names(loaded) == {"physics.pdf", "calculus.pdf", "chemistry.pdf"}
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_interrupted_index_resumes_from_its_checkpoint(course_dir, index_root, monkeypatch):
+    monkeypatch.setattr(rag_pipeline.IngestCheckpoint, "due", property(lambda self: True))
+    # Two chunks per batch: one batch per course file
+    original = rag_pipeline._iter_chunk_batches
+    monkeypatch.setattr(rag_pipeline, "_iter_chunk_batches",
+                        lambda *args, **kwargs: original(*args, batch_size=2, **kwargs))
+
+    def interrupt_at_third_batch(store, progress):
+        if progress["chunks"] > 4:
+            raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        index_pdfs(course_dir, model=TEST_MODEL, index_root=index_root, on_batch=interrupt_at_third_batch)
+    checkpoints = [name for name in os.listdir(index_root) if name.endswith(rag_pipeline.CHECKPOINT_SUFFIX)]
+    assert len(checkpoints) == 1
+
+    # The snapshot after the second batch holds calculus.pdf in full and cooking.pdf as the partial file
+    embedded = []
+    store = index_pdfs(course_dir, model=TEST_MODEL, index_root=index_root,
+                       on_batch=lambda store, progress: embedded.append(progress["chunks"]))
+    assert embedded[-1] == 4
+    assert _file_names(store) == {"physics.pdf", "calculus.pdf", "cooking.pdf"}
+    fresh = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    assert sorted(doc.page_content for doc in _documents(store)) == sorted(doc.page_content for doc in _documents(fresh))
+    assert not os.path.exists(os.path.join(index_root, checkpoints[0]))
+
+
+def test_checkpoint_snapshot_leaves_out_the_partial_file(course_dir, tmp_path):
+    pdfs = sorted(os.path.join(course_dir, name) for name in os.listdir(course_dir))
+    store = index_pdfs(pdfs[:2], model=TEST_MODEL, use_cache=False)
+    checkpoint = rag_pipeline.IngestCheckpoint(str(tmp_path / "checkpoint"), pdfs, {"model": TEST_MODEL}, interval=0)
+    assert not checkpoint.due
+    checkpoint.track([{"file_name": "cooking.pdf", "file_path": pdfs[1]}])
+    assert checkpoint.save(store)
+
+    resumed_checkpoint = rag_pipeline.IngestCheckpoint(str(tmp_path / "checkpoint"), pdfs, interval=0)
+    resumed = resumed_checkpoint.resume(TEST_MODEL)
+    assert resumed_checkpoint.resumed
+    assert _file_names(resumed) == {"calculus.pdf"}
+    assert [os.path.basename(pdf) for pdf in resumed_checkpoint.remaining_files()] == ["cooking.pdf", "physics.pdf"]
+    resumed_checkpoint.discard()
+    assert rag_pipeline.IngestCheckpoint(str(tmp_path / "checkpoint"), pdfs).resume(TEST_MODEL) is None
+
+
+def test_checkpoint_tells_same_named_files_apart(tmp_path):
+    pdfs = []
+    for folder, text in [("week1", "Vectors add tip to tail."), ("week2", "Matrices multiply row by column."),
+                         ("week3", "Eigenvalues scale their eigenvectors.")]:
+        os.makedirs(tmp_path / "corpus" / folder)
+        pdfs.append(write_pdf(str(tmp_path / "corpus" / folder / "notes.pdf"), [text]))
+    store = index_pdfs(pdfs[:2], model=TEST_MODEL, use_cache=False)
+    checkpoint = rag_pipeline.IngestCheckpoint(str(tmp_path / "checkpoint"), pdfs, {"model": TEST_MODEL}, interval=0)
+    checkpoint.track([{"file_name": "notes.pdf", "file_path": pdfs[1]}])
+    assert checkpoint.save(store)
+
+    # The corpus is submitted again from another directory, as a new upload would be
+    moved = tmp_path / "upload"
+    os.rename(tmp_path / "corpus", moved)
+    moved_pdfs = [str(moved / folder / "notes.pdf") for folder in ("week1", "week2", "week3")]
+    resumed_checkpoint = rag_pipeline.IngestCheckpoint(str(tmp_path / "checkpoint"), moved_pdfs, interval=0)
+    resumed = resumed_checkpoint.resume(TEST_MODEL)
+
+    assert [doc.page_content for doc in _documents(resumed)] == ["Vectors add tip to tail."]
+    assert resumed_checkpoint.remaining_files() == moved_pdfs[1:]
+
+
+@pytest.fixture
+def course_stores(tmp_path):
+    """One store per course, the unrelated cooking course named first."""
+    stores = {}
+    for file_name in ("cooking.pdf", "physics.pdf"):
+        path = write_pdf(str(tmp_path / file_name), COURSE_PAGES[file_name])
+        stores[file_name[:-4]] = index_pdfs([path], model=TEST_MODEL, use_cache=False)
+    return stores
+
+
+@pytest.mark.parametrize("mode, score_type", [
+    ("hybrid", "relevance"), ("vector", "similarity"), ("lexical", "relevance")
+])
+def test_federated_search_ranks_the_relevant_index_first(course_stores, mode, score_type):
+    hits = rag_pipeline.retrieve_federated("explain the law of force and mass with the dough",
+                                           dict(course_stores, empty=None), k=4, mode=mode)
+
+    assert hits[0]["index"] == "physics"
+    assert "Newton" in hits[0]["content"]
+    assert all(hit["score_type"] == score_type for hit in hits)
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+    # The best hit of each index
+    best = {hit["index"]: hit for hit in reversed(hits)}
+    assert best["physics"]["score"] > best["cooking"]["score"]
+    assert best["cooking"]["file_name"] == "cooking.pdf"
+
+
+def test_federated_lexical_scores_do_not_favour_the_corpus_where_a_term_is_rare(tmp_path):
+    # A survey where "entropy" is mentioned once, and a course where every chunk is about it
+    survey_pages = [f"Chapter {i} surveys topic number {i} of general science in broad terms." for i in range(11)]
+    survey_pages.append("Chapter 11 lists open problems in broad terms, entropy among many others.")
+    thermo_pages = ["Entropy measures disorder; entropy never decreases; entropy drives heat flow; entropy rules.",
+                    "The second law says entropy of an isolated system grows.",
+                    "Heat engines lose work as entropy is produced."]
+    stores = {}
+    for name, pages in (("survey", survey_pages), ("thermo", thermo_pages)):
+        stores[name] = index_pdfs([write_pdf(str(tmp_path / f"{name}.pdf"), pages)], model=TEST_MODEL, use_cache=False)
+    # Raw BM25 would put the passing mention first, through its corpus's higher IDF
+    raw_best = {name: store.bm25_index.search("entropy", k=1)[0][1] for name, store in stores.items()}
+    assert raw_best["survey"] > raw_best["thermo"]
+
+    hits = rag_pipeline.retrieve_federated("entropy", stores, k=3, mode="lexical")
+
+    assert [hit["index"] for hit in hits] == ["thermo", "thermo", "thermo"]
+    assert hits[0]["content"].startswith("Entropy measures disorder")
+
+
+def test_federated_search_limits_its_indexes(course_stores, monkeypatch):
+    assert rag_pipeline.retrieve_federated("force", {"none": None}) == []
+    monkeypatch.setattr(rag_pipeline, "RAG_FEDERATED_MAX_INDEXES", 1)
+    with pytest.raises(ValueError):
+        rag_pipeline.retrieve_federated("force", course_stores)
@@ -0,0 +1,55 @@
+import pytest
+from langchain_core.documents import Document
+
+from aiFeatures.python.dedup import DUPLICATE_REFS_KEY
+from aiFeatures.python.docstore import MmapDocstore
+from aiFeatures.python.search_filter import SearchFilter
+
+CHUNKS = [
+    {"file_name": "ch1.pdf", "page_index": 0, "course": "physics"},
+    {"file_name": "ch1.pdf", "page_index": 9, "course": "physics"},
+    {"file_name": "ch2.pdf", "page_index": 4, "course": "calculus"},
+    {"file_name": "ch3.pdf", "page_index": 0, DUPLICATE_REFS_KEY: [{"file_name": "ch1.pdf", "page_index": 4}]},
+    # Chunk running from the 7th to the 9th page
+    {"file_name": "ch2.pdf", "page_index": 6, "end_page_index": 8},
+]
+
+
+@pytest.mark.parametrize("spec, message", [
+    ("ch1.pdf", "must be an object"),
+    ({"file": "ch1.pdf"}, "Unknown filter keys"),
+    ({"pages": [5, 2]}, "pages must be"),
+    ({"pages": "1-3"}, "pages must be"),
+    ({"metadata": ["course"]}, "metadata filter"),
+])
+def test_from_dict_rejects_malformed_specs(spec, message):
+    with pytest.raises(ValueError, match=message):
+        SearchFilter.from_dict(spec)
+
+
+def test_from_dict_uses_one_based_inclusive_pages():
+    assert SearchFilter.from_dict(None) is None
+    assert SearchFilter.from_dict({"pages": [2, 6]}).page_range == (1, 5)
+    assert SearchFilter.from_dict({"pages": 3}).page_range == (2, 2)
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ({"file_name": "ch1.pdf"}, [True, True, False, True, False]),
+    ({"file_name": ["ch2.pdf", "ch3.pdf"]}, [False, False, True, True, True]),
+    ({"pages": [1, 5]}, [True, False, True, True, False]),
+    ({"pages": [8, 8]}, [False, False, False, False, True]),
+    ({"pages": [9, 12]}, [False, True, False, False, True]),
+    ({"pages": [10, 12]}, [False, True, False, False, False]),
+    ({"file_name": "ch1.pdf", "pages": [1, 5]}, [True, False, False, True, False]),
+    ({"file_name": "ch1.pdf", "pages": [10, 10]}, [False, True, False, False, False]),
+    ({"metadata": {"course": "physics"}}, [True, True, False, False, False]),
+    ({"metadata": {"course": ["calculus", "chemistry"]}, "pages": [5, 5]}, [False, False, True, False, False]),
+])
+def test_docstore_mask_matches_per_chunk_evaluation(spec, expected, tmp_path):
+    search_filter = SearchFilter.from_dict(spec)
+    docstore = MmapDocstore(str(tmp_path), compression="none")
+    docstore.add({str(i): Document(page_content=f"chunk {i}", metadata=metadata)
+                  for i, metadata in enumerate(CHUNKS)})
+
+    assert [search_filter.matches(metadata) for metadata in CHUNKS] == expected
+    assert search_filter.docstore_mask(docstore).tolist() == expected
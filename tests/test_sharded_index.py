@@ -0,0 +1,95 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from aiFeatures.python import rag_pipeline
+from aiFeatures.python.rag_pipeline import index_pdfs, retrieve_hits
+from aiFeatures.python.sharded_index import ShardedIndex
+
+from conftest import TEST_MODEL
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((200, 16)).astype(np.float32), rng.standard_normal((5, 16)).astype(np.float32)
+
+
+@pytest.fixture
+def sharded():
+    index = ShardedIndex(16, 2)
+    yield index
+    index.close()
+
+
+def test_sharded_search_matches_flat_index(sharded, vectors, tmp_path):
+    data, queries = vectors
+    flat = faiss.IndexFlatL2(16)
+    flat.add(data)
+    # Two adds, so rows of the second batch continue the round robin
+    sharded.add(data[:101])
+    sharded.add(data[101:])
+    assert sharded.ntotal == 200
+    assert np.bincount(sharded.row_shard).tolist() == [100, 100]
+
+    distances, rows = sharded.search(queries, 5)
+    expected_distances, expected_rows = flat.search(queries, 5)
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+    mask = np.zeros(200, dtype=bool)
+    mask[::7] = True
+    _, rows = sharded.search(queries, 3, row_mask=mask)
+    assert np.all(mask[rows])
+
+    sharded.remove_rows(range(0, 200, 2))
+    survivors = data[1::2]
+    flat = faiss.IndexFlatL2(16)
+    flat.add(survivors)
+    np.testing.assert_array_equal(sharded.search(queries, 5)[1], flat.search(queries, 5)[1])
+
+    sharded.save(str(tmp_path))
+    loaded = ShardedIndex.load(str(tmp_path))
+    try:
+        assert loaded.ntotal == 100
+        np.testing.assert_array_equal(loaded.search(queries, 5)[1], flat.search(queries, 5)[1])
+    finally:
+        loaded.close()
+
+
+def test_dead_worker_shuts_the_pool_down(sharded, vectors):
+    data, queries = vectors
+    sharded.add(data)
+    sharded._processes[1].kill()
+    sharded._processes[1].join()
+
+    with pytest.raises(RuntimeError, match="shard 1 worker died"):
+        sharded.search(queries, 3)
+    assert not any(process.is_alive() for process in sharded._processes)
+    with pytest.raises(RuntimeError, match="closed"):
+        sharded.search(queries, 3)
+
+
+def test_sharded_store_matches_unsharded_store(course_dir, index_root, monkeypatch):
+    query = "force equals mass times acceleration"
+    expected = [hit["content"] for hit in retrieve_hits(query, index_pdfs(course_dir, model=TEST_MODEL, use_cache=False),
+                                                        k=3, mode="vector")]
+
+    monkeypatch.setattr(rag_pipeline, "RAG_SHARDS", 2)
+    store = index_pdfs(course_dir, model=TEST_MODEL, use_cache=False)
+    assert isinstance(store.index, ShardedIndex)
+    try:
+        assert [hit["content"] for hit in retrieve_hits(query, store, k=3, mode="vector")] == expected
+
+        saved = os.path.join(index_root, "sharded")
+        assert rag_pipeline.save_vector_store(store, saved)
+        loaded = rag_pipeline.load_vector_store(saved, TEST_MODEL)
+        try:
+            assert isinstance(loaded.index, ShardedIndex)
+            assert [hit["content"] for hit in retrieve_hits(query, loaded, k=3, mode="vector")] == expected
+        finally:
+            loaded.index.close()
+    finally:
+        store.index.close()
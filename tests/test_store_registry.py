@@ -0,0 +1,71 @@
+import os
+import threading
+
+import pytest
+
+from aiFeatures.python.rag_pipeline import index_pdfs, retrieve_hits
+from aiFeatures.python.store_registry import VectorStoreRegistry, estimate_store_bytes
+
+from conftest import TEST_MODEL
+
+
+@pytest.fixture
+def stores(course_dir):
+    return [index_pdfs(course_dir, model=TEST_MODEL, use_cache=False) for _ in range(2)]
+
+
+@pytest.fixture
+def registry(stores, tmp_path):
+    # Room for one of the two stores
+    return VectorStoreRegistry(memory_budget_bytes=estimate_store_bytes(stores[0]) * 3 // 2,
+                               spill_root=str(tmp_path / "workspaces"))
+
+
+def test_registry_spills_least_recently_used_store(registry, stores):
+    expected = retrieve_hits("bake the bread", stores[0], k=2)
+    registry.put("physics", stores[0])
+    registry.put("calculus", stores[1])
+
+    assert registry.stats()["resident"] == 1
+    assert registry.evictions == 1
+    assert os.path.isfile(os.path.join(registry._spill_dir("physics"), "manifest.json"))
+
+    reloaded = registry.get("physics")
+    assert reloaded is not stores[0]
+    assert retrieve_hits("bake the bread", reloaded, k=2) == expected
+    assert registry.reloads == 1
+    assert registry.evictions == 2
+    assert sorted(registry.workspaces()) == ["calculus", "physics"]
+
+
+def test_registry_does_not_evict_a_busy_workspace(registry, stores):
+    registry.put("physics", stores[0])
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        with registry.lock("physics"):
+            held.set()
+            release.wait()
+
+    worker = threading.Thread(target=hold_lock)
+    worker.start()
+    held.wait()
+    try:
+        registry.put("calculus", stores[1])
+        assert registry.evictions == 0
+        assert registry.stats()["resident"] == 2
+    finally:
+        release.set()
+        worker.join()
+
+
+def test_registry_remove_deletes_spilled_store(registry, stores):
+    registry.put("physics", stores[0])
+    registry.put("calculus", stores[1])
+    spill_dir = registry._spill_dir("physics")
+
+    assert registry.remove("physics")
+    assert not os.path.exists(spill_dir)
+    assert registry.get("physics") is None
+    assert not registry.remove("physics")
@@ -0,0 +1,76 @@
+import pytest
+
+from aiFeatures.python.rag_pipeline import PAGE_BREAK, OffsetTextSplitter, iter_page_chunks
+
+
+def _page(paragraphs=6, words=40, tag="p"):
+    return "\n\n".join(
+        " ".join(f"{tag}{i}w{j}" for j in range(words)) for i in range(paragraphs)
+    )
+
+
+def test_spans_slice_back_to_their_chunks():
+    text = _page()
+    splitter = OffsetTextSplitter(chunk_size=200, chunk_overlap=50)
+    spans = splitter.split_spans(text)
+
+    assert len(spans) > 1
+    assert [text[start:end] for start, end in spans] == splitter.split_text(text)
+    for start, end in spans:
+        assert end - start <= 200
+        assert text[start:end] == text[start:end].strip()
+    # Consecutive chunks overlap or touch, so no text is dropped between them
+    for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+        assert start <= previous_end + 2
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+
+
+def test_long_words_are_cut_at_chunk_size():
+    text = "x" * 250
+    assert OffsetTextSplitter(chunk_size=100, chunk_overlap=0).split_spans(text) == [
+        (0, 100), (100, 200), (200, 250)
+    ]
+
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        OffsetTextSplitter(chunk_size=100, chunk_overlap=100)
+
+
+def test_page_chunks_record_their_offset_in_the_page():
+    pages = [(_page(tag=f"a{n}"), {"file_name": "a.pdf", "page_index": n}) for n in range(2)]
+    chunks = list(iter_page_chunks(pages, chunk_size=200, chunk_overlap=50, across_pages=False))
+
+    for chunk, metadata in chunks:
+        text = pages[metadata["page_index"]][0]
+        assert text[metadata["start_index"]:metadata["start_index"] + len(chunk)] == chunk
+        assert "end_page_index" not in metadata
+
+
+def test_langchain_splitter_offsets_match_its_chunks():
+    pages = [(_page(), {"file_name": "a.pdf", "page_index": 0})]
+    chunks = list(iter_page_chunks(pages, chunk_size=200, chunk_overlap=50, splitter="langchain"))
+
+    assert len(chunks) > 1
+    for chunk, metadata in chunks:
+        assert pages[0][0][metadata["start_index"]:metadata["start_index"] + len(chunk)] == chunk
+
+
+def test_chunks_can_run_across_page_breaks():
+    pages = [
+        ("alpha " * 10, {"file_name": "a.pdf", "page_index": 0}),
+        ("beta " * 10, {"file_name": "a.pdf", "page_index": 1}),
+        ("gamma " * 5, {"file_name": "b.pdf", "page_index": 0}),
+    ]
+    chunks = list(iter_page_chunks(pages, chunk_size=200, chunk_overlap=20, across_pages=True))
+
+    spanning = [(chunk, metadata) for chunk, metadata in chunks if "end_page_index" in metadata]
+    assert spanning
+    chunk, metadata = spanning[0]
+    assert metadata["file_name"] == "a.pdf"
+    assert metadata["page_index"] == 0 and metadata["end_page_index"] == 1
+    assert PAGE_BREAK in chunk
+    assert chunk == (pages[0][0] + PAGE_BREAK + pages[1][0])[metadata["start_index"]:].strip()
+    # Chunks never join pages of different files
+    assert all("gamma" not in chunk for chunk, metadata in chunks if metadata["file_name"] == "a.pdf")
+    assert [metadata["file_name"] for _, metadata in chunks][-1] == "b.pdf"
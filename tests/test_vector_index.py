@@ -0,0 +1,138 @@
+import faiss
+import numpy as np
+import pytest
+
+from aiFeatures.python import vector_index
+from aiFeatures.python.vector_index import build_faiss_index, choose_index_type, remove_rows
+
+
+def _corpus(n=2000, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_choose_index_type_switches_to_ivf_past_flat_limit(monkeypatch):
+    monkeypatch.setattr(vector_index, "RAG_FLAT_MAX_VECTORS", 1000)
+    assert choose_index_type(1000, "auto") == "flat"
+    assert choose_index_type(1001, "auto") == "ivf"
+    assert choose_index_type(10, "hnsw") == "hnsw"
+
+
+@pytest.mark.parametrize("index_type, expected", [
+    ("flat", faiss.IndexFlatL2),
+    ("ivf", faiss.IndexIVFFlat),
+    ("hnsw", faiss.IndexHNSWFlat),
+])
+def test_build_faiss_index_finds_exact_neighbours(index_type, expected):
+    vectors = _corpus()
+    index = build_faiss_index(vectors, index_type=index_type, compression="none")
+    index.add(vectors)
+
+    assert isinstance(faiss.downcast_index(index), expected)
+    _, labels = index.search(vectors[:50], 1)
+    assert np.mean(labels[:, 0] == np.arange(50)) >= 0.9
+
+
+def test_ivf_falls_back_to_flat_for_tiny_corpus():
+    assert isinstance(build_faiss_index(_corpus(n=10), index_type="ivf", compression="none"), faiss.IndexFlatL2)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_remove_rows_renumbers_survivors(index_type):
+    vectors = _corpus(n=500)
+    index = build_faiss_index(vectors, index_type=index_type, compression="none")
+    index.add(vectors)
+    removed = [0, 7, 250, 499]
+
+    remove_rows(index, removed)
+
+    kept = np.delete(vectors, removed, axis=0)
+    assert index.ntotal == len(kept)
+    params = vector_index.search_parameters(index, nprobe=index.nlist if index_type == "ivf" else None)
+    _, labels = index.search(kept[:100], 1, params=params)
+    assert np.mean(labels[:, 0] == np.arange(100)) >= 0.95
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_mapped_index_searches_like_a_read_one_and_copies_before_writes(index_type, tmp_path):
+    vectors = _corpus(n=500)
+    index = build_faiss_index(vectors, index_type=index_type, compression="none")
+    index.add(vectors)
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(index, path)
+
+    mapped = vector_index.read_index(path, mmap=True)
+    expected = vector_index.read_index(path, mmap=False).search(vectors[:20], 5)
+    np.testing.assert_array_equal(mapped.search(vectors[:20], 5)[1], expected[1])
+
+    writable = vector_index.writable_index(mapped)
+    writable.add(vectors[:1])
+    remove_rows(writable, [0])
+    assert writable.ntotal == 500
+    assert mapped.ntotal == 500
+
+
+@pytest.mark.parametrize("compression, codec", [("none", None), ("fp16", "SQfp16"), ("sq8", "SQ8")])
+def test_codec_spec_and_compressed_indexes(compression, codec):
+    vectors = _corpus(n=300, dim=64)
+    assert vector_index.codec_spec(compression, 64, len(vectors)) == codec
+
+    index = build_faiss_index(vectors, index_type="flat", compression=compression)
+    assert vector_index.is_compressed(index) == (codec is not None)
+
+
+def test_pq_needs_enough_training_vectors():
+    assert vector_index.codec_spec("pq", 64, 1000) == "PQ4"
+    assert vector_index.codec_spec("pq", 64, 100) == "SQ8"
+
+
+def test_rerank_vectors_round_trip(tmp_path):
+    vectors = _corpus(n=5, dim=4)
+    store = vector_index.RerankVectors.create(4, str(tmp_path / "work"))
+    store.add(["a", "b", "c"], vectors[:3])
+    store.add(["d", "e"], vectors[3:])
+    store.remove(["b", "d"])
+    np.testing.assert_array_equal(store.get(["e", "a"]), vectors[[4, 0]])
+
+    saved = tmp_path / "saved"
+    saved.mkdir()
+    store.save(str(saved))
+    loaded = vector_index.RerankVectors.load(str(saved), str(tmp_path / "work"))
+
+    assert len(loaded) == 3
+    np.testing.assert_array_equal(loaded.get(["a", "c", "e"]), vectors[[0, 2, 4]])
+    # Appending to a loaded store copies its file first, leaving the saved one untouched
+    loaded.add(["f"], vectors[:1])
+    assert (saved / vector_index.RerankVectors.FILE_NAME).stat().st_size == 3 * 4 * 4
+
+
+def test_loaded_rerank_vectors_survive_saving_over_their_directory(tmp_path):
+    vectors = _corpus(n=4, dim=4)
+    store = vector_index.RerankVectors.create(4, str(tmp_path / "work"))
+    store.add(["a", "b", "c", "d"], vectors)
+    saved = tmp_path / "saved"
+    saved.mkdir()
+    store.save(str(saved))
+
+    loaded = vector_index.RerankVectors.load(str(saved), str(tmp_path / "work"))
+    loaded.remove(["a", "b"])
+    loaded.save(str(saved))
+
+    # The saved file is compacted to two rows, the live instance keeps its own layout
+    assert (saved / vector_index.RerankVectors.FILE_NAME).stat().st_size == 2 * 4 * 4
+    np.testing.assert_array_equal(loaded.get(["d", "c"]), vectors[[3, 2]])
+    loaded.add(["e"], vectors[:1])
+    np.testing.assert_array_equal(loaded.get(["c", "d", "e"]), vectors[[2, 3, 0]])
+    reloaded = vector_index.RerankVectors.load(str(saved), str(tmp_path / "work"))
+    np.testing.assert_array_equal(reloaded.get(["c", "d"]), vectors[[2, 3]])
+
+
+def test_exact_rerank_recovers_recall_of_compressed_index():
+    vectors = _corpus(n=3000, dim=32)
+    index = build_faiss_index(vectors, index_type="flat", compression="sq8")
+    index.add(vectors)
+
+    report = vector_index.measure_recall(index, vectors, k=10, num_queries=100, rerank_factor=4)
+
+    assert report["memory_saved_ratio"] > 0.7
+    assert report["reranked_recall_at_k"] >= report["recall_at_k"]
+    assert report["reranked_recall_at_k"] >= 0.99
@@ -8,6 +8,28 @@ import {
 } from "@/lib/supabaseClient";
 import { api } from "@/lib/api";
 
+// Keys this browser's document store on the backend, so uploads and questions
+// from different users never share a workspace
+let fallbackWorkspaceId: string | null = null;
+function newWorkspaceId(): string {
+  // getRandomValues, unlike randomUUID, also works outside secure contexts
+  const bytes = crypto.getRandomValues(new Uint8Array(16));
+  return Array.from(bytes, (b) => b.toString(16).padStart(2, "0")).join("");
+}
+function getWorkspaceId(): string {
+  try {
+    let id = localStorage.getItem("ragWorkspaceId");
+    if (!id) {
+      id = newWorkspaceId();
+      localStorage.setItem("ragWorkspaceId", id);
+    }
+    return id;
+  } catch {
+    fallbackWorkspaceId ??= newWorkspaceId();
+    return fallbackWorkspaceId;
+  }
+}
+
 export default function Dashboard() {
   const supabase = supabaseBrowser();
   const [userEmail, setUserEmail] = useState<string | null>(null);
@@ -83,7 +105,7 @@ export default function Dashboard() {
 
   useEffect(() => {
     api
-      .get("status")
+      .get(`status?workspace_id=${getWorkspaceId()}`)
       .then(setStatus)
       .catch(() => setStatus(null));
   }, []);
@@ -206,7 +228,11 @@ export default function Dashboard() {
       }
 
       // Call backend for AI response
-      const requestData: any = { query: text };
+      const requestData: any = {
+        query: text,
+        workspace_id: getWorkspaceId(),
+        session_id: getWorkspaceId(),
+      };
 
       // Include web search results if available
       if (
@@ -1985,10 +2011,27 @@ export default function Dashboard() {
                           const data = new FormData();
                           for (const f of Array.from(input.files))
                             data.append("files", f);
+                          data.append("workspace_id", getWorkspaceId());
+                          data.append("session_id", getWorkspaceId());
                           setRagUploading(true);
                           try {
-                            await api.postForm("initialize-rag", data);
-                            const s = await api.get("status");
+                            const started = await api.postForm(
+                              "initialize-rag",
+                              data
+                            );
+                            // Indexing runs as a background job; wait for it to finish
+                            let job = started.job;
+                            while (
+                              job &&
+                              (job.status === "queued" ||
+                                job.status === "running")
+                            ) {
+                              await new Promise((r) => setTimeout(r, 1000));
+                              job = await api.get(`index-jobs/${job.job_id}`);
+                            }
+                            const s = await api.get(
+                              `status?workspace_id=${getWorkspaceId()}`
+                            );
                             setStatus(s);
                           } catch {
                           } finally {
@@ -2104,8 +2147,14 @@ export default function Dashboard() {
                               } catch {}
                               // Clear RAG session
                               try {
-                                await api.postJson("clear-session", {});
-                                const s = await api.get("status");
+                                await api.postJson("clear-session", {
+                                  reset_vector_store: true,
+                                  workspace_id: getWorkspaceId(),
+                                  session_id: getWorkspaceId(),
+                                });
+                                const s = await api.get(
+                                  `status?workspace_id=${getWorkspaceId()}`
+                                );
                                 setStatus(s);
                               } catch {}
                             }}